@@ -0,0 +1,64 @@
+"""
+Compare the memory held by 10k cached tournaments as raw feed dicts and as
+compact Tournament records.
+
+Run from the repository root:
+
+    python -m benchmarks.tournament_memory
+"""
+import json
+import tracemalloc
+
+from src.cache import estimate_size
+from src.lichess import Tournament
+
+COUNT = 10_000
+
+
+def sample_line(i: int) -> str:
+    """Return one arena feed line shaped like the Lichess team arena API."""
+    starts_at = 1_900_000_000_000 + i * 3_600_000
+    return json.dumps({
+        "id": f"arena{i:05d}",
+        "createdBy": "lichess",
+        "system": "arena",
+        "minutes": 57,
+        "clock": {"limit": 180, "increment": 2},
+        "rated": True,
+        "fullName": f"Team Battle Blitz Arena #{i}",
+        "nbPlayers": 0,
+        "variant": {"key": "standard", "short": "Std", "name": "Standard"},
+        "startsAt": starts_at,
+        "finishesAt": starts_at + 57 * 60_000,
+        "status": 10,
+        "perf": {"key": "blitz", "name": "Blitz", "position": 1, "icon": ")"},
+        "secondsToStart": 3600,
+        "teamBattle": {"teams": ["lichess-de", "lichess-swiss"], "nbLeaders": 5},
+    })
+
+
+def measure(build) -> int:
+    """Return the bytes still allocated by the list ``build`` returns."""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    items = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del items
+    return after - before
+
+
+def main() -> None:
+    lines = [sample_line(i) for i in range(COUNT)]
+    raw = measure(lambda: [json.loads(line) for line in lines])
+    compact = measure(lambda: [Tournament.from_json(json.loads(line)) for line in lines])
+    print(f"{COUNT} tournaments")
+    print(f"  raw dicts:      {raw / 1024:8.0f} KiB  ({raw / COUNT:6.0f} B each)")
+    print(f"  Tournament:     {compact / 1024:8.0f} KiB  ({compact / COUNT:6.0f} B each)")
+    print(f"  reduction:      {100 * (1 - compact / raw):8.1f} %")
+    sample = Tournament.from_json(json.loads(lines[0]))
+    print(f"  estimate_size:  {estimate_size(json.loads(lines[0]))} B dict, {estimate_size(sample)} B record")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+Adaptive batching of outbound API calls (Discord mutations and Lichess fetches).
+"""
+import asyncio
+import os
+import time
+import yaml
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Sequence
+
+from .lichess import lichess_client
+from .utils import logger
+
+# Load batching settings from config
+CONFIG_PATH = os.path.join(os.getcwd(), "config", "config.yaml")
+DEFAULT_BATCH_SIZE = 5  # Starting number of calls issued together
+DEFAULT_BATCH_DELAY = 1.0  # Starting pause between batches, in seconds
+DEFAULT_MAX_BATCH_SIZE = 25  # Upper bound for the additive increase
+DEFAULT_MAX_BATCH_DELAY = 30.0  # Upper bound for the pause after repeated congestion
+DEFAULT_LATENCY_TARGET = 2.0  # Seconds per call above which a batch counts as congested
+THROUGHPUT_HISTORY = 20  # Per-batch throughput samples kept for stats
+
+try:
+    with open(CONFIG_PATH) as f:
+        config = yaml.safe_load(f) or {}
+    PERF_CONF = config.get("performance", {}) or {}
+except Exception:
+    PERF_CONF = {}
+BATCH_SIZE = PERF_CONF.get("batch_size", DEFAULT_BATCH_SIZE)
+BATCH_DELAY = PERF_CONF.get("batch_delay", DEFAULT_BATCH_DELAY)
+MAX_BATCH_SIZE = PERF_CONF.get("batch_max_size", DEFAULT_MAX_BATCH_SIZE)
+MAX_BATCH_DELAY = PERF_CONF.get("batch_max_delay", DEFAULT_MAX_BATCH_DELAY)
+LATENCY_TARGET = PERF_CONF.get("batch_latency_target", DEFAULT_LATENCY_TARGET)
+
+
+def is_rate_limited(error: BaseException) -> bool:
+    """Return True for an error that reports HTTP 429 (discord.py or Lichess)."""
+    return getattr(error, "status", None) == 429
+
+
+class AdaptiveBatcher:
+    """Runs calls in batches whose size and spacing follow AIMD.
+
+    The calls of one batch run concurrently. A batch that finishes without a
+    429 and under the latency target grows the next one by a single call and
+    shortens the pause by a step (additive increase); a 429 or a slow batch
+    halves the batch size and doubles the pause (multiplicative decrease).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        batch_size: int = BATCH_SIZE,
+        batch_delay: float = BATCH_DELAY,
+        max_batch_size: int = MAX_BATCH_SIZE,
+        max_delay: float = MAX_BATCH_DELAY,
+        latency_target: float = LATENCY_TARGET,
+        rate_limit_counter: Optional[Callable[[], int]] = None,
+    ):
+        """Initialize the batcher.
+
+        Args:
+            name: Label used in logs and stats.
+            batch_size: Starting number of calls per batch.
+            batch_delay: Starting pause between batches, in seconds. It is also
+                the smallest pause after congestion; a quarter of it is the
+                step by which the pause shrinks again.
+            max_batch_size: Largest batch the additive increase may reach.
+            max_delay: Largest pause the multiplicative decrease may reach, in seconds.
+            latency_target: Average seconds per call above which a batch is congested.
+            rate_limit_counter: Optional callable returning a running count of
+                429s seen by the underlying client; an increase during a batch
+                counts as a 429 even when the client retried it.
+        """
+        self.name = name
+        self.max_batch_size = max(1, max_batch_size)
+        self.batch_size = min(max(1, batch_size), self.max_batch_size)
+        self.base_delay = max(0.0, batch_delay)
+        self.delay = self.base_delay
+        self.delay_step = self.base_delay / 4
+        self.max_delay = max(self.base_delay, max_delay)
+        self.latency_target = latency_target
+        self.rate_limit_counter = rate_limit_counter
+        self.throughput: Deque[float] = deque(maxlen=THROUGHPUT_HISTORY)
+        self.stats: Dict[str, Any] = {
+            "batches": 0,
+            "calls": 0,
+            "rate_limited": 0,
+            "slow_batches": 0,
+            "increases": 0,
+            "decreases": 0,
+        }
+
+    def _rate_limit_count(self) -> int:
+        if self.rate_limit_counter is None:
+            return 0
+        try:
+            return self.rate_limit_counter()
+        except Exception:
+            return 0
+
+    def _adjust(self, calls: int, elapsed: float, rate_limited: bool) -> None:
+        """Update batch size and pause from one batch's outcome."""
+        self.stats["batches"] += 1
+        self.stats["calls"] += calls
+        self.throughput.append(calls / elapsed if elapsed > 0 else float(calls))
+        slow = elapsed / calls > self.latency_target
+        if rate_limited:
+            self.stats["rate_limited"] += 1
+        elif slow:
+            self.stats["slow_batches"] += 1
+        if rate_limited or slow:
+            self.stats["decreases"] += 1
+            self.batch_size = max(1, self.batch_size // 2)
+            self.delay = min(self.max_delay, max(self.base_delay, self.delay * 2))
+            logger.debug(
+                f"{self.name} batches congested; size {self.batch_size}, delay {self.delay:.2f}s"
+            )
+        else:
+            self.stats["increases"] += 1
+            self.batch_size = min(self.max_batch_size, self.batch_size + 1)
+            self.delay = max(0.0, self.delay - self.delay_step)
+
+    async def run(self, items: Sequence[Any], func: Callable[[Any], Awaitable[Any]]) -> List[Any]:
+        """Call ``func`` for every item, batch by batch.
+
+        Args:
+            items: Items to process, in order.
+            func: Async function called with one item.
+
+        Returns:
+            One result per item, in item order. A call that raised yields its
+            exception instead of a result.
+        """
+        results: List[Any] = []
+        index = 0
+        while index < len(items):
+            if index:
+                await asyncio.sleep(self.delay)
+            batch = items[index:index + self.batch_size]
+            index += len(batch)
+            rate_limits_before = self._rate_limit_count()
+            started = time.monotonic()
+            batch_results = await asyncio.gather(*(func(item) for item in batch), return_exceptions=True)
+            elapsed = time.monotonic() - started
+            rate_limited = self._rate_limit_count() > rate_limits_before or any(
+                isinstance(result, BaseException) and is_rate_limited(result) for result in batch_results
+            )
+            self._adjust(len(batch), elapsed, rate_limited)
+            results.extend(batch_results)
+        return results
+
+    def summary(self) -> Dict[str, Any]:
+        """Return the current batch size and pause with per-batch throughput (calls per second)."""
+        return {
+            "batch_size": self.batch_size,
+            "delay": self.delay,
+            "last_throughput": self.throughput[-1] if self.throughput else 0.0,
+            "avg_throughput": sum(self.throughput) / len(self.throughput) if self.throughput else 0.0,
+            **self.stats,
+        }
+
+# Shared batchers: one for Discord event writes, one for Lichess team feeds
+discord_batcher = AdaptiveBatcher("Discord")
+lichess_batcher = AdaptiveBatcher(
+    "Lichess", rate_limit_counter=lambda: lichess_client.governor.stats["rate_limited"]
+)
@@ -6,6 +6,9 @@ from datetime import datetime, timezone
 from discord.ext import commands
 from dotenv import load_dotenv
 from .commands import setup_commands
+from .lichess import lichess_client
+from .cache import cache
+from .event_index import event_index
 from .tasks import start_background_tasks
 from .utils import ensure_file_handler, logger, setup_discord_handler
 
@@ -26,7 +29,29 @@ intents = discord.Intents.default()
 # Enable privileged intent for message content so commands function correctly
 intents.message_content = True
 
-bot = commands.Bot(command_prefix="!", intents=intents)
+class LichessEventsBot(commands.Bot):
+    """Bot that owns the shared Lichess HTTP client and closes it on shutdown."""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lichess = lichess_client
+
+    # Keep the event index in step with changes made in Discord
+    async def on_scheduled_event_create(self, event):
+        event_index.observe(event)
+
+    async def on_scheduled_event_update(self, before, after):
+        event_index.observe(after)
+
+    async def on_scheduled_event_delete(self, event):
+        event_index.observe_delete(event)
+
+    async def close(self):
+        cache.flush()
+        event_index.flush()
+        await self.lichess.close()
+        await super().close()
+
+bot = LichessEventsBot(command_prefix="!", intents=intents)
 
 # Track launch time for status command
 bot.launch_time = datetime.now(timezone.utc).timestamp()
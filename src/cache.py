@@ -1,62 +1,357 @@
 """
 Cache implementation for Lichess API responses.
 """
+from collections import OrderedDict
 from datetime import datetime, timedelta
-import json
 import os
+import sys
 import yaml
 from typing import Dict, List, Tuple, Any, Optional
 
+from .events import DesiredEvent, render_events
+from .lichess import Tournament, feed_digest
+from .utils import DATA_DIR, logger, read_snapshot, write_snapshot
+
 # Load cache TTL from config
 CONFIG_PATH = os.path.join(os.getcwd(), "config", "config.yaml")
 DEFAULT_CACHE_TTL = 15  # Default to 15 minutes if config not found
+DEFAULT_STALE_GRACE = 60  # Minutes an expired entry may still be served while refreshing
+DEFAULT_FLUSH_EVERY = 20  # Cache updates batched into one snapshot write
+DEFAULT_MAX_ENTRIES = 1000  # Teams kept before least recently used ones are evicted
+DEFAULT_MAX_MEGABYTES = 50  # Estimated memory budget for cached tournaments
+DEFAULT_MIN_TTL = 5  # Shortest learned TTL, in minutes
+DEFAULT_MAX_TTL = 720  # Longest learned TTL, in minutes
+DEFAULT_TTL_FRACTION = 0.25  # Learned TTL as a share of a team's typical time between feed changes
+CHANGE_SMOOTHING = 0.5  # Weight of the newest gap in the running average of change gaps
+
+# On-disk snapshot lives under data/ with the other runtime files
+CACHE_FILE = os.path.join(DATA_DIR, "lichess_cache.json")
+CACHE_FILE_VERSION = 2  # 2: tournaments stored as compact rows
 
 try:
     with open(CONFIG_PATH) as f:
         config = yaml.safe_load(f) or {}
-    CACHE_TTL = config.get("performance", {}).get("cache", {}).get("ttl_minutes", DEFAULT_CACHE_TTL)
+    CACHE_CONF = config.get("performance", {}).get("cache", {}) or {}
 except Exception:
-    CACHE_TTL = DEFAULT_CACHE_TTL
+    CACHE_CONF = {}
+CACHE_TTL = CACHE_CONF.get("ttl_minutes", DEFAULT_CACHE_TTL)
+STALE_GRACE = CACHE_CONF.get("stale_grace_minutes", DEFAULT_STALE_GRACE)
+PERSIST = CACHE_CONF.get("persist", True)
+FLUSH_EVERY = CACHE_CONF.get("flush_every", DEFAULT_FLUSH_EVERY)
+MAX_ENTRIES = CACHE_CONF.get("max_entries", DEFAULT_MAX_ENTRIES)
+MAX_MEGABYTES = CACHE_CONF.get("max_megabytes", DEFAULT_MAX_MEGABYTES)
+MIN_TTL = CACHE_CONF.get("min_ttl_minutes", DEFAULT_MIN_TTL)
+MAX_TTL = CACHE_CONF.get("max_ttl_minutes", DEFAULT_MAX_TTL)
+TTL_FRACTION = CACHE_CONF.get("ttl_change_fraction", DEFAULT_TTL_FRACTION)
+
+def estimate_size(obj: Any) -> int:
+    """Approximate the memory held by a cached value, in bytes."""
+    size = sys.getsizeof(obj)
+    if hasattr(type(obj), "__slots__"):
+        size += sum(estimate_size(getattr(obj, field)) for field in type(obj).__slots__)
+    elif isinstance(obj, dict):
+        size += sum(estimate_size(k) + estimate_size(v) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple)):
+        size += sum(estimate_size(item) for item in obj)
+    return size
 
 class LichessCache:
     """A simple cache for Lichess API responses to reduce API calls."""
     
-    def __init__(self, cache_ttl_minutes: int = CACHE_TTL):
+    def __init__(
+        self,
+        cache_ttl_minutes: int = CACHE_TTL,
+        stale_grace_minutes: int = STALE_GRACE,
+        persist_path: Optional[str] = CACHE_FILE if PERSIST else None,
+        flush_every: int = FLUSH_EVERY,
+        max_entries: int = MAX_ENTRIES,
+        max_bytes: int = int(MAX_MEGABYTES * 1024 * 1024),
+        min_ttl_minutes: float = MIN_TTL,
+        max_ttl_minutes: float = MAX_TTL,
+        ttl_change_fraction: float = TTL_FRACTION,
+    ):
         """Initialize the cache with a TTL value.
         
+        Each team's TTL is learned from how often its feed content changes
+        between fetches; ``cache_ttl_minutes`` applies until a team has a
+        change history.
+        
         Args:
-            cache_ttl_minutes: How long to cache responses, in minutes.
+            cache_ttl_minutes: How long to cache responses without a learned TTL, in minutes.
+            stale_grace_minutes: How long after expiry an entry may still be
+                served (stale-while-revalidate), in minutes.
+            persist_path: Snapshot file that survives restarts, or None to
+                keep the cache in memory only.
+            flush_every: Number of cache updates batched into one snapshot write.
+            max_entries: Maximum number of teams kept (least recently used are evicted).
+            max_bytes: Estimated memory budget for all entries, in bytes.
+            min_ttl_minutes: Shortest learned TTL, in minutes.
+            max_ttl_minutes: Longest learned TTL, in minutes.
+            ttl_change_fraction: Learned TTL as a share of the team's typical
+                time between feed changes.
         """
         self.cache_ttl = timedelta(minutes=cache_ttl_minutes)
-        self.team_tournaments: Dict[str, Tuple[datetime, List[Dict[str, Any]]]] = {}
+        self.min_ttl = timedelta(minutes=min_ttl_minutes)
+        self.max_ttl = max(self.min_ttl, timedelta(minutes=max_ttl_minutes))
+        self.ttl_change_fraction = ttl_change_fraction
+        # team slug -> [feed digest, last change (epoch seconds), average change gap in seconds or None],
+        # ordered from least to most recently fetched and bounded like the entries
+        self._history: "OrderedDict[str, List[Any]]" = OrderedDict()
+        # team slug -> learned TTL
+        self._ttls: Dict[str, timedelta] = {}
+        self.stale_grace = timedelta(minutes=stale_grace_minutes)
+        # Ordered from least to most recently used
+        self.team_tournaments: "OrderedDict[str, Tuple[datetime, List[Tournament]]]" = OrderedDict()
+        self.max_entries = max(1, max_entries)
+        self.max_bytes = max_bytes
+        # Desired events rendered from an entry, shared by every guild syncing the team
+        self._events: Dict[str, List[DesiredEvent]] = {}
+        self._sizes: Dict[str, int] = {}
+        self._bytes = 0
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self.renders = 0
+        self.persist_path = persist_path
+        self.flush_every = max(1, flush_every)
+        self._loaded = persist_path is None
+        self._pending_writes = 0
         
-    def get_tournaments(self, team_slug: str) -> Optional[List[Dict[str, Any]]]:
-        """Get cached tournaments for a team if available and not expired.
+    def _ensure_loaded(self) -> None:
+        """Load the on-disk snapshot the first time the cache is used."""
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            snapshot = read_snapshot(self.persist_path, CACHE_FILE_VERSION)
+            if snapshot is None:
+                return
+            for team_slug, (digest, changed_at, gap, ttl) in snapshot.get("history", {}).items():
+                self._history.setdefault(team_slug, [digest, changed_at, gap])
+                if ttl is not None:
+                    self._ttls.setdefault(team_slug, timedelta(seconds=ttl))
+            self._trim_history()
+            now = datetime.now()
+            loaded = 0
+            for team_slug, entry in snapshot.get("entries", {}).items():
+                timestamp = datetime.fromtimestamp(entry["ts"])
+                max_age = self.ttl_for(team_slug) + self.stale_grace
+                if now - timestamp > max_age or team_slug in self.team_tournaments:
+                    continue
+                tournaments = [Tournament.from_row(row) for row in entry["tournaments"]]
+                self._store(team_slug, timestamp, tournaments)
+                loaded += 1
+            logger.info(f"Loaded {loaded} cached teams from {self.persist_path}")
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable cache snapshot {self.persist_path}: {e}")
+        
+    def _mark_dirty(self) -> None:
+        """Count an update and write the snapshot once enough have accumulated."""
+        if not self.persist_path:
+            return
+        self._pending_writes += 1
+        if self._pending_writes >= self.flush_every:
+            self.flush()
+        
+    def flush(self) -> None:
+        """Write pending cache updates to disk (atomically, see ``write_snapshot``)."""
+        if not self.persist_path or not self._pending_writes:
+            return
+        self._ensure_loaded()
+        snapshot = {
+            "version": CACHE_FILE_VERSION,
+            "entries": {
+                team_slug: {
+                    "ts": timestamp.timestamp(),
+                    "tournaments": [t.to_row() for t in tournaments],
+                }
+                for team_slug, (timestamp, tournaments) in self.team_tournaments.items()
+            },
+            "history": {
+                team_slug: history + [
+                    self._ttls[team_slug].total_seconds() if team_slug in self._ttls else None
+                ]
+                for team_slug, history in self._history.items()
+            },
+        }
+        try:
+            write_snapshot(self.persist_path, snapshot)
+            self._pending_writes = 0
+        except Exception as e:
+            logger.error(f"Failed to write cache snapshot {self.persist_path}: {e}")
+        
+    def _store(self, team_slug: str, timestamp: datetime, tournaments: List[Tournament]) -> None:
+        """Insert or replace an entry as most recently used and enforce the size limits."""
+        self._remove(team_slug)
+        size = estimate_size(tournaments)
+        self.team_tournaments[team_slug] = (timestamp, tournaments)
+        self._sizes[team_slug] = size
+        self._bytes += size
+        # Evict least recently used entries, but always keep the newest one
+        while len(self.team_tournaments) > 1 and (
+            len(self.team_tournaments) > self.max_entries or self._bytes > self.max_bytes
+        ):
+            oldest = next(iter(self.team_tournaments))
+            self._remove(oldest)
+            self.evictions += 1
+        
+    def _remove(self, team_slug: str) -> bool:
+        """Drop an entry and its size accounting. Returns True if it existed."""
+        if team_slug not in self.team_tournaments:
+            return False
+        del self.team_tournaments[team_slug]
+        self._events.pop(team_slug, None)
+        self._bytes -= self._sizes.pop(team_slug, 0)
+        return True
+        
+    def lookup(self, team_slug: str) -> Tuple[Optional[List[Tournament]], bool]:
+        """Look up a team once, counting the outcome in the cache statistics.
         
         Args:
             team_slug: The Lichess team slug.
             
         Returns:
-            List of tournament data if cache valid, None if cache miss or expired.
+            Tuple of (tournaments, is_stale). Tournaments is None on a miss or
+            when the entry is past the stale grace window (it is then dropped).
         """
+        self._ensure_loaded()
         if team_slug not in self.team_tournaments:
-            return None
+            self.misses += 1
+            return None, False
             
         timestamp, tournaments = self.team_tournaments[team_slug]
-        if datetime.now() - timestamp > self.cache_ttl:
-            # Cache expired
-            return None
+        age = datetime.now() - timestamp
+        ttl = self.ttl_for(team_slug)
+        if age > ttl + self.stale_grace:
+            # Too old to be useful at all
+            self._remove(team_slug)
+            self.expired += 1
+            self.misses += 1
+            return None, False
+        self.team_tournaments.move_to_end(team_slug)
+        if age > ttl:
+            self.stale_hits += 1
+            return tournaments, True
+        self.hits += 1
+        return tournaments, False
+        
+    def get_tournaments(self, team_slug: str, allow_stale: bool = False) -> Optional[List[Tournament]]:
+        """Get cached tournaments for a team if available and not expired.
+        
+        Args:
+            team_slug: The Lichess team slug.
+            allow_stale: Also return an expired entry that is still within the
+                stale grace window.
             
+        Returns:
+            List of tournament records if cache valid, None if cache miss or expired.
+        """
+        tournaments, is_stale = self.lookup(team_slug)
+        if is_stale and not allow_stale:
+            # Cache expired; stale data is only served when asked for
+            return None
         return tournaments
         
-    def set_tournaments(self, team_slug: str, tournaments: List[Dict[str, Any]]) -> None:
+    def desired_events(self, team_slug: str, tournaments: List[Tournament]) -> List[DesiredEvent]:
+        """Return the desired events for a team's tournaments, rendering them at most once per fetch.
+        
+        The rendered events are kept next to the cache entry and dropped with
+        it. A list that is not the cached entry (e.g. a partial feed) is
+        rendered without being stored.
+        
+        Args:
+            team_slug: The Lichess team slug.
+            tournaments: The tournament list to render.
+            
+        Returns:
+            List of desired events in feed order.
+        """
+        entry = self.team_tournaments.get(team_slug)
+        if entry is None or entry[1] is not tournaments:
+            self.renders += 1
+            return render_events(tournaments)
+        events = self._events.get(team_slug)
+        if events is None:
+            self.renders += 1
+            events = render_events(tournaments)
+            self._events[team_slug] = events
+            size = estimate_size(events)
+            self._sizes[team_slug] += size
+            self._bytes += size
+        return events
+        
+    def digest(self, team_slug: str, tournaments: List[Tournament]) -> str:
+        """Return the feed digest of a team's tournaments, reusing the one computed on store."""
+        entry = self.team_tournaments.get(team_slug)
+        history = self._history.get(team_slug)
+        if entry is not None and entry[1] is tournaments and history is not None:
+            return history[0]
+        return feed_digest(tournaments)
+        
+    def ttl_for(self, team_slug: str) -> timedelta:
+        """Return the team's learned TTL, or the configured TTL if it has none yet."""
+        self._ensure_loaded()
+        return self._ttls.get(team_slug, self.cache_ttl)
+        
+    def _learn_ttl(self, team_slug: str, tournaments: List[Tournament], now: datetime) -> None:
+        """Update a team's change history from a fetch and derive its TTL.
+        
+        The TTL is a fraction of the team's typical time between feed
+        changes: a running average of observed gaps, or the time since the
+        last change if that is longer (a team that went quiet). A team whose
+        feed never changed keeps at least the configured TTL.
+        """
+        digest = feed_digest(tournaments)
+        now_ts = now.timestamp()
+        history = self._history.get(team_slug)
+        if history is None:
+            self._history[team_slug] = [digest, now_ts, None]
+            self._trim_history()
+            return
+        self._history.move_to_end(team_slug)
+        last_digest, changed_at, gap = history
+        if digest != last_digest:
+            observed = now_ts - changed_at
+            gap = observed if gap is None else CHANGE_SMOOTHING * observed + (1 - CHANGE_SMOOTHING) * gap
+            self._history[team_slug] = [digest, now_ts, gap]
+            changed_at = now_ts
+        quiet = now_ts - changed_at
+        if gap is None:
+            ttl = max(self.cache_ttl, timedelta(seconds=self.ttl_change_fraction * quiet))
+        else:
+            ttl = timedelta(seconds=self.ttl_change_fraction * max(gap, quiet))
+        self._ttls[team_slug] = max(self.min_ttl, min(self.max_ttl, ttl))
+        
+    def _trim_history(self) -> None:
+        """Forget the change history and TTL of the least recently fetched teams beyond ``max_entries``.
+        
+        Histories outlive their entries (a quiet team's entry may expire
+        between fetches without losing its learned TTL), so they are bounded
+        separately.
+        """
+        while len(self._history) > self.max_entries:
+            team_slug, _ = self._history.popitem(last=False)
+            self._ttls.pop(team_slug, None)
+        
+    def ttls(self) -> Dict[str, float]:
+        """Return the learned TTL of every team that has one, in minutes."""
+        self._ensure_loaded()
+        return {team_slug: ttl.total_seconds() / 60 for team_slug, ttl in self._ttls.items()}
+        
+    def set_tournaments(self, team_slug: str, tournaments: List[Tournament]) -> None:
         """Store tournaments in cache with current timestamp.
         
         Args:
             team_slug: The Lichess team slug.
-            tournaments: List of tournament data.
+            tournaments: List of tournament records.
         """
-        self.team_tournaments[team_slug] = (datetime.now(), tournaments)
+        self._ensure_loaded()
+        now = datetime.now()
+        self._learn_ttl(team_slug, tournaments, now)
+        self._store(team_slug, now, tournaments)
+        self._mark_dirty()
         
     def invalidate(self, team_slug: str) -> None:
         """Invalidate cache for a specific team.
@@ -64,12 +359,37 @@ class LichessCache:
         Args:
             team_slug: The Lichess team slug.
         """
-        if team_slug in self.team_tournaments:
-            del self.team_tournaments[team_slug]
+        self._ensure_loaded()
+        self._history.pop(team_slug, None)
+        self._ttls.pop(team_slug, None)
+        if self._remove(team_slug):
+            self._mark_dirty()
             
     def invalidate_all(self) -> None:
         """Clear the entire cache."""
+        # Anything on disk is superseded by the now empty cache
+        self._loaded = True
         self.team_tournaments.clear()
+        self._history.clear()
+        self._ttls.clear()
+        self._events.clear()
+        self._sizes.clear()
+        self._bytes = 0
+        self._mark_dirty()
+        
+    def stats(self) -> Dict[str, int]:
+        """Return cache accounting: size, hit/miss counters, evictions, expiries, renders and learned TTLs."""
+        return {
+            "entries": len(self.team_tournaments),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "evictions": self.evictions,
+            "renders": self.renders,
+            "learned_ttls": len(self._ttls),
+        }
 
 # Singleton cache instance for use throughout the app
 cache = LichessCache()
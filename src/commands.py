@@ -1,12 +1,18 @@
 import os
 import discord
-import aiohttp, json
 import sys
 from datetime import datetime, timezone
 from discord.ext import commands
-from .sync import sync_events_for_guild
+from .sync import sync_events_for_guild, fetch_team_tournaments, execute_plan, existing_events_for_guild, guild_lock
 from .utils import ensure_file_handler, logger
 from .cache import cache
+from .events import edit_churn, build_plan
+from .event_index import event_index
+from .lichess import lichess_client
+from .batching import discord_batcher, lichess_batcher
+from .polling import team_poller
+from .team_health import team_health
+from .outbox import outbox
 
 # For detecting if we're in a test environment
 try:
@@ -95,40 +101,35 @@ def setup_commands(bot: commands.Bot, SETTINGS: dict, save_settings: callable):
             deleted = 0
             from .cache import cache
             
-            # Try getting from cache first
-            cached_tournaments = cache.get_tournaments(slug)
+            # Try getting from cache first; stale data is fine since the team is going away
+            cached_tournaments = cache.get_tournaments(slug, allow_stale=True)
             
-            if cached_tournaments:
-                # Use cached tournament data
-                tourney_ids = [t.get('id') for t in cached_tournaments if t.get('id')]
-            else:
-                # If not in cache, make an API call
-                tourney_ids = []
-                async with aiohttp.ClientSession() as session:
-                    url = f"https://lichess.org/api/team/{slug}/arena"
-                    async with session.get(url) as resp:
-                        if resp.status == 200:
-                            async for line in resp.content:
-                                try:
-                                    t = json.loads(line.decode().strip())
-                                    tourney_ids.append(t.get('id'))
-                                except Exception:
-                                    continue
+            if cached_tournaments is None:
+                # If not in cache, fetch (or join an in-flight fetch) from the API
+                cached_tournaments = await fetch_team_tournaments(slug, label=interaction.guild.name) or []
+            tourney_ids = [t.id for t in cached_tournaments]
             
             # Invalidate cache for this team since it's being removed
             cache.invalidate(slug)
+            # Queued creates and updates for the team must not bring its events back
+            outbox.discard_team(interaction.guild.id, slug)
             
-            # Delete associated events
+            # Delete associated events (found through the event index when it is current)
             if tourney_ids:
-                urls_to_delete = {f"https://lichess.org/tournament/{tid}" for tid in tourney_ids}
-                events = await interaction.guild.fetch_scheduled_events()
-                for ev in events:
-                    if ev.location in urls_to_delete:
-                        try:
-                            await ev.delete()
-                            deleted += 1
-                        except Exception:
-                            pass
+                # Hold the guild lock so a running sync cannot recreate what is deleted
+                async with guild_lock(interaction.guild.id):
+                    # Arenas that another registered team still lists keep their event
+                    keep_ids = [
+                        t.id
+                        for team in teams
+                        for t in cache.get_tournaments(team, allow_stale=True) or []
+                    ]
+                    existing = await existing_events_for_guild(interaction.guild)
+                    plan = build_plan(
+                        existing, {}, datetime.now(timezone.utc),
+                        delete_ids=tourney_ids, keep_ids=keep_ids,
+                    )
+                    _, _, deleted = await execute_plan(interaction.guild, SETTINGS, plan)
             # Send deletion summary
             await interaction.followup.send(
                 f"🗑️ Team `{slug}` removed. Deleted {deleted} associated event(s).", ephemeral=True
@@ -200,14 +201,10 @@ def setup_commands(bot: commands.Bot, SETTINGS: dict, save_settings: callable):
         if not targets:
             await interaction.followup.send("ℹ️ No teams registered.", ephemeral=True)
             return
-        total_created, total_updated, all_events = 0, 0, []
-        for slug in targets:
-            created, updated, events = await sync_events_for_guild(
-                interaction.guild, SETTINGS, bot, verbose=False, team_slug=slug
-            )
-            total_created += created
-            total_updated += updated
-            all_events.extend(events)
+        # Without a team argument all teams are reconciled together in one plan
+        total_created, total_updated, all_events = await sync_events_for_guild(
+            interaction.guild, SETTINGS, bot, verbose=False, team_slug=slug if team else None, force=True
+        )
         # Construct feedback message
         if total_created == 0 and total_updated == 0:
             await interaction.followup.send("ℹ️ No new or updated events.", ephemeral=True)
@@ -247,14 +244,10 @@ def setup_commands(bot: commands.Bot, SETTINGS: dict, save_settings: callable):
         if not targets:
             await interaction.followup.send("ℹ️ No teams registered.", ephemeral=True)
             return
-        total_created, total_updated, all_events = 0, 0, []
-        for slug in targets:
-            created, updated, events = await sync_events_for_guild(
-                interaction.guild, SETTINGS, bot, verbose=True, team_slug=slug
-            )
-            total_created += created
-            total_updated += updated
-            all_events.extend(events)
+        # Without a team argument all teams are reconciled together in one plan
+        total_created, total_updated, all_events = await sync_events_for_guild(
+            interaction.guild, SETTINGS, bot, verbose=True, team_slug=slug if team else None, force=True
+        )
         if total_created == 0 and total_updated == 0:
             await interaction.followup.send("ℹ️ No new or updated events.", ephemeral=True)
         else:
@@ -269,16 +262,9 @@ def setup_commands(bot: commands.Bot, SETTINGS: dict, save_settings: callable):
     @bot.command(name="sync")
     @commands.has_permissions(administrator=True)
     async def sync_prefix(ctx: commands.Context):
-        guild_id = str(ctx.guild.id)
-        teams = SETTINGS.get(guild_id, {}).get("teams", [])
-        total_created, total_updated, all_events = 0, 0, []
-        for slug in teams:
-            created, updated, events = await sync_events_for_guild(
-                ctx.guild, SETTINGS, bot, verbose=False, team_slug=slug
-            )
-            total_created += created
-            total_updated += updated
-            all_events.extend(events)
+        total_created, total_updated, all_events = await sync_events_for_guild(
+            ctx.guild, SETTINGS, bot, verbose=False, force=True
+        )
         if total_created == 0 and total_updated == 0:
             await ctx.send("ℹ️ No new or updated events.")
         else:
@@ -293,16 +279,9 @@ def setup_commands(bot: commands.Bot, SETTINGS: dict, save_settings: callable):
     @bot.command(name="sync_verbose")
     @commands.has_permissions(administrator=True)
     async def sync_verbose_prefix(ctx: commands.Context):
-        guild_id = str(ctx.guild.id)
-        teams = SETTINGS.get(guild_id, {}).get("teams", [])
-        total_created, total_updated, all_events = 0, 0, []
-        for slug in teams:
-            created, updated, events = await sync_events_for_guild(
-                ctx.guild, SETTINGS, bot, verbose=True, team_slug=slug
-            )
-            total_created += created
-            total_updated += updated
-            all_events.extend(events)
+        total_created, total_updated, all_events = await sync_events_for_guild(
+            ctx.guild, SETTINGS, bot, verbose=True, force=True
+        )
         if total_created == 0 and total_updated == 0:
             await ctx.send("ℹ️ No new or updated events.")
         else:
@@ -612,6 +591,126 @@ def setup_commands(bot: commands.Bot, SETTINGS: dict, save_settings: callable):
                 notif = f"#{channel.name}" if channel else f"Invalid channel ({notif_id})"
             embed.add_field(name="Notification Channel", value=notif, inline=True)
             
+            # Lichess feed health
+            feed_stats = lichess_client.stats
+            embed.add_field(
+                name="Lichess Feeds",
+                value=(
+                    f"Complete: {feed_stats['feeds_complete']}\n"
+                    f"Partial: {feed_stats['feeds_partial']} "
+                    f"(idle {feed_stats['idle_timeouts']}, deadline {feed_stats['deadline_timeouts']})\n"
+                    f"Connect timeouts: {feed_stats['connect_timeouts']}, "
+                    f"connection errors: {feed_stats['connection_errors']}\n"
+                    f"Coalesced fetches: {feed_stats['feeds_coalesced']}"
+                ),
+                inline=False
+            )
+            cache_stats = cache.stats()
+            embed.add_field(
+                name="Lichess Cache",
+                value=(
+                    f"Teams: {cache_stats['entries']} (~{cache_stats['bytes'] / 1024:.0f} KiB)\n"
+                    f"Hits: {cache_stats['hits']} (stale {cache_stats['stale_hits']}), "
+                    f"misses: {cache_stats['misses']}\n"
+                    f"Evicted: {cache_stats['evictions']}, expired: {cache_stats['expired']}\n"
+                    f"Learned TTLs: {cache_stats['learned_ttls']} teams"
+                ),
+                inline=False
+            )
+            guild_teams = SETTINGS.get(str(interaction.guild_id), {}).get("teams", [])
+            if guild_teams:
+                embed.add_field(
+                    name="Cache TTL per Team",
+                    value="\n".join(
+                        f"{team}: {cache.ttl_for(team).total_seconds() / 60:.0f} min"
+                        + ("" if team in cache.ttls() else " (default)")
+                        for team in guild_teams
+                    ),
+                    inline=False
+                )
+            churn_stats = edit_churn.stats
+            embed.add_field(
+                name="Event Edits",
+                value=(
+                    f"Edited: {churn_stats['edits']}, unchanged: {churn_stats['unchanged']}\n"
+                    f"Re-edited every sync: {churn_stats['churning']}"
+                ),
+                inline=False
+            )
+            index_stats = event_index.stats
+            digest_hits = index_stats['digest_hits']
+            digest_checks = digest_hits + index_stats['digest_misses']
+            digest_rate = 100 * digest_hits / digest_checks if digest_checks else 0
+            embed.add_field(
+                name="Event Index",
+                value=(
+                    f"Syncs served from index: {index_stats['index_syncs']}\n"
+                    f"Full verifications: {index_stats['verifications']} "
+                    f"(gateway cache {index_stats['gateway_lists']}, REST {index_stats['rest_lists']})\n"
+                    f"Gateway updates: {index_stats['gateway_updates']}\n"
+                    f"Feed digest hits: {digest_hits}/{digest_checks} ({digest_rate:.0f}%)"
+                ),
+                inline=False
+            )
+            rate_stats = lichess_client.governor.stats
+            embed.add_field(
+                name="Lichess Rate Limit",
+                value=(
+                    f"Requests: {rate_stats['requests']}\n"
+                    f"Throttle waits: {rate_stats['throttle_waits']} "
+                    f"({rate_stats['throttle_wait_seconds']:.1f}s)\n"
+                    f"HTTP 429: {rate_stats['rate_limited']}"
+                ),
+                inline=False
+            )
+            
+            health_stats = team_health.stats
+            broken = team_health.broken()
+            health_lines = [
+                f"Skipped requests: {health_stats['negative_hits']} not found, "
+                f"{health_stats['circuit_skips']} circuit open"
+            ]
+            health_lines += [
+                f"{team}: {reason}"
+                for team, reason in broken.items()
+                if team in SETTINGS.get(str(interaction.guild_id), {}).get("teams", [])
+            ]
+            embed.add_field(name="Team Health", value="\n".join(health_lines), inline=False)
+            outbox_stats = outbox.stats
+            embed.add_field(
+                name="Outbox",
+                value=(
+                    f"Pending writes: {len(outbox)}\n"
+                    f"Queued: {outbox_stats['queued']}, retries: {outbox_stats['retries']}\n"
+                    f"Applied: {outbox_stats['applied']} "
+                    f"({outbox_stats['already_applied']} already done), "
+                    f"dropped: {outbox_stats['dropped']}"
+                ),
+                inline=False
+            )
+            poll_stats = team_poller.stats
+            intervals = team_poller.intervals()
+            poll_lines = [
+                f"Teams tracked: {len(intervals)}",
+                f"Polls: {poll_stats['polls']} ({poll_stats['changes']} changed, "
+                f"{poll_stats['failures']} failed, over budget {poll_stats['over_budget']}x)",
+            ]
+            if intervals:
+                poll_lines.append(
+                    f"Intervals: {min(intervals.values()):.0f}–{max(intervals.values()):.0f} min"
+                )
+            embed.add_field(name="Adaptive Polling", value="\n".join(poll_lines), inline=False)
+            batch_lines = []
+            for batcher in (discord_batcher, lichess_batcher):
+                batch_stats = batcher.summary()
+                batch_lines.append(
+                    f"{batcher.name}: size {batch_stats['batch_size']}, delay {batch_stats['delay']:.2f}s, "
+                    f"{batch_stats['last_throughput']:.1f} calls/s last batch "
+                    f"({batch_stats['avg_throughput']:.1f} avg, {batch_stats['batches']} batches, "
+                    f"HTTP 429: {batch_stats['rate_limited']})"
+                )
+            embed.add_field(name="Batching", value="\n".join(batch_lines), inline=False)
+            
             # Permissions (best effort)
             if bot.user and interaction.guild:
                 member = interaction.guild.get_member(bot.user.id)
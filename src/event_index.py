@@ -0,0 +1,272 @@
+"""
+Persistent index of the Discord scheduled events created for Lichess tournaments.
+"""
+import os
+import time
+import yaml
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import discord
+
+from .events import IndexedEvent, index_scheduled_events, scheduled_event_fingerprint, tournament_id_from_url
+from .utils import DATA_DIR, logger, read_snapshot, write_snapshot
+
+# Load index settings from config
+CONFIG_PATH = os.path.join(os.getcwd(), "config", "config.yaml")
+DEFAULT_FLUSH_EVERY = 20  # Index updates batched into one snapshot write
+DEFAULT_VERIFY_HOURS = 168  # How often a guild's index is checked against a full event list
+
+# On-disk index lives under data/ with the other runtime files
+INDEX_FILE = os.path.join(DATA_DIR, "event_index.json")
+INDEX_FILE_VERSION = 1
+
+try:
+    with open(CONFIG_PATH) as f:
+        config = yaml.safe_load(f) or {}
+    INDEX_CONF = config.get("performance", {}).get("event_index", {}) or {}
+except Exception:
+    INDEX_CONF = {}
+PERSIST = INDEX_CONF.get("persist", True)
+FLUSH_EVERY = INDEX_CONF.get("flush_every", DEFAULT_FLUSH_EVERY)
+VERIFY_HOURS = INDEX_CONF.get("verify_hours", DEFAULT_VERIFY_HOURS)
+GATEWAY_CACHE = INDEX_CONF.get("gateway_cache", True)
+
+
+class EventIndex:
+    """Maps (guild id, tournament id) to the Discord event id and its last applied content hash.
+
+    The index is updated by the bot's own writes and by gateway scheduled
+    event dispatches, so a sync normally needs no event list call. A guild is
+    verified against the gateway event cache when that looks complete, and
+    re-listed over REST only when it was not verified since the bot started
+    or its last verification is older than ``verify_hours``. Events deleted
+    while the bot was offline are therefore noticed on the guild's first sync.
+
+    It also remembers, per guild and team, the digest of the team feed last
+    applied in full. Any change to a guild's entries that did not come from
+    applying a plan (a gateway delete, a verification that found
+    differences) clears the guild's applied digests.
+    """
+
+    def __init__(
+        self,
+        persist_path: Optional[str] = INDEX_FILE if PERSIST else None,
+        flush_every: int = FLUSH_EVERY,
+        verify_hours: float = VERIFY_HOURS,
+        gateway_cache: bool = GATEWAY_CACHE,
+    ):
+        """Initialize an empty index. The snapshot is loaded lazily on first use.
+
+        Args:
+            persist_path: Snapshot file that survives restarts, or None to keep
+                the index in memory only.
+            flush_every: Number of index updates batched into one snapshot write.
+            verify_hours: Maximum age of a guild's last full verification, in hours.
+            gateway_cache: Verify guilds from the scheduled events discord.py
+                keeps from gateway dispatches instead of a REST list, when
+                that cache looks complete.
+        """
+        # guild id -> tournament id -> (event id, content hash)
+        self.guilds: Dict[int, Dict[str, Tuple[int, str]]] = {}
+        # guild id -> time of the last full event list since startup (seconds since the epoch)
+        self.verified_at: Dict[int, float] = {}
+        # guild id -> team slug -> digest of the feed last applied to the guild
+        self.applied: Dict[int, Dict[str, str]] = {}
+        self.verify_seconds = verify_hours * 3600
+        self.gateway_cache = gateway_cache
+        self.persist_path = persist_path
+        self.flush_every = max(1, flush_every)
+        self._loaded = persist_path is None
+        self._pending_writes = 0
+        self.stats: Dict[str, int] = {
+            "index_syncs": 0,
+            "verifications": 0,
+            "gateway_lists": 0,
+            "rest_lists": 0,
+            "gateway_updates": 0,
+            "digest_hits": 0,
+            "digest_misses": 0,
+        }
+
+    def _ensure_loaded(self) -> None:
+        """Load the on-disk snapshot the first time the index is used."""
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            snapshot = read_snapshot(self.persist_path, INDEX_FILE_VERSION)
+            if snapshot is None:
+                return
+            # Verifications are not loaded: only a list taken since startup
+            # shows events deleted while the bot was offline
+            for guild_id, entry in snapshot.get("guilds", {}).items():
+                self.guilds[int(guild_id)] = {
+                    tournament_id: (event_id, content_hash)
+                    for tournament_id, (event_id, content_hash) in entry["events"].items()
+                }
+                if entry.get("applied"):
+                    self.applied[int(guild_id)] = dict(entry["applied"])
+            logger.info(f"Loaded event index for {len(self.guilds)} guilds from {self.persist_path}")
+        except Exception as e:
+            # Verification rebuilds whatever could not be loaded
+            self.guilds.clear()
+            self.verified_at.clear()
+            self.applied.clear()
+            logger.warning(f"Ignoring unreadable event index {self.persist_path}: {e}")
+
+    def _mark_dirty(self) -> None:
+        """Count an update and write the snapshot once enough have accumulated."""
+        if not self.persist_path:
+            return
+        self._pending_writes += 1
+        if self._pending_writes >= self.flush_every:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write pending index updates to disk (atomically, see ``write_snapshot``)."""
+        if not self.persist_path or not self._pending_writes:
+            return
+        self._ensure_loaded()
+        snapshot = {
+            "version": INDEX_FILE_VERSION,
+            "guilds": {
+                str(guild_id): {
+                    "events": {tid: list(entry) for tid, entry in events.items()},
+                    "applied": self.applied.get(guild_id, {}),
+                }
+                for guild_id, events in self.guilds.items()
+            },
+        }
+        try:
+            write_snapshot(self.persist_path, snapshot)
+            self._pending_writes = 0
+        except Exception as e:
+            logger.error(f"Failed to write event index {self.persist_path}: {e}")
+
+    def needs_verification(self, guild_id: int) -> bool:
+        """Return True if the guild's index must be rebuilt from a full event list."""
+        self._ensure_loaded()
+        verified_at = self.verified_at.get(guild_id)
+        return verified_at is None or time.time() - verified_at > self.verify_seconds
+
+    def gateway_events(self, guild: discord.Guild) -> Optional[List[discord.ScheduledEvent]]:
+        """Return the guild's scheduled events from the gateway cache, if it can be trusted.
+
+        The cache is not used while the guild is unavailable, or when an event
+        the index knows about is missing from it (the cache is incomplete or
+        the event was deleted while the bot was offline); a REST list then
+        settles the difference.
+
+        Returns:
+            The cached events, or None if a REST list is needed.
+        """
+        if not self.gateway_cache or getattr(guild, "unavailable", True):
+            return None
+        events = guild.scheduled_events
+        if not isinstance(events, list):
+            return None
+        self._ensure_loaded()
+        cached_ids = {ev.id for ev in events}
+        known = self.guilds.get(guild.id, {})
+        if any(event_id not in cached_ids for event_id, _ in known.values()):
+            logger.debug(f"Gateway event cache for guild {guild.id} is incomplete, listing over REST")
+            return None
+        return events
+
+    def replace_guild(self, guild_id: int, events: Iterable[discord.ScheduledEvent]) -> Dict[str, IndexedEvent]:
+        """Rebuild a guild's index from a full event list and mark it verified.
+
+        Returns:
+            The guild's existing Lichess events by tournament id.
+        """
+        self._ensure_loaded()
+        existing = index_scheduled_events(events)
+        indexed = {
+            tournament_id: (entry.event_id, entry.content_hash)
+            for tournament_id, entry in existing.items()
+        }
+        if indexed != self.guilds.get(guild_id, {}):
+            self._entries_changed(guild_id)
+        self.guilds[guild_id] = indexed
+        self.verified_at[guild_id] = time.time()
+        self.stats["verifications"] += 1
+        self._mark_dirty()
+        return existing
+
+    def existing(self, guild_id: int) -> Dict[str, IndexedEvent]:
+        """Return a guild's indexed events by tournament id, without any API call."""
+        self._ensure_loaded()
+        self.stats["index_syncs"] += 1
+        return {
+            tournament_id: IndexedEvent(event_id, content_hash)
+            for tournament_id, (event_id, content_hash) in self.guilds.get(guild_id, {}).items()
+        }
+
+    def _entries_changed(self, guild_id: int) -> None:
+        """Invalidate the guild's applied feed digests after its entries changed."""
+        self.applied.pop(guild_id, None)
+
+    def get(self, guild_id: int, tournament_id: str) -> Optional[IndexedEvent]:
+        """Return a single tournament's indexed event, without counting an index sync."""
+        self._ensure_loaded()
+        entry = self.guilds.get(guild_id, {}).get(tournament_id)
+        return IndexedEvent(*entry) if entry is not None else None
+
+    def record(self, guild_id: int, tournament_id: str, event_id: int, content_hash: str) -> None:
+        """Store the event id and applied content hash for a tournament."""
+        self._ensure_loaded()
+        events = self.guilds.setdefault(guild_id, {})
+        if events.get(tournament_id) != (event_id, content_hash):
+            events[tournament_id] = (event_id, content_hash)
+            self._entries_changed(guild_id)
+            self._mark_dirty()
+
+    def forget(self, guild_id: int, tournament_id: str, event_id: Optional[int] = None) -> None:
+        """Drop a tournament's entry (only if it still points at ``event_id``, when given)."""
+        self._ensure_loaded()
+        events = self.guilds.get(guild_id, {})
+        entry = events.get(tournament_id)
+        if entry is not None and (event_id is None or entry[0] == event_id):
+            del events[tournament_id]
+            self._entries_changed(guild_id)
+            self._mark_dirty()
+
+    def applied_digest(self, guild_id: int, team_slug: str) -> Optional[str]:
+        """Return the digest of the team feed last applied to the guild, if still valid."""
+        self._ensure_loaded()
+        return self.applied.get(guild_id, {}).get(team_slug)
+
+    def record_applied(self, guild_id: int, team_slug: str, digest: str) -> None:
+        """Remember that the guild's events match the team feed with this digest."""
+        self._ensure_loaded()
+        applied = self.applied.setdefault(guild_id, {})
+        if applied.get(team_slug) != digest:
+            applied[team_slug] = digest
+            self._mark_dirty()
+
+    def observe(self, event: discord.ScheduledEvent) -> None:
+        """Apply a gateway scheduled event create or update."""
+        tournament_id = tournament_id_from_url(event.location)
+        if tournament_id is None:
+            return
+        self.stats["gateway_updates"] += 1
+        self.record(event.guild_id, tournament_id, event.id, scheduled_event_fingerprint(event))
+
+    def observe_delete(self, event: discord.ScheduledEvent) -> None:
+        """Apply a gateway scheduled event delete."""
+        tournament_id = tournament_id_from_url(event.location)
+        if tournament_id is None:
+            return
+        self.stats["gateway_updates"] += 1
+        self.forget(event.guild_id, tournament_id, event.id)
+
+    def invalidate_all(self) -> None:
+        """Clear the index; every guild is verified again on its next sync."""
+        self._loaded = True
+        self.guilds.clear()
+        self.verified_at.clear()
+        self.applied.clear()
+        self._mark_dirty()
+
+# Singleton index instance for use throughout the app
+event_index = EventIndex()
@@ -0,0 +1,292 @@
+"""
+Desired Discord scheduled event state rendered from Lichess tournaments.
+"""
+import hashlib
+import os
+import yaml
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import discord
+
+from .lichess import Tournament
+from .utils import logger
+
+TOURNAMENT_URL = "https://lichess.org/tournament/{}"
+
+# Load event sync settings from config
+CONFIG_PATH = os.path.join(os.getcwd(), "config", "config.yaml")
+DEFAULT_CHURN_THRESHOLD = 3  # Consecutive syncs editing the same event before it is flagged
+
+try:
+    with open(CONFIG_PATH) as f:
+        config = yaml.safe_load(f) or {}
+    EVENTS_CONF = config.get("performance", {}).get("events", {}) or {}
+except Exception:
+    EVENTS_CONF = {}
+
+
+def _normalize_text(value: Optional[str]) -> str:
+    """Canonical form of a name or description: LF line endings, no trailing blanks."""
+    if not isinstance(value, str):
+        return ""
+    text = value.replace("\r\n", "\n").replace("\r", "\n")
+    return "\n".join(line.rstrip() for line in text.split("\n")).strip()
+
+
+def _normalize_time(value: Optional[datetime]) -> str:
+    """Canonical form of an event time: UTC, whole seconds."""
+    if not isinstance(value, datetime):
+        return ""
+    return value.astimezone(timezone.utc).replace(microsecond=0).isoformat()
+
+
+def event_fingerprint(
+    name: Optional[str],
+    description: Optional[str],
+    start_time: Optional[datetime],
+    end_time: Optional[datetime],
+) -> str:
+    """Return a short hash over the normalized fields an event is synced on.
+
+    Formatting differences Discord introduces (line endings, trailing
+    whitespace, sub-second precision, time zone) do not change the result.
+    """
+    payload = "\x1f".join((
+        _normalize_text(name),
+        _normalize_text(description),
+        _normalize_time(start_time),
+        _normalize_time(end_time),
+    ))
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def scheduled_event_fingerprint(event: discord.ScheduledEvent) -> str:
+    """Return the fingerprint of an existing Discord scheduled event."""
+    return event_fingerprint(event.name, event.description, event.start_time, event.end_time)
+
+
+class DesiredEvent:
+    """The scheduled event a tournament should appear as, rendered once and shared by all guilds."""
+
+    __slots__ = ("tournament_id", "url", "name", "description", "start_time", "end_time", "content_hash")
+
+    def __init__(
+        self,
+        tournament_id: str,
+        url: str,
+        name: str,
+        description: str,
+        start_time: datetime,
+        end_time: datetime,
+    ):
+        self.tournament_id = tournament_id
+        self.url = url
+        self.name = name
+        self.description = description
+        self.start_time = start_time
+        self.end_time = end_time
+        self.content_hash = event_fingerprint(name, description, start_time, end_time)
+
+    @classmethod
+    def from_tournament(cls, t: Tournament) -> "DesiredEvent":
+        """Render the event name, times and description for a tournament."""
+        start_time = datetime.fromtimestamp(t.starts_at / 1000, tz=timezone.utc)
+        end_time = datetime.fromtimestamp(t.finishes_at / 1000, tz=timezone.utc)
+        url = TOURNAMENT_URL.format(t.id)
+        description = (
+            f"**Lichess Arena Tournament**\n"
+            f"• {start_time:%Y-%m-%d %H:%M UTC} – {end_time:%H:%M UTC}\n"
+            f"• {t.minutes} min · +{t.increment}s\n\n"
+            f"{url}"
+        )
+        return cls(t.id, url, t.full_name or f"Arena {t.id}", description, start_time, end_time)
+
+    def to_row(self) -> List[Any]:
+        """Serialize to a plain list (used by the outbox file)."""
+        return [
+            self.tournament_id, self.url, self.name, self.description,
+            self.start_time.isoformat(), self.end_time.isoformat(),
+        ]
+
+    @classmethod
+    def from_row(cls, row: List[Any]) -> "DesiredEvent":
+        """Rebuild an event written by ``to_row``."""
+        tournament_id, url, name, description, start_time, end_time = row
+        return cls(
+            tournament_id, url, name, description,
+            datetime.fromisoformat(start_time), datetime.fromisoformat(end_time),
+        )
+
+    def __repr__(self) -> str:
+        return f"DesiredEvent(tournament_id={self.tournament_id!r}, hash={self.content_hash})"
+
+
+def render_events(tournaments: Iterable[Tournament]) -> List[DesiredEvent]:
+    """Render the desired events for a team's tournament list."""
+    return [DesiredEvent.from_tournament(t) for t in tournaments]
+
+
+class EditChurn:
+    """Flags scheduled events that get edited on several syncs in a row.
+
+    In steady state an event matches its desired state and is skipped; an
+    event that needs an edit on every sync points at a fingerprint mismatch
+    (e.g. Discord rewriting a field) and is logged once it is flagged.
+    """
+
+    def __init__(self, threshold: int = EVENTS_CONF.get("churn_threshold", DEFAULT_CHURN_THRESHOLD)):
+        """Initialize the tracker.
+
+        Args:
+            threshold: Consecutive edits of the same event before it is flagged.
+        """
+        self.threshold = max(1, threshold)
+        # (guild id, event URL) -> (consecutive edits, event end time)
+        self._streaks: Dict[Tuple[int, str], Tuple[int, datetime]] = {}
+        self.stats: Dict[str, Any] = {
+            "edits": 0,
+            "unchanged": 0,
+            "churning": 0,
+        }
+
+    def record_edit(self, guild_id: int, event: DesiredEvent) -> bool:
+        """Count an edit of an event. Returns True if the event is churning."""
+        key = (guild_id, event.url)
+        streak = self._streaks.get(key, (0, event.end_time))[0] + 1
+        self._streaks[key] = (streak, event.end_time)
+        self.stats["edits"] += 1
+        if streak == self.threshold:
+            self.stats["churning"] += 1
+            logger.warning(
+                f"Scheduled event {event.url} in guild {guild_id} was edited on {streak} syncs in a row"
+            )
+        return streak >= self.threshold
+
+    def record_unchanged(self, guild_id: int, event: DesiredEvent) -> None:
+        """Count an event that already matched its desired state."""
+        self.stats["unchanged"] += 1
+        self._forget((guild_id, event.url))
+
+    def _forget(self, key: Tuple[int, str]) -> None:
+        streak, _ = self._streaks.pop(key, (0, None))
+        if streak >= self.threshold:
+            self.stats["churning"] -= 1
+
+    def prune(self, now: datetime) -> None:
+        """Drop streaks of events that are already over."""
+        for key in [k for k, (_, end_time) in self._streaks.items() if end_time <= now]:
+            self._forget(key)
+
+    def churning(self) -> List[Tuple[int, str]]:
+        """Return (guild id, event URL) of every event currently flagged."""
+        return [key for key, (streak, _) in self._streaks.items() if streak >= self.threshold]
+
+# Singleton tracker for use throughout the app
+edit_churn = EditChurn()
+
+
+class IndexedEvent:
+    """A guild's existing event for a tournament: its Discord id and last known content hash."""
+
+    __slots__ = ("event_id", "content_hash", "event")
+
+    def __init__(self, event_id: int, content_hash: str, event: Optional[discord.ScheduledEvent] = None):
+        self.event_id = event_id
+        self.content_hash = content_hash
+        # The event object itself, when it came from a list call or the gateway
+        self.event = event
+
+    def __repr__(self) -> str:
+        return f"IndexedEvent(event_id={self.event_id!r}, hash={self.content_hash})"
+
+
+def tournament_id_from_url(location: Optional[str]) -> Optional[str]:
+    """Return the tournament id an event location points at, or None for other locations."""
+    prefix = TOURNAMENT_URL.format("")
+    if not isinstance(location, str) or not location.startswith(prefix):
+        return None
+    tournament_id = location[len(prefix):]
+    if not tournament_id or "/" in tournament_id:
+        return None
+    return tournament_id
+
+
+def index_scheduled_events(events: Iterable[discord.ScheduledEvent]) -> Dict[str, IndexedEvent]:
+    """Map tournament id to existing event for the Lichess events in a guild's event list."""
+    existing: Dict[str, IndexedEvent] = {}
+    for ev in events:
+        tournament_id = tournament_id_from_url(ev.location)
+        if tournament_id is not None:
+            existing[tournament_id] = IndexedEvent(ev.id, scheduled_event_fingerprint(ev), ev)
+    return existing
+
+
+class EventPlan:
+    """Create, update and delete operations that bring one guild's events to the desired state."""
+
+    def __init__(self):
+        # (team slug, desired event) to create
+        self.creates: List[Tuple[str, DesiredEvent]] = []
+        # (team slug, desired event, existing event) to edit
+        self.updates: List[Tuple[str, DesiredEvent, IndexedEvent]] = []
+        # (desired event, existing event) that already match
+        self.unchanged: List[Tuple[DesiredEvent, IndexedEvent]] = []
+        # (tournament id, existing event) to delete
+        self.deletes: List[Tuple[str, IndexedEvent]] = []
+        self.skipped_started = 0
+        # Tournament ids whose operation failed when the plan was executed
+        self.failed: List[str] = []
+
+    def __len__(self) -> int:
+        """Number of Discord API calls the plan needs."""
+        return len(self.creates) + len(self.updates) + len(self.deletes)
+
+
+def build_plan(
+    existing: Dict[str, IndexedEvent],
+    desired_by_team: Dict[str, List[DesiredEvent]],
+    now: datetime,
+    delete_ids: Iterable[str] = (),
+    keep_ids: Iterable[str] = (),
+) -> EventPlan:
+    """Diff a guild's existing events against the merged desired state of its teams.
+
+    A tournament listed by several teams is planned once, for the first team
+    that lists it. Tournaments that already started are left alone.
+
+    Args:
+        existing: The guild's existing events by tournament id (from a list
+            call or the event index).
+        desired_by_team: Desired events per team slug, in the guild's team order.
+        now: Current time; desired events starting before it are skipped.
+        delete_ids: Tournament ids whose events should be deleted unless a
+            team in ``desired_by_team`` still lists them.
+        keep_ids: Further tournament ids whose events must not be deleted.
+
+    Returns:
+        The plan to execute.
+    """
+    plan = EventPlan()
+    planned = set()
+    for team, events in desired_by_team.items():
+        for desired in events:
+            if desired.tournament_id in planned:
+                continue
+            planned.add(desired.tournament_id)
+            if desired.start_time <= now:
+                plan.skipped_started += 1
+                continue
+            entry = existing.get(desired.tournament_id)
+            if entry is None:
+                plan.creates.append((team, desired))
+            elif entry.content_hash == desired.content_hash:
+                plan.unchanged.append((desired, entry))
+            else:
+                plan.updates.append((team, desired, entry))
+    kept_ids = planned.union(keep_ids)
+    for tournament_id in dict.fromkeys(delete_ids):
+        entry = existing.get(tournament_id)
+        if entry is not None and tournament_id not in kept_ids:
+            plan.deletes.append((tournament_id, entry))
+    return plan
@@ -0,0 +1,274 @@
+"""
+Shared HTTP client for the Lichess API.
+"""
+import hashlib
+import json
+import os
+import yaml
+import aiohttp
+from contextlib import asynccontextmanager
+from typing import Optional, Any, Dict, Iterable, List
+
+from .ratelimit import RateGovernor, RATE_LIMIT_CONF
+from .utils import logger
+
+LICHESS_BASE_URL = "https://lichess.org"
+
+# Load HTTP pool settings from config
+CONFIG_PATH = os.path.join(os.getcwd(), "config", "config.yaml")
+DEFAULT_POOL_SIZE = 20
+DEFAULT_PER_HOST_LIMIT = 8
+DEFAULT_DNS_CACHE_TTL = 300  # seconds
+DEFAULT_KEEPALIVE_TIMEOUT = 60  # seconds
+DEFAULT_CONNECT_TIMEOUT = 10  # seconds to obtain a connection
+DEFAULT_IDLE_TIMEOUT = 15  # seconds without data before a feed is abandoned
+DEFAULT_TOTAL_TIMEOUT = 60  # hard deadline per team feed, in seconds
+DEFAULT_MAX_RETRIES = 1  # retries of a request answered with HTTP 429
+DEFAULT_ARENA_MAX = 100  # upcoming tournaments requested per team
+
+try:
+    with open(CONFIG_PATH) as f:
+        config = yaml.safe_load(f) or {}
+    HTTP_CONF = config.get("performance", {}).get("http", {}) or {}
+    ARENA_CONF = config.get("performance", {}).get("arena_feed", {}) or {}
+except Exception:
+    HTTP_CONF = {}
+    ARENA_CONF = {}
+ARENA_MAX = ARENA_CONF.get("max_tournaments", DEFAULT_ARENA_MAX)
+
+# Lichess arena tournament status codes
+STATUS_CREATED = 10
+STATUS_STARTED = 20
+STATUS_FINISHED = 30
+
+
+class LichessError(Exception):
+    """Base class for failed Lichess requests."""
+
+
+class LichessAPIError(LichessError):
+    """Raised when the Lichess API answers with a non-200 status."""
+
+    def __init__(self, status: int, team_slug: Optional[str] = None):
+        self.status = status
+        self.team_slug = team_slug
+        super().__init__(f"Lichess API returned HTTP {status} for team {team_slug}")
+
+
+class LichessTimeoutError(LichessError):
+    """Raised when no response could be obtained from Lichess in time."""
+
+    def __init__(self, team_slug: Optional[str] = None):
+        self.team_slug = team_slug
+        super().__init__(f"Timed out connecting to Lichess for team {team_slug}")
+
+
+class LichessConnectionError(LichessError):
+    """Raised when the connection to Lichess failed or broke off while reading a feed."""
+
+    def __init__(self, team_slug: Optional[str] = None, reason: Optional[BaseException] = None):
+        self.team_slug = team_slug
+        super().__init__(f"Connection to Lichess failed for team {team_slug}: {reason}")
+
+
+class LichessClient:
+    """A long-lived HTTP client with a keep-alive connection pool for Lichess."""
+
+    def __init__(
+        self,
+        pool_size: int = HTTP_CONF.get("pool_size", DEFAULT_POOL_SIZE),
+        per_host_limit: int = HTTP_CONF.get("per_host_limit", DEFAULT_PER_HOST_LIMIT),
+        dns_cache_ttl: int = HTTP_CONF.get("dns_cache_ttl", DEFAULT_DNS_CACHE_TTL),
+        keepalive_timeout: float = HTTP_CONF.get("keepalive_timeout", DEFAULT_KEEPALIVE_TIMEOUT),
+        connect_timeout: float = HTTP_CONF.get("connect_timeout", DEFAULT_CONNECT_TIMEOUT),
+        idle_timeout: float = HTTP_CONF.get("idle_timeout", DEFAULT_IDLE_TIMEOUT),
+        total_timeout: float = HTTP_CONF.get("total_timeout", DEFAULT_TOTAL_TIMEOUT),
+        max_retries: int = RATE_LIMIT_CONF.get("max_retries", DEFAULT_MAX_RETRIES),
+        governor: Optional[RateGovernor] = None,
+        session: Optional[aiohttp.ClientSession] = None,
+    ):
+        """Initialize the client. The session is created lazily on first use.
+
+        Args:
+            pool_size: Maximum number of open connections in the pool.
+            per_host_limit: Maximum number of concurrent connections to lichess.org.
+            dns_cache_ttl: How long resolved addresses are cached, in seconds.
+            keepalive_timeout: How long idle connections are kept open, in seconds.
+            connect_timeout: Maximum time to obtain a connection, in seconds.
+            idle_timeout: Maximum time between two chunks of a response, in seconds.
+            total_timeout: Hard deadline for reading one team feed, in seconds.
+            max_retries: How often a request answered with HTTP 429 is retried.
+            governor: Rate governor shared by all requests (a default one is created).
+            session: Optional pre-built session (mainly for tests).
+        """
+        self.pool_size = pool_size
+        self.per_host_limit = per_host_limit
+        self.dns_cache_ttl = dns_cache_ttl
+        self.keepalive_timeout = keepalive_timeout
+        self.connect_timeout = connect_timeout
+        self.idle_timeout = idle_timeout
+        self.total_timeout = total_timeout
+        self.max_retries = max_retries
+        self.governor = governor or RateGovernor()
+        self._session = session
+        # Outcome counters for team feed reads
+        self.stats: Dict[str, int] = {
+            "feeds_complete": 0,
+            "feeds_partial": 0,
+            "feeds_coalesced": 0,
+            "connect_timeouts": 0,
+            "connection_errors": 0,
+            "idle_timeouts": 0,
+            "deadline_timeouts": 0,
+        }
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """Return the pooled session, creating it if needed."""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_size,
+                limit_per_host=self.per_host_limit,
+                ttl_dns_cache=self.dns_cache_ttl,
+                keepalive_timeout=self.keepalive_timeout,
+            )
+            timeout = aiohttp.ClientTimeout(
+                total=None,
+                connect=self.connect_timeout,
+                sock_read=self.idle_timeout,
+            )
+            self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+            logger.debug(
+                f"Opened Lichess HTTP pool (limit={self.pool_size}, per_host={self.per_host_limit})"
+            )
+        return self._session
+
+    @staticmethod
+    def team_arena_url(team_slug: str) -> str:
+        """Return the arena tournaments endpoint for a team."""
+        return f"{LICHESS_BASE_URL}/api/team/{team_slug}/arena"
+
+    def get_team_arena(self, team_slug: str, max_tournaments: int = ARENA_MAX):
+        """Request only a team's created (upcoming) arena tournaments.
+
+        Returns the request context manager for the NDJSON stream.
+        """
+        params = {"status": "created", "max": max_tournaments}
+        return self.get(self.team_arena_url(team_slug), params=params)
+
+    @asynccontextmanager
+    async def get(self, url: str, **kwargs: Any):
+        """Issue a rate-governed GET request through the shared pool.
+
+        Used as ``async with client.get(url) as resp``. The governor slot is held
+        until the block exits, so streamed responses count toward the
+        concurrency cap. A 429 pauses all requests (honoring Retry-After) and
+        the request is retried up to ``max_retries`` times; after that the 429
+        response is handed to the caller.
+        """
+        attempt = 0
+        while True:
+            async with self.governor.slot():
+                async with self.session.get(url, **kwargs) as resp:
+                    if resp.status == 429:
+                        self.governor.on_rate_limited(resp.headers.get("Retry-After"))
+                        if attempt < self.max_retries:
+                            attempt += 1
+                            continue
+                    yield resp
+                    return
+
+    def record_feed(self, partial_reason: Optional[str] = None) -> None:
+        """Count the outcome of a team feed read.
+
+        Args:
+            partial_reason: None for a complete feed, otherwise "idle" or "deadline".
+        """
+        if partial_reason is None:
+            self.stats["feeds_complete"] += 1
+            return
+        self.stats["feeds_partial"] += 1
+        self.stats[f"{partial_reason}_timeouts"] += 1
+
+    def record_connect_timeout(self) -> None:
+        """Count a request that never produced a response."""
+        self.stats["connect_timeouts"] += 1
+
+    def record_connection_error(self) -> None:
+        """Count a feed whose connection failed or was reset."""
+        self.stats["connection_errors"] += 1
+
+    async def close(self) -> None:
+        """Close the pooled session and release all connections."""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+class Tournament:
+    """Compact record holding only the arena fields the event sync uses."""
+
+    __slots__ = ("id", "full_name", "starts_at", "finishes_at", "minutes", "increment")
+
+    def __init__(
+        self,
+        id: str,
+        full_name: Optional[str],
+        starts_at: int,
+        finishes_at: int,
+        minutes: Optional[int],
+        increment: int,
+    ):
+        self.id = id
+        self.full_name = full_name
+        self.starts_at = starts_at
+        self.finishes_at = finishes_at
+        self.minutes = minutes
+        self.increment = increment
+
+    @classmethod
+    def from_json(cls, data: Dict[str, Any]) -> "Tournament":
+        """Build a record from one parsed line of the arena feed.
+
+        A missing ``finishesAt`` defaults to one hour after the start.
+        """
+        starts_at = data.get("startsAt", 0)
+        return cls(
+            data["id"],
+            data.get("fullName"),
+            starts_at,
+            data.get("finishesAt", starts_at + 60 * 60 * 1000),
+            data.get("minutes"),
+            (data.get("clock") or {}).get("increment", 0),
+        )
+
+    def to_row(self) -> List[Any]:
+        """Serialize to a plain list (used by the cache snapshot)."""
+        return [getattr(self, field) for field in self.__slots__]
+
+    @classmethod
+    def from_row(cls, row: List[Any]) -> "Tournament":
+        """Rebuild a record written by ``to_row``."""
+        return cls(*row)
+
+    def __eq__(self, other: Any) -> bool:
+        if not isinstance(other, Tournament):
+            return NotImplemented
+        return self.to_row() == other.to_row()
+
+    def __repr__(self) -> str:
+        return f"Tournament(id={self.id!r}, starts_at={self.starts_at})"
+
+def feed_digest(tournaments: Iterable[Tournament]) -> str:
+    """Return a short hash of a team feed's content; equal feeds have equal digests."""
+    payload = json.dumps([t.to_row() for t in tournaments], separators=(",", ":"))
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+def is_finished(tournament: dict, now_ms: int) -> bool:
+    """Return True if a tournament from the arena feed is already over."""
+    if tournament.get("status") == STATUS_FINISHED:
+        return True
+    finishes_at = tournament.get("finishesAt")
+    return finishes_at is not None and finishes_at <= now_ms
+
+# Singleton client instance for use throughout the app
+lichess_client = LichessClient()
@@ -0,0 +1,237 @@
+"""
+Durable queue of Discord scheduled event writes waiting to be retried.
+"""
+import asyncio
+import os
+import time
+import yaml
+from typing import Any, Dict, List, Optional, Tuple
+
+import aiohttp
+import discord
+
+from .events import DesiredEvent
+from .utils import DATA_DIR, logger, read_snapshot, write_snapshot
+
+# Load outbox settings from config
+CONFIG_PATH = os.path.join(os.getcwd(), "config", "config.yaml")
+DEFAULT_BASE_DELAY = 5  # Seconds before the first retry
+DEFAULT_MAX_DELAY = 900  # Longest pause between retries, in seconds
+DEFAULT_MAX_ATTEMPTS = 8  # Retries before a write is left to the next scheduled sync
+
+OUTBOX_FILE = os.path.join(DATA_DIR, "outbox.json")
+OUTBOX_FILE_VERSION = 1
+
+try:
+    with open(CONFIG_PATH) as f:
+        config = yaml.safe_load(f) or {}
+    OUTBOX_CONF = config.get("performance", {}).get("outbox", {}) or {}
+except Exception:
+    OUTBOX_CONF = {}
+PERSIST = OUTBOX_CONF.get("persist", True)
+
+# Operations a pending write can carry
+CREATE = "create"
+UPDATE = "update"
+DELETE = "delete"
+
+
+def is_transient(error: BaseException) -> bool:
+    """Return True for a failed write that is worth retrying (timeouts, 5xx, 429, connection errors)."""
+    if isinstance(error, discord.HTTPException):
+        return error.status == 429 or error.status >= 500
+    return isinstance(error, (asyncio.TimeoutError, aiohttp.ClientError, OSError))
+
+
+class OutboxEntry:
+    """A pending write of one tournament's event in one guild."""
+
+    __slots__ = ("guild_id", "op", "tournament_id", "team", "event_id", "desired", "attempts", "next_attempt", "error")
+
+    def __init__(
+        self,
+        guild_id: int,
+        op: str,
+        tournament_id: str,
+        team: Optional[str] = None,
+        event_id: Optional[int] = None,
+        desired: Optional[DesiredEvent] = None,
+        attempts: int = 0,
+        next_attempt: float = 0.0,
+        error: Optional[str] = None,
+    ):
+        self.guild_id = guild_id
+        self.op = op
+        self.tournament_id = tournament_id
+        self.team = team
+        # Existing event (updates and deletes)
+        self.event_id = event_id
+        # Target state (creates and updates)
+        self.desired = desired
+        self.attempts = attempts
+        self.next_attempt = next_attempt
+        self.error = error
+
+    @property
+    def key(self) -> Tuple[int, str]:
+        return (self.guild_id, self.tournament_id)
+
+    def to_row(self) -> List[Any]:
+        """Serialize to a plain list (used by the outbox file)."""
+        return [
+            self.guild_id, self.op, self.tournament_id, self.team, self.event_id,
+            self.desired.to_row() if self.desired is not None else None,
+            self.attempts, self.next_attempt, self.error,
+        ]
+
+    @classmethod
+    def from_row(cls, row: List[Any]) -> "OutboxEntry":
+        """Rebuild an entry written by ``to_row``."""
+        guild_id, op, tournament_id, team, event_id, desired, attempts, next_attempt, error = row
+        desired_event = DesiredEvent.from_row(desired) if desired is not None else None
+        return cls(guild_id, op, tournament_id, team, event_id, desired_event, attempts, next_attempt, error)
+
+    def __repr__(self) -> str:
+        return f"OutboxEntry({self.op} {self.tournament_id!r} in {self.guild_id}, attempts={self.attempts})"
+
+
+class Outbox:
+    """Pending event writes keyed by (guild id, tournament id), persisted on every change.
+
+    A newer write for the same tournament replaces an older one, and a write
+    that a later sync applied is discarded. Failed retries back off
+    exponentially from ``base_delay`` up to ``max_delay``.
+    """
+
+    def __init__(
+        self,
+        persist_path: Optional[str] = OUTBOX_FILE if PERSIST else None,
+        base_delay: float = OUTBOX_CONF.get("base_delay_seconds", DEFAULT_BASE_DELAY),
+        max_delay: float = OUTBOX_CONF.get("max_delay_seconds", DEFAULT_MAX_DELAY),
+        max_attempts: int = OUTBOX_CONF.get("max_attempts", DEFAULT_MAX_ATTEMPTS),
+    ):
+        """Initialize an empty outbox. The file is loaded lazily on first use.
+
+        Args:
+            persist_path: File that keeps pending writes across restarts, or
+                None to keep them in memory only.
+            base_delay: Seconds before the first retry.
+            max_delay: Longest pause between retries, in seconds.
+            max_attempts: Retries before a write is dropped and left to the
+                next scheduled sync.
+        """
+        self.persist_path = persist_path
+        self.base_delay = base_delay
+        self.max_delay = max(base_delay, max_delay)
+        self.max_attempts = max(1, max_attempts)
+        self.entries: Dict[Tuple[int, str], OutboxEntry] = {}
+        self._loaded = persist_path is None
+        self.stats: Dict[str, int] = {
+            "queued": 0,
+            "retries": 0,
+            "applied": 0,
+            "already_applied": 0,
+            "dropped": 0,
+        }
+
+    def _ensure_loaded(self) -> None:
+        """Load the outbox file the first time the outbox is used."""
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            snapshot = read_snapshot(self.persist_path, OUTBOX_FILE_VERSION)
+            if snapshot is None:
+                return
+            for row in snapshot.get("entries", []):
+                entry = OutboxEntry.from_row(row)
+                self.entries.setdefault(entry.key, entry)
+            if self.entries:
+                logger.info(f"Loaded {len(self.entries)} pending event writes from {self.persist_path}")
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable outbox {self.persist_path}: {e}")
+
+    def _save(self) -> None:
+        """Write the outbox to disk (atomically, see ``write_snapshot``)."""
+        if not self.persist_path:
+            return
+        snapshot = {
+            "version": OUTBOX_FILE_VERSION,
+            "entries": [entry.to_row() for entry in self.entries.values()],
+        }
+        try:
+            write_snapshot(self.persist_path, snapshot)
+        except Exception as e:
+            logger.error(f"Failed to write outbox {self.persist_path}: {e}")
+
+    def add(self, entry: OutboxEntry, error: BaseException, now: Optional[float] = None) -> None:
+        """Queue a write that failed with a transient error, replacing any older one for the tournament."""
+        self._ensure_loaded()
+        now = time.time() if now is None else now
+        entry.error = str(error) or type(error).__name__
+        entry.next_attempt = now + self.base_delay
+        self.entries[entry.key] = entry
+        self.stats["queued"] += 1
+        self._save()
+
+    def discard(self, guild_id: int, tournament_ids) -> None:
+        """Drop pending writes that a newer plan supersedes."""
+        self._ensure_loaded()
+        dropped = [key for key in ((guild_id, tid) for tid in tournament_ids) if key in self.entries]
+        for key in dropped:
+            del self.entries[key]
+        if dropped:
+            self._save()
+
+    def discard_team(self, guild_id: int, team: str) -> None:
+        """Drop a guild's pending creates and updates for a team that was removed."""
+        self._ensure_loaded()
+        dropped = [key for key, entry in self.entries.items() if key[0] == guild_id and entry.team == team]
+        for key in dropped:
+            del self.entries[key]
+        if dropped:
+            self._save()
+
+    def due(self, now: Optional[float] = None) -> List[OutboxEntry]:
+        """Return the writes whose retry time has come, oldest first."""
+        self._ensure_loaded()
+        now = time.time() if now is None else now
+        return sorted(
+            (entry for entry in self.entries.values() if entry.next_attempt <= now),
+            key=lambda entry: entry.next_attempt,
+        )
+
+    def complete(self, entry: OutboxEntry, already_applied: bool = False) -> None:
+        """Remove a write that was applied (or found to be applied already)."""
+        self._ensure_loaded()
+        if self.entries.get(entry.key) is entry:
+            del self.entries[entry.key]
+            self._save()
+        self.stats["already_applied" if already_applied else "applied"] += 1
+
+    def retry_later(self, entry: OutboxEntry, error: BaseException, now: Optional[float] = None) -> None:
+        """Back off after a failed retry, or drop the write once it is out of attempts or not transient."""
+        self._ensure_loaded()
+        now = time.time() if now is None else now
+        if self.entries.get(entry.key) is not entry:
+            return
+        entry.attempts += 1
+        entry.error = str(error) or type(error).__name__
+        self.stats["retries"] += 1
+        if entry.attempts >= self.max_attempts or not is_transient(error):
+            del self.entries[entry.key]
+            self.stats["dropped"] += 1
+            logger.error(
+                f"Giving up on {entry.op} of tournament {entry.tournament_id} in guild {entry.guild_id} "
+                f"after {entry.attempts} retries: {entry.error}"
+            )
+        else:
+            entry.next_attempt = now + min(self.max_delay, self.base_delay * 2 ** entry.attempts)
+        self._save()
+
+    def __len__(self) -> int:
+        self._ensure_loaded()
+        return len(self.entries)
+
+# Singleton outbox for use throughout the app
+outbox = Outbox()
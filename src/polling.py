@@ -0,0 +1,153 @@
+"""
+Adaptive per-team polling of Lichess arena feeds.
+"""
+import heapq
+import os
+import time
+import yaml
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, List, Optional, Tuple
+
+from .lichess import Tournament, feed_digest
+from .utils import logger
+
+# Load polling settings from config
+CONFIG_PATH = os.path.join(os.getcwd(), "config", "config.yaml")
+DEFAULT_MIN_INTERVAL_MINUTES = 10  # Poll interval of a busy team
+DEFAULT_MAX_INTERVAL_MINUTES = 24 * 60  # Poll interval a quiet team backs off to
+DEFAULT_SOON_HOURS = 6  # Tournaments starting within this window keep a team on the fast interval
+DEFAULT_BUDGET_PER_HOUR = 120  # Lichess feed requests the poller may issue per hour
+
+try:
+    with open(CONFIG_PATH) as f:
+        config = yaml.safe_load(f) or {}
+    POLL_CONF = (config.get("scheduler", {}) or {}).get("adaptive_polling", {}) or {}
+except Exception:
+    POLL_CONF = {}
+
+
+class TeamPoller:
+    """Decides which team feeds are due for a poll.
+
+    Each team has its own interval: it drops to the minimum when the feed
+    changed or a tournament starts soon, and doubles after every poll that
+    found nothing new, up to the maximum. Next poll times are kept in a heap
+    and a sliding one-hour budget caps the requests the poller issues; teams
+    over budget stay due and are polled first once budget frees up.
+    """
+
+    def __init__(
+        self,
+        min_interval_minutes: float = POLL_CONF.get("min_interval_minutes", DEFAULT_MIN_INTERVAL_MINUTES),
+        max_interval_minutes: float = POLL_CONF.get("max_interval_minutes", DEFAULT_MAX_INTERVAL_MINUTES),
+        soon_hours: float = POLL_CONF.get("soon_hours", DEFAULT_SOON_HOURS),
+        budget_per_hour: int = POLL_CONF.get("budget_per_hour", DEFAULT_BUDGET_PER_HOUR),
+    ):
+        """Initialize an empty poller.
+
+        Args:
+            min_interval_minutes: Poll interval of a busy team, in minutes.
+            max_interval_minutes: Longest interval a quiet team backs off to, in minutes.
+            soon_hours: A team with a tournament starting within this many
+                hours is polled at the minimum interval.
+            budget_per_hour: Maximum number of polls per rolling hour.
+        """
+        self.min_interval = min_interval_minutes * 60
+        self.max_interval = max(self.min_interval, max_interval_minutes * 60)
+        self.soon_seconds = soon_hours * 3600
+        self.budget_per_hour = max(1, budget_per_hour)
+        # (next poll time, team slug); entries whose time no longer matches are stale
+        self._heap: List[Tuple[float, str]] = []
+        # team slug -> (next poll time, current interval, last feed digest)
+        self._teams: Dict[str, Tuple[float, float, Optional[str]]] = {}
+        self._recent_polls: Deque[float] = deque()
+        self.stats: Dict[str, Any] = {
+            "polls": 0,
+            "changes": 0,
+            "failures": 0,
+            "over_budget": 0,
+        }
+
+    def _schedule(self, team: str, next_at: float, interval: float, digest: Optional[str]) -> None:
+        self._teams[team] = (next_at, interval, digest)
+        heapq.heappush(self._heap, (next_at, team))
+
+    def track(self, teams: Iterable[str], now: Optional[float] = None) -> None:
+        """Set the teams to poll; new teams are due at once, dropped teams are forgotten."""
+        now = time.time() if now is None else now
+        wanted = set(teams)
+        for team in [t for t in self._teams if t not in wanted]:
+            # Its heap entry is skipped once it comes up
+            del self._teams[team]
+        for team in wanted:
+            if team not in self._teams:
+                self._schedule(team, now, self.min_interval, None)
+
+    def _budget_left(self, now: float) -> int:
+        while self._recent_polls and self._recent_polls[0] <= now - 3600:
+            self._recent_polls.popleft()
+        return self.budget_per_hour - len(self._recent_polls)
+
+    def due(self, now: Optional[float] = None) -> List[str]:
+        """Return the teams due for a poll, earliest first, within the remaining budget.
+
+        Returned teams are charged against the budget.
+        """
+        now = time.time() if now is None else now
+        budget = self._budget_left(now)
+        teams: List[str] = []
+        while self._heap and self._heap[0][0] <= now:
+            next_at, team = self._heap[0]
+            state = self._teams.get(team)
+            if state is None or state[0] != next_at:
+                heapq.heappop(self._heap)
+                continue
+            if len(teams) >= budget:
+                self.stats["over_budget"] += 1
+                break
+            heapq.heappop(self._heap)
+            teams.append(team)
+            self._recent_polls.append(now)
+        return teams
+
+    def record(self, team: str, tournaments: Optional[List[Tournament]], now: Optional[float] = None) -> bool:
+        """Record the outcome of a poll and schedule the team's next one.
+
+        Args:
+            team: The Lichess team slug.
+            tournaments: The fetched feed, or None if the fetch failed.
+            now: Current time, in seconds since the epoch.
+
+        Returns:
+            True if the feed differs from the previous poll.
+        """
+        now = time.time() if now is None else now
+        if team not in self._teams:
+            return False
+        _, interval, digest = self._teams[team]
+        self.stats["polls"] += 1
+        if tournaments is None:
+            # Back off from a failing feed like from a quiet one
+            self.stats["failures"] += 1
+            interval = min(self.max_interval, interval * 2)
+            self._schedule(team, now + interval, interval, digest)
+            return False
+        new_digest = feed_digest(tournaments)
+        changed = digest is not None and new_digest != digest
+        starts_soon = any(t.starts_at / 1000 - now <= self.soon_seconds for t in tournaments)
+        if changed or starts_soon:
+            interval = self.min_interval
+        else:
+            interval = min(self.max_interval, interval * 2)
+        if changed:
+            self.stats["changes"] += 1
+            logger.debug(f"Feed of team {team} changed; next poll in {interval / 60:.0f} min")
+        self._schedule(team, now + interval, interval, new_digest)
+        return changed
+
+    def intervals(self) -> Dict[str, float]:
+        """Return each tracked team's current poll interval, in minutes."""
+        return {team: interval / 60 for team, (_, interval, _) in self._teams.items()}
+
+# Singleton poller for use throughout the app
+team_poller = TeamPoller()
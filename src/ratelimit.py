@@ -0,0 +1,162 @@
+"""
+Rate limiting for outbound Lichess API requests.
+"""
+import asyncio
+import os
+import time
+import yaml
+from contextlib import asynccontextmanager
+from typing import Dict, Optional, Any, Tuple
+
+from .utils import logger
+
+# Load rate limit settings from config
+CONFIG_PATH = os.path.join(os.getcwd(), "config", "config.yaml")
+DEFAULT_REQUESTS_PER_SECOND = 2.0
+DEFAULT_BURST = 4
+DEFAULT_MAX_CONCURRENT = 2
+DEFAULT_BACKOFF_SECONDS = 60  # Lichess asks clients to wait a full minute after a 429
+
+try:
+    with open(CONFIG_PATH) as f:
+        config = yaml.safe_load(f) or {}
+    RATE_LIMIT_CONF = config.get("performance", {}).get("rate_limit", {}) or {}
+except Exception:
+    RATE_LIMIT_CONF = {}
+
+
+class TokenBucket:
+    """A token bucket that hands out reservations instead of blocking."""
+
+    def __init__(self, rate: float, capacity: float):
+        """Initialize a full bucket.
+
+        Args:
+            rate: Tokens added per second.
+            capacity: Maximum number of tokens (burst size).
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self) -> float:
+        """Take one token and return how long the caller must wait before using it."""
+        self._refill()
+        self.tokens -= 1
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.rate
+
+    def drain(self) -> None:
+        """Drop all accumulated tokens (used after the server pushed back)."""
+        self._refill()
+        self.tokens = min(self.tokens, 0.0)
+
+
+class RateGovernor:
+    """Shared gate in front of every Lichess request.
+
+    Combines a token bucket (sustained rate and burst), a global concurrency
+    cap and a pause that is set whenever Lichess answers with HTTP 429.
+    """
+
+    def __init__(
+        self,
+        requests_per_second: float = RATE_LIMIT_CONF.get("requests_per_second", DEFAULT_REQUESTS_PER_SECOND),
+        burst: int = RATE_LIMIT_CONF.get("burst", DEFAULT_BURST),
+        max_concurrent: int = RATE_LIMIT_CONF.get("max_concurrent", DEFAULT_MAX_CONCURRENT),
+        backoff_seconds: float = RATE_LIMIT_CONF.get("backoff_seconds", DEFAULT_BACKOFF_SECONDS),
+    ):
+        """Initialize the governor.
+
+        Args:
+            requests_per_second: Sustained request rate.
+            burst: Number of requests allowed back to back above the sustained rate.
+            max_concurrent: Maximum number of requests in flight at once.
+            backoff_seconds: Pause after a 429 that has no Retry-After header.
+        """
+        self.bucket = TokenBucket(requests_per_second, max(1, burst))
+        self.max_concurrent = max_concurrent
+        self.backoff_seconds = backoff_seconds
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._paused_until = 0.0
+        self.stats: Dict[str, Any] = {
+            "requests": 0,
+            "throttle_waits": 0,
+            "throttle_wait_seconds": 0.0,
+            "rate_limited": 0,
+        }
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        # Created lazily so it binds to the running event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(max(1, self.max_concurrent))
+        return self._semaphore
+
+    def _wait_time(self) -> Tuple[float, bool]:
+        """Return how long to wait, and whether a token was reserved (False during a 429 pause)."""
+        pause = max(0.0, self._paused_until - time.monotonic())
+        if pause:
+            return pause, False
+        return self.bucket.reserve(), True
+
+    async def acquire(self) -> None:
+        """Wait for a concurrency slot, then for the rate limit to allow one request."""
+        await self.semaphore.acquire()
+        try:
+            while True:
+                wait, reserved = self._wait_time()
+                if wait <= 0:
+                    break
+                self.stats["throttle_waits"] += 1
+                self.stats["throttle_wait_seconds"] += wait
+                await asyncio.sleep(wait)
+                # After a 429 pause a token still has to be reserved; a reservation is
+                # ours once waited out, unless a 429 arrived while sleeping
+                if reserved and self._paused_until <= time.monotonic():
+                    break
+        except BaseException:
+            self.semaphore.release()
+            raise
+        self.stats["requests"] += 1
+
+    def release(self) -> None:
+        """Give back the concurrency slot."""
+        self.semaphore.release()
+
+    @asynccontextmanager
+    async def slot(self):
+        """Hold one rate-limited request slot for the duration of the block."""
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def on_rate_limited(self, retry_after: Optional[str] = None) -> float:
+        """Pause all requests after an HTTP 429.
+
+        Args:
+            retry_after: Value of the Retry-After header, if present.
+
+        Returns:
+            The pause applied, in seconds.
+        """
+        delay = self.backoff_seconds
+        if retry_after:
+            try:
+                delay = max(0.0, float(retry_after))
+            except ValueError:
+                pass
+        self._paused_until = max(self._paused_until, time.monotonic() + delay)
+        self.bucket.drain()
+        self.stats["rate_limited"] += 1
+        logger.warning(f"Lichess rate limit hit (HTTP 429); pausing requests for {delay:.0f}s")
+        return delay
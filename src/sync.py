@@ -1,19 +1,22 @@
-from typing import Optional, Tuple, List, Dict, Any
-import aiohttp
+from typing import Optional, Tuple, List, Dict, Any, Callable
 import asyncio
+import aiohttp
 import discord
 from discord.ext import commands
 from datetime import datetime, timezone
 import json
 import logging
 from .utils import logger
+from .batching import discord_batcher, lichess_batcher
 from .cache import cache
-
-# For test environment detection
-try:
-    from unittest.mock import AsyncMock
-except ImportError:
-    AsyncMock = None  # Not available in production environments
+from .events import DesiredEvent, EventPlan, IndexedEvent, build_plan, edit_churn, index_scheduled_events
+from .event_index import event_index
+from .team_health import team_health, MISSING_STATUSES
+from .outbox import outbox, OutboxEntry, is_transient, CREATE, UPDATE, DELETE
+from .lichess import (
+    lichess_client, is_finished, Tournament, LichessError, LichessAPIError, LichessTimeoutError,
+    LichessConnectionError,
+)
 
 async def log_to_notification_channel(guild: discord.Guild, SETTINGS: dict, message: str, event_type=None):
     # Sanitize message for security
@@ -44,6 +47,698 @@ async def log_to_notification_channel(guild: discord.Guild, SETTINGS: dict, mess
     except discord.Forbidden:
         print(f"[{guild.name}] 🚫 Forbidden sending to channel {chan_id}")
 
+async def _read_team_feed(
+    team: str,
+    verbose: bool,
+    label: str,
+    on_tournament: Optional[Callable[[Tournament], None]] = None,
+) -> Tuple[List[Tournament], Optional[str]]:
+    """
+    Read a team's arena stream and return its upcoming tournaments.
+    
+    Reading is bounded by the client's idle timeout (maximum gap between
+    lines) and total deadline. A feed cut short by either is partial and is
+    not cached; only a feed read to its end (or to the first finished
+    tournament) is stored. The returned list is the one stored in the cache.
+    ``on_tournament`` is called with each upcoming tournament as soon as it
+    is parsed, while the rest of the feed is still being read.
+    
+    Returns:
+        Tuple of (tournaments, partial reason): the reason is "idle" or
+        "deadline" for a partial feed and None for a complete one.
+    """
+    all_tournaments = []
+    now_ms = int(datetime.now(timezone.utc).timestamp() * 1000)
+    loop = asyncio.get_running_loop()
+    partial_reason = None
+    try:
+        async with lichess_client.get_team_arena(team) as resp:
+            if resp.status != 200:
+                raise LichessAPIError(resp.status, team)
+            # The deadline covers reading the body; connecting is bounded separately
+            deadline = loop.time() + lichess_client.total_timeout
+            
+            # Parse stream and keep upcoming tournaments
+            while True:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    partial_reason = "deadline"
+                    break
+                try:
+                    line = await asyncio.wait_for(
+                        resp.content.readline(), timeout=min(lichess_client.idle_timeout, remaining)
+                    )
+                except asyncio.TimeoutError:
+                    partial_reason = "deadline" if loop.time() >= deadline else "idle"
+                    break
+                if not line:
+                    if verbose:
+                        print(f"[{label}] Stream closed for team {team}, ending.")
+                    break
+                raw = line.decode().strip()
+                if not raw:
+                    continue
+                if verbose:
+                    print(f"[{label}] RAW LINE: {raw}")
+                try:
+                    data = json.loads(raw)
+                    if not isinstance(data, dict) or "id" not in data:
+                        raise ValueError("not a tournament")
+                except ValueError:
+                    if verbose:
+                        print(f"[{label}] ⚠️ JSON error, skipping.")
+                    continue
+                if is_finished(data, now_ms):
+                    # Everything after this point is history; stop downloading it
+                    if verbose:
+                        print(f"[{label}] Reached finished tournament {data['id']}, ending team {team}.")
+                    resp.close()
+                    break
+                if data.get("startsAt", 0) <= now_ms:
+                    if verbose:
+                        print(f"[{label}] Tournament {data['id']} already started, skipping.")
+                    continue
+                # Keep only the compact record; the parsed dict is dropped here
+                tournament = Tournament.from_json(data)
+                all_tournaments.append(tournament)
+                if on_tournament is not None:
+                    on_tournament(tournament)
+            if partial_reason:
+                resp.close()
+    except asyncio.TimeoutError as e:
+        # Reads inside the stream handle their own timeouts; this is connect/headers
+        lichess_client.record_connect_timeout()
+        raise LichessTimeoutError(team) from e
+    except aiohttp.ClientError as e:
+        # Refused or reset connections and broken payloads; what was read is incomplete
+        lichess_client.record_connection_error()
+        raise LichessConnectionError(team, e) from e
+    
+    lichess_client.record_feed(partial_reason)
+    if partial_reason:
+        logger.warning(
+            f"Partial feed for team {team} ({partial_reason} timeout after "
+            f"{len(all_tournaments)} tournaments); not caching"
+        )
+    else:
+        # Store in cache for future use
+        cache.set_tournaments(team, all_tournaments)
+    return all_tournaments, partial_reason
+
+# In-flight team feed fetches keyed by slug, so concurrent callers share one request
+_inflight_feeds: Dict[str, asyncio.Future] = {}
+
+def _record_health(team: str, error: Optional[LichessError] = None, partial: bool = False) -> None:
+    """Record the outcome of a team feed fetch in the team's health."""
+    if isinstance(error, LichessAPIError):
+        if error.status in MISSING_STATUSES:
+            team_health.record_missing(team, error.status)
+        elif error.status >= 500:
+            team_health.record_failure(team)
+    elif isinstance(error, (LichessTimeoutError, LichessConnectionError)) or partial:
+        # A feed cut short by a timeout is not a healthy answer either
+        team_health.record_failure(team)
+    elif error is None:
+        team_health.record_success(team)
+
+def _retrieve_exception(future: asyncio.Future) -> None:
+    # Mark the shared result as retrieved even when no follower was waiting
+    if not future.cancelled():
+        future.exception()
+
+async def read_team_tournaments(
+    team: str,
+    verbose: bool = False,
+    label: str = "lichess",
+    on_tournament: Optional[Callable[[Tournament], None]] = None,
+) -> List[Tournament]:
+    """
+    Read a team's upcoming arena tournaments from Lichess.
+    
+    Fetches are single-flight: while one caller is reading a team, any
+    other caller for the same slug waits for that fetch and receives its
+    result instead of sending a second request. Only the caller that made
+    the request records its outcome in the team's health, so one fetch
+    counts once however many callers shared it.
+    
+    Args:
+        team: The Lichess team slug.
+        verbose: Print per-line progress.
+        label: Prefix for console output (usually the guild name).
+        on_tournament: Called with each tournament while the feed is read.
+            A caller joining an in-flight fetch is not called back; it gets
+            the whole list once the fetch completes.
+        
+    Raises:
+        LichessAPIError: If Lichess answered with a non-200 status.
+        LichessTimeoutError: If Lichess could not be reached in time.
+        LichessConnectionError: If the connection failed or broke off mid-feed.
+    """
+    shared = _inflight_feeds.get(team)
+    if shared is not None:
+        lichess_client.stats["feeds_coalesced"] += 1
+        if verbose:
+            print(f"[{label}] Joining in-flight fetch for team {team}")
+        return await asyncio.shield(shared)
+    
+    shared = asyncio.get_running_loop().create_future()
+    shared.add_done_callback(_retrieve_exception)
+    _inflight_feeds[team] = shared
+    try:
+        tournaments, partial_reason = await _read_team_feed(team, verbose, label, on_tournament)
+        _record_health(team, partial=partial_reason is not None)
+        shared.set_result(tournaments)
+        return tournaments
+    except BaseException as e:
+        if isinstance(e, LichessError):
+            _record_health(team, e)
+            shared.set_exception(e)
+        else:
+            shared.set_exception(LichessError(f"Fetch for team {team} did not complete"))
+        raise
+    finally:
+        if _inflight_feeds.get(team) is shared:
+            del _inflight_feeds[team]
+
+async def fetch_team_tournaments(
+    team: str,
+    verbose: bool = False,
+    label: str = "lichess",
+    on_tournament: Optional[Callable[[Tournament], None]] = None,
+) -> Optional[List[Tournament]]:
+    """
+    Download a team's upcoming arena tournaments from Lichess and store them in the cache.
+    
+    Only created tournaments are requested, and reading stops as soon as the
+    stream reaches a finished tournament. Teams that recently answered
+    404/410, or whose circuit is open after repeated 5xx errors, timeouts or
+    connection errors,
+    are not requested at all.
+    
+    Args:
+        team: The Lichess team slug.
+        verbose: Print per-line progress.
+        label: Prefix for console output (usually the guild name).
+        on_tournament: Called with each tournament while the feed is read.
+        
+    Returns:
+        List of tournament records, or None if Lichess returned an error, timed
+        out, or the team is being skipped. A complete feed is returned as the
+        very list stored in the cache, so every guild syncing the team reuses
+        its rendered events and digest.
+    """
+    skip_reason = team_health.check(team)
+    if skip_reason:
+        if verbose:
+            print(f"[{label}] Skipping team {team}: {skip_reason}")
+        return None
+    try:
+        tournaments = await read_team_tournaments(team, verbose=verbose, label=label, on_tournament=on_tournament)
+    except LichessError as e:
+        print(f"[{label}] ⚠️ {e}")
+        return None
+    return tournaments
+
+# Background stale-while-revalidate refreshes keyed by slug
+_refresh_tasks: Dict[str, asyncio.Task] = {}
+
+def _schedule_refresh(team: str) -> None:
+    """Refresh a team's cache entry in the background unless a fetch is already running."""
+    if team in _refresh_tasks or team in _inflight_feeds:
+        return
+    task = asyncio.create_task(fetch_team_tournaments(team, label="refresh"))
+    _refresh_tasks[team] = task
+    
+    def _done(t: asyncio.Task) -> None:
+        _refresh_tasks.pop(team, None)
+        if not t.cancelled() and t.exception():
+            logger.error(f"Background refresh failed for team {team}: {t.exception()}")
+    task.add_done_callback(_done)
+
+def get_cached_tournaments(
+    team: str, verbose: bool = False, label: str = "lichess"
+) -> Optional[List[Tournament]]:
+    """
+    Look up a team in the cache using stale-while-revalidate.
+    
+    A fresh entry is returned as is. An expired entry still inside the
+    stale grace window is returned immediately and a background refresh is
+    started, so callers never block on Lichess for it.
+    
+    Returns:
+        Cached tournaments (fresh or stale), or None on a cache miss.
+    """
+    tournaments, is_stale = cache.lookup(team)
+    if tournaments is not None and is_stale:
+        if verbose:
+            print(f"[{label}] Serving stale cache for team {team}, refreshing in background")
+        _schedule_refresh(team)
+    return tournaments
+
+async def fetch_tournaments_for_teams(
+    team_slugs: List[str], refresh: bool = False,
+) -> Dict[str, Optional[List[Tournament]]]:
+    """
+    Fetch each distinct team feed exactly once for a sync cycle.
+    
+    Feeds missing from the cache are fetched through the shared Lichess batcher.
+    
+    Args:
+        team_slugs: Team slugs collected from all guilds (duplicates allowed).
+        refresh: Fetch every feed from Lichess even if it is cached.
+        
+    Returns:
+        Dict mapping each distinct slug to its tournaments, or None if the fetch failed.
+    """
+    team_feeds: Dict[str, Optional[List[Tournament]]] = dict.fromkeys(team_slugs)
+    to_fetch = []
+    for team in team_feeds:
+        cached_tournaments = None if refresh else cache.get_tournaments(team)
+        if cached_tournaments is not None:
+            team_feeds[team] = cached_tournaments
+        else:
+            to_fetch.append(team)
+    results = await lichess_batcher.run(to_fetch, fetch_team_tournaments)
+    for team, result in zip(to_fetch, results):
+        if isinstance(result, BaseException):
+            logger.error(f"Error fetching tournaments for team {team}: {result}")
+        else:
+            team_feeds[team] = result
+    return team_feeds
+
+async def _tournaments_for_team(
+    team: str,
+    guild: discord.Guild,
+    verbose: bool,
+    prefetched_tournaments: Optional[Dict[str, Optional[List[Tournament]]]],
+    on_tournament: Optional[Callable[[Tournament], None]] = None,
+) -> Optional[List[Tournament]]:
+    """
+    Resolve one team's tournaments for a guild sync.
+    
+    Uses the cycle's shared fan-out result if one was provided, otherwise the
+    cache, otherwise the Lichess API. Only a feed read from the API calls
+    ``on_tournament`` while it is read.
+    
+    Returns:
+        The team's tournaments, or None if its feed could not be fetched.
+    """
+    if verbose:
+        print(f"[{guild.name}] Starting sync for team '{team}'")
+    if prefetched_tournaments is not None and team in prefetched_tournaments:
+        shared_feed = prefetched_tournaments[team]
+        if shared_feed is None:
+            # The shared fetch already failed for this team this cycle
+            return None
+        if verbose:
+            print(f"[{guild.name}] Using pre-fetched tournaments for team {team}")
+        return shared_feed
+    
+    cached_tournaments = get_cached_tournaments(team, verbose=verbose, label=guild.name)
+    if cached_tournaments is not None:
+        if verbose:
+            print(f"[{guild.name}] Cache hit for team {team}, using cached data")
+        return cached_tournaments
+    
+    if verbose:
+        print(f"[{guild.name}] Cache miss for team {team}, fetching from API")
+    return await fetch_team_tournaments(team, verbose=verbose, label=guild.name, on_tournament=on_tournament)
+
+async def existing_events_for_guild(
+    guild: discord.Guild,
+    prefetched_events: Optional[List[discord.ScheduledEvent]] = None,
+    verbose: bool = False,
+    verify: bool = False,
+) -> Dict[str, IndexedEvent]:
+    """
+    Return a guild's existing Lichess events by tournament id.
+    
+    A provided event list rebuilds the guild's event index. With ``verify``
+    set the events are always listed over REST. Otherwise the scheduled
+    events discord.py keeps from gateway dispatches are used when they look
+    complete, then the index when it is current, and only then a REST list.
+    
+    Raises:
+        discord.Forbidden: If the guild's events could not be listed.
+    """
+    if prefetched_events is not None:
+        if verbose:
+            print(f"[{guild.name}] Using pre-fetched events ({len(prefetched_events)} events)")
+        return event_index.replace_guild(guild.id, prefetched_events)
+    cached_events = None if verify else event_index.gateway_events(guild)
+    if cached_events is not None:
+        if verbose:
+            print(f"[{guild.name}] Using gateway event cache ({len(cached_events)} events)")
+        event_index.stats["gateway_lists"] += 1
+        return event_index.replace_guild(guild.id, cached_events)
+    if not verify and not event_index.needs_verification(guild.id):
+        if verbose:
+            print(f"[{guild.name}] Using event index")
+        return event_index.existing(guild.id)
+    event_index.stats["rest_lists"] += 1
+    events = await guild.fetch_scheduled_events(with_counts=False)
+    return event_index.replace_guild(guild.id, events)
+
+async def _resolve_event(guild: discord.Guild, entry: IndexedEvent) -> Optional[discord.ScheduledEvent]:
+    """Return the event object for an existing entry, or None if it no longer exists."""
+    if entry.event is not None:
+        return entry.event
+    event = guild.get_scheduled_event(entry.event_id)
+    if event is None:
+        try:
+            event = await guild.fetch_scheduled_event(entry.event_id)
+        except discord.NotFound:
+            return None
+    return event
+
+async def _create_event(guild: discord.Guild, desired: DesiredEvent) -> Optional[discord.ScheduledEvent]:
+    """Create a tournament's event and record it in the event index."""
+    created = await guild.create_scheduled_event(
+        name=desired.name,
+        description=desired.description,
+        start_time=desired.start_time,
+        end_time=desired.end_time,
+        entity_type=discord.EntityType.external,
+        location=desired.url,
+        privacy_level=discord.PrivacyLevel.guild_only
+    )
+    if created is not None:
+        event_index.record(guild.id, desired.tournament_id, created.id, desired.content_hash)
+    return created
+
+async def _edit_event(guild: discord.Guild, ev: discord.ScheduledEvent, event_id: int, desired: DesiredEvent) -> None:
+    """Bring an existing event to its desired state and record it in the event index."""
+    await ev.edit(
+        name=desired.name,
+        description=desired.description,
+        start_time=desired.start_time,
+        end_time=desired.end_time,
+        entity_type=discord.EntityType.external,
+        location=desired.url,
+        privacy_level=discord.PrivacyLevel.guild_only
+    )
+    event_index.record(guild.id, desired.tournament_id, event_id, desired.content_hash)
+
+def _queue_retry(entry: OutboxEntry, error: BaseException) -> str:
+    """Queue a failed write in the outbox if the error is transient. Returns a note for the console."""
+    if not is_transient(error):
+        return ""
+    outbox.add(entry, error)
+    return " (queued for retry)"
+
+async def execute_plan(
+    guild: discord.Guild, SETTINGS: dict, plan: EventPlan, verbose: bool = False
+) -> Tuple[list[str], list[str], int]:
+    """
+    Apply a reconciliation plan to a guild's scheduled events.
+    
+    Updates, creates and deletes each go through the shared Discord batcher;
+    every successful write is recorded in the event index and the tournament
+    ids of failed operations are added to ``plan.failed``. Writes that failed
+    with a transient error are queued in the outbox for a quick retry; the
+    plan supersedes any write still pending for its tournaments.
+    
+    Args:
+        guild: The Discord guild.
+        SETTINGS: Bot settings (used for notifications).
+        plan: The plan built by ``build_plan``.
+        verbose: Print each operation.
+        
+    Returns:
+        Tuple of (created event URLs, updated event URLs, number of deleted events).
+    """
+    created_events: list[str] = []
+    updated_events: list[str] = []
+    deleted = 0
+    creates = list(plan.creates)
+    for desired, entry in plan.unchanged:
+        edit_churn.record_unchanged(guild.id, desired)
+    outbox.discard(guild.id, [desired.tournament_id for _, desired in plan.creates])
+    outbox.discard(guild.id, [desired.tournament_id for _, desired, _ in plan.updates])
+    outbox.discard(guild.id, [desired.tournament_id for desired, _ in plan.unchanged])
+    outbox.discard(guild.id, [tournament_id for tournament_id, _ in plan.deletes])
+
+    async def update_event(op):
+        team, desired, entry = op
+        ev = await _resolve_event(guild, entry)
+        if ev is None:
+            # Deleted behind our back; create it again
+            event_index.forget(guild.id, desired.tournament_id, entry.event_id)
+            return False
+        await _edit_event(guild, ev, entry.event_id, desired)
+        await log_to_notification_channel(
+            guild, SETTINGS, f"Updated event for {team}: {desired.name} ({desired.tournament_id})", "update"
+        )
+        edit_churn.record_edit(guild.id, desired)
+        return True
+
+    async def create_event(op):
+        team, desired = op
+        await _create_event(guild, desired)
+
+    async def delete_event(op):
+        tournament_id, entry = op
+        ev = await _resolve_event(guild, entry)
+        if ev is not None:
+            await ev.delete()
+        event_index.forget(guild.id, tournament_id, entry.event_id)
+        return ev
+
+    results = await discord_batcher.run(plan.updates, update_event)
+    for (team, desired, entry), result in zip(plan.updates, results):
+        if isinstance(result, BaseException):
+            plan.failed.append(desired.tournament_id)
+            queued = _queue_retry(OutboxEntry(guild.id, UPDATE, desired.tournament_id, team, entry.event_id, desired), result)
+            print(f"[{guild.name}] ⚠️ Error updating {desired.url}: {result}{queued}")
+        elif result:
+            updated_events.append(desired.url)
+            if verbose:
+                print(f"[{guild.name}] 🔄 Updated event {desired.url}")
+        else:
+            creates.append((team, desired))
+    results = await discord_batcher.run(creates, create_event)
+    for (team, desired), result in zip(creates, results):
+        if isinstance(result, BaseException):
+            plan.failed.append(desired.tournament_id)
+        if isinstance(result, discord.Forbidden):
+            if verbose:
+                print(f"[{guild.name}] ❌ Forbidden when creating {desired.url}")
+        elif isinstance(result, BaseException):
+            queued = _queue_retry(OutboxEntry(guild.id, CREATE, desired.tournament_id, team, None, desired), result)
+            print(f"[{guild.name}] ⚠️ Error when creating {desired.url}: {result}{queued}")
+        else:
+            created_events.append(desired.url)
+            if verbose:
+                print(f"[{guild.name}] 📅 New event created: {desired.name} ({desired.tournament_id})")
+    results = await discord_batcher.run(plan.deletes, delete_event)
+    for (tournament_id, entry), result in zip(plan.deletes, results):
+        if isinstance(result, BaseException):
+            plan.failed.append(tournament_id)
+            queued = _queue_retry(OutboxEntry(guild.id, DELETE, tournament_id, None, entry.event_id), result)
+            print(f"[{guild.name}] ⚠️ Error deleting event for tournament {tournament_id}: {result}{queued}")
+        elif result is not None:
+            deleted += 1
+            if verbose:
+                print(f"[{guild.name}] 🗑️ Deleted event {result.location}")
+    return created_events, updated_events, deleted
+
+class _EarlyCreates:
+    """Creates a guild's new tournaments while their team feeds are still being read.
+
+    A tournament the guild has no event for needs a create whatever the rest
+    of the feed holds, so it is planned on its own (such a plan has no
+    updates or deletes) and executed in the background through the Discord
+    batcher while the reader moves on. Tournaments parsed while a batch is
+    being written are planned together as the next batch. The full plan built
+    once every feed is read finds these events in the event index.
+    """
+
+    __slots__ = ("guild", "SETTINGS", "existing", "verbose", "pending", "seen", "plans", "created", "worker")
+
+    def __init__(
+        self,
+        guild: discord.Guild,
+        SETTINGS: dict,
+        existing: Optional[Dict[str, IndexedEvent]],
+        verbose: bool = False,
+    ):
+        """Initialize for one guild sync.
+
+        Args:
+            guild: The Discord guild.
+            SETTINGS: Bot settings (used for notifications).
+            existing: The guild's listed events by tournament id, or None to
+                look tournaments up in the event index (when it is current).
+            verbose: Print each operation.
+        """
+        self.guild = guild
+        self.SETTINGS = SETTINGS
+        self.existing = existing
+        self.verbose = verbose
+        self.pending: List[Tuple[str, DesiredEvent]] = []
+        self.seen: set = set()
+        self.plans: List[EventPlan] = []
+        self.created: List[str] = []
+        self.worker: Optional[asyncio.Task] = None
+
+    def for_team(self, team: str) -> Callable[[Tournament], None]:
+        """Return the callback that plans a team's tournaments as they are parsed."""
+        def on_tournament(tournament: Tournament) -> None:
+            if tournament.id in self.seen:
+                return
+            self.seen.add(tournament.id)
+            if self.existing is not None:
+                known = self.existing.get(tournament.id)
+            else:
+                known = event_index.get(self.guild.id, tournament.id)
+            if known is not None:
+                # Updates wait for the full plan
+                return
+            self.pending.append((team, DesiredEvent.from_tournament(tournament)))
+            if self.worker is None or self.worker.done():
+                self.worker = asyncio.create_task(self._run())
+        return on_tournament
+
+    async def _run(self) -> None:
+        while self.pending:
+            desired_by_team: Dict[str, List[DesiredEvent]] = {}
+            for team, desired in self.pending:
+                desired_by_team.setdefault(team, []).append(desired)
+            self.pending = []
+            plan = build_plan(self.existing or {}, desired_by_team, datetime.now(timezone.utc))
+            if not plan.creates:
+                continue
+            if self.verbose:
+                print(f"[{self.guild.name}] Creating {len(plan.creates)} events while feeds are read")
+            self.plans.append(plan)
+            created, _, _ = await execute_plan(self.guild, self.SETTINGS, plan, self.verbose)
+            self.created.extend(created)
+
+    @property
+    def failed(self) -> bool:
+        """Return True if any early create failed."""
+        return any(plan.failed for plan in self.plans)
+
+    @property
+    def attempted(self) -> set:
+        """Return the tournament ids of every early create, successful or not."""
+        return {desired.tournament_id for plan in self.plans for _, desired in plan.creates}
+
+    async def finish(self) -> List[str]:
+        """Wait for the creates still running and add them to the listed events.
+
+        Returns:
+            URLs of the events created.
+        """
+        if self.worker is not None:
+            await self.worker
+        if self.existing is not None:
+            for plan in self.plans:
+                for _, desired in plan.creates:
+                    entry = event_index.get(self.guild.id, desired.tournament_id)
+                    if entry is not None:
+                        self.existing[desired.tournament_id] = entry
+        return self.created
+
+# Per-guild locks serializing event reconciles
+_guild_locks: Dict[int, asyncio.Lock] = {}
+
+def guild_lock(guild_id: int) -> asyncio.Lock:
+    """Return the lock held while a guild's scheduled events are being reconciled."""
+    lock = _guild_locks.get(guild_id)
+    if lock is None:
+        lock = _guild_locks[guild_id] = asyncio.Lock()
+    return lock
+
+async def _find_created_event(guild: discord.Guild, desired: DesiredEvent) -> Optional[IndexedEvent]:
+    """Look for an event a timed-out create may have made after all.
+
+    The guild's events are always listed over REST: the gateway dispatch for
+    the event may not have arrived yet, and the gateway cache cannot tell.
+    """
+    events = await guild.fetch_scheduled_events(with_counts=False)
+    event_index.stats["rest_lists"] += 1
+    return index_scheduled_events(events).get(desired.tournament_id)
+
+async def _retry_write(guild: discord.Guild, entry: OutboxEntry) -> bool:
+    """Apply a queued write unless it already took effect. Returns True if it had."""
+    if entry.op == DELETE:
+        ev = await _resolve_event(guild, IndexedEvent(entry.event_id, ""))
+        if ev is not None:
+            await ev.delete()
+        event_index.forget(guild.id, entry.tournament_id, entry.event_id)
+        return ev is None
+    desired = entry.desired
+    indexed = event_index.get(guild.id, entry.tournament_id)
+    if indexed is None and entry.op == CREATE:
+        indexed = await _find_created_event(guild, desired)
+    if indexed is not None and indexed.content_hash == desired.content_hash:
+        event_index.record(guild.id, desired.tournament_id, indexed.event_id, desired.content_hash)
+        return True
+    if indexed is None and entry.event_id is not None:
+        indexed = IndexedEvent(entry.event_id, "")
+    ev = await _resolve_event(guild, indexed) if indexed is not None else None
+    if ev is None:
+        event_index.forget(guild.id, desired.tournament_id)
+        await _create_event(guild, desired)
+    else:
+        await _edit_event(guild, ev, indexed.event_id, desired)
+    return False
+
+async def drain_outbox(bot, SETTINGS: dict) -> int:
+    """
+    Retry the queued event writes that are due.
+    
+    Every retry first checks whether the write already took effect, so a
+    create whose response timed out is not made twice: a create is skipped if
+    the tournament's event is in the event index or in the guild's event list,
+    an update if the index already holds its content hash, and a delete if the
+    event is gone. Retries hold the guild's sync lock, and a write that a sync
+    superseded meanwhile is dropped, as is a create or update for a team the
+    guild no longer has registered. Writes that fail again back off in the
+    outbox.
+    
+    Args:
+        bot: The Discord bot instance.
+        SETTINGS: Per-guild settings, for the guilds' registered teams.
+        
+    Returns:
+        Number of writes applied or found to be applied already.
+    """
+    entries = outbox.due()
+    if not entries:
+        return 0
+
+    async def retry(entry: OutboxEntry) -> Optional[bool]:
+        guild = bot.get_guild(entry.guild_id)
+        if guild is None:
+            # The bot left the guild
+            outbox.discard(entry.guild_id, [entry.tournament_id])
+            return None
+        teams = SETTINGS.get(str(entry.guild_id), {}).get("teams", [])
+        if entry.team is not None and entry.team not in teams:
+            # The team was removed after the write was queued
+            outbox.discard(entry.guild_id, [entry.tournament_id])
+            return None
+        async with guild_lock(guild.id):
+            if outbox.entries.get(entry.key) is not entry:
+                # A sync planned this tournament while the retry was waiting
+                return None
+            return await _retry_write(guild, entry)
+
+    applied = 0
+    results = await discord_batcher.run(entries, retry)
+    for entry, result in zip(entries, results):
+        if isinstance(result, BaseException):
+            outbox.retry_later(entry, result)
+            logger.warning(f"Retry of {entry.op} for tournament {entry.tournament_id} in guild {entry.guild_id} failed: {result}")
+        elif result is not None and outbox.entries.get(entry.key) is entry:
+            outbox.complete(entry, already_applied=result)
+            applied += 1
+            logger.info(f"Applied queued {entry.op} for tournament {entry.tournament_id} in guild {entry.guild_id}")
+    event_index.flush()
+    return applied
+
 async def sync_events_for_guild(
     guild: discord.Guild,
     SETTINGS: dict,
@@ -51,7 +746,11 @@ async def sync_events_for_guild(
     verbose: bool = False,
     team_slug: str | None = None,
     prefetched_events: Optional[List[discord.ScheduledEvent]] = None,
+    prefetched_tournaments: Optional[Dict[str, Optional[List[Tournament]]]] = None,
+    force: bool = False,
 ) -> Tuple[int, int, list[str]]:
+    # force (manual syncs): re-check the guild's events and reconcile every team,
+    # even those whose feed digest was already applied
     gid = str(guild.id)
     # Determine which teams to sync
     if team_slug:
@@ -63,165 +762,88 @@ async def sync_events_for_guild(
             print(f"[{guild.name}] No teams registered, skipping.")
         return 0, 0, []
 
-    total_created = 0
-    total_updated = 0
-    total_events: list[str] = []  # created event URLs
-    total_updated_events: list[str] = []  # updated event URLs
-    for team in slugs:
+    # Check permissions
+    me = guild.me or guild.get_member(bot.user.id)
+    if not me or not me.guild_permissions.manage_events:
         if verbose:
-            print(f"[{guild.name}] Starting sync for team '{team}'")
-        # Check permissions
-        me = guild.me or guild.get_member(bot.user.id)
-        if not me or not me.guild_permissions.manage_events:
-            if verbose:
-                print(f"[{guild.name}] ❌ Missing permission: Manage Events")
-            continue
-        
-        # Use prefetched events if provided, otherwise fetch them
-        if prefetched_events is not None:
-            existing_events = prefetched_events
-            if verbose:
-                print(f"[{guild.name}] Using pre-fetched events ({len(existing_events)} events)")
-        else:
+            print(f"[{guild.name}] ❌ Missing permission: Manage Events")
+        return 0, 0, []
+    
+    # One reconcile per guild at a time: the cron run, the poll job, the outbox
+    # and manual syncs would otherwise plan from the same index and create an
+    # arena twice
+    async with guild_lock(guild.id):
+        # A team whose feed digest matches the one last applied to this guild needs
+        # no reconcile, unless the guild's events were passed in or its index is
+        # due for verification; in those cases the events are listed first
+        can_skip = not force and prefetched_events is None and not event_index.needs_verification(guild.id)
+        existing: Optional[Dict[str, IndexedEvent]] = None
+        if not can_skip:
             try:
-                existing_events = await guild.fetch_scheduled_events()
+                existing = await existing_events_for_guild(guild, prefetched_events, verbose, verify=force)
             except discord.Forbidden:
                 print(f"[{guild.name}] ❌ Forbidden when fetching existing events.")
-                continue
-        existing_map = {ev.location: ev for ev in existing_events if ev.location}
-
-        created = 0
-        created_events: list[str] = []
-        now_ms = int(datetime.now(timezone.utc).timestamp() * 1000)
-        
-        # Check if we have cached tournaments (disable cache in test environment)
-        cached_tournaments = None
-        
-        # Try to get from cache if not in test environment
+                return 0, 0, []
+    
+        # Resolve all teams' feeds (fetches run concurrently); tournaments new to
+        # the guild are created while feeds read from Lichess are still arriving
+        early = _EarlyCreates(guild, SETTINGS, existing, verbose)
         try:
-            # Check if we're in a test environment (if ev.edit is AsyncMock, we're in a test)
-            is_test = any(existing_events) and isinstance(existing_events[0].edit, AsyncMock)
-            if not is_test:
-                cached_tournaments = cache.get_tournaments(team)
-        except (AttributeError, TypeError):
-            # If we can't check, assume not a test
-            cached_tournaments = cache.get_tournaments(team)
-            
-        # If not in cache or in test environment, fetch from API
-        if not cached_tournaments:
-            if verbose:
-                print(f"[{guild.name}] Cache miss for team {team}, fetching from API")
-            url = f"https://lichess.org/api/team/{team}/arena"
-            all_tournaments = []
-            
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url) as resp:
-                    if resp.status != 200:
-                        print(f"[{guild.name}] ⚠️ Lichess API returned HTTP {resp.status} for team {team}")
-                        continue
-                    
-                    # Parse stream and collect all tournaments
-                    while True:
-                        try:
-                            line = await asyncio.wait_for(resp.content.readline(), timeout=1.0)
-                        except asyncio.TimeoutError:
-                            if verbose:
-                                print(f"[{guild.name}] No new lines in 1s, ending team {team}.")
-                            break
-                        if not line:
-                            if verbose:
-                                print(f"[{guild.name}] Stream closed for team {team}, ending.")
-                            break
-                        raw = line.decode().strip()
-                        if not raw:
-                            continue
-                        if verbose:
-                            print(f"[{guild.name}] RAW LINE: {raw}")
-                        try:
-                            t = json.loads(raw)
-                            all_tournaments.append(t)
-                        except json.JSONDecodeError:
-                            if verbose:
-                                print(f"[{guild.name}] ⚠️ JSON error, skipping.")
-                            continue
-            
-            # Store in cache for future use
-            cache.set_tournaments(team, all_tournaments)
-            tournaments_to_process = all_tournaments
-        else:
-            if verbose:
-                print(f"[{guild.name}] Cache hit for team {team}, using cached data")
-            tournaments_to_process = cached_tournaments
-            
-        # Process tournaments (either from cache or freshly fetched)
-        for t in tournaments_to_process:
-            starts_at = t.get("startsAt", 0)
-            if starts_at <= now_ms:
-                if verbose:
-                    print(f"[{guild.name}] Tournament {t.get('id')} already started, skipping.")
-                continue
-            start_time = datetime.fromtimestamp(starts_at / 1000, tz=timezone.utc)
-            finishes_at = t.get("finishesAt", starts_at + 60 * 60 * 1000)
-            end_time = datetime.fromtimestamp(finishes_at / 1000, tz=timezone.utc)
-            url_tourney = f"https://lichess.org/tournament/{t['id']}"
-            name = t.get("fullName", f"Arena {t['id']}")
-            desc = (
-                f"**Lichess Arena Tournament**\n"
-                f"• {start_time:%Y-%m-%d %H:%M UTC} – {end_time:%H:%M UTC}\n"
-                f"• {t.get('minutes')} min · +{t.get('clock', {}).get('increment', 0)}s\n\n"
-                f"{url_tourney}"
-            )
-            if ev := existing_map.get(url_tourney):
-                if (
-                    ev.name != name
-                    or ev.start_time != start_time
-                    or ev.end_time != end_time
-                    or (ev.description or "") != desc
-                ):
-                    try:
-                        await ev.edit(
-                            name=name,
-                            description=desc,
-                            start_time=start_time,
-                            end_time=end_time,
-                            entity_type=discord.EntityType.external,
-                            location=url_tourney,
-                            privacy_level=discord.PrivacyLevel.guild_only
-                        )
-                        await log_to_notification_channel(
-                            guild, SETTINGS, f"Updated event for {team}: {name} ({t['id']})", "update"
-                        )
-                        # record update
-                        total_updated += 1
-                        total_updated_events.append(url_tourney)
-                        if verbose:
-                            print(f"[{guild.name}] 🔄 Updated event {url_tourney}")
-                    except Exception as e:
-                        print(f"[{guild.name}] ⚠️ Error updating {url_tourney}: {e}")
-                continue
+            feeds = await asyncio.gather(*(
+                _tournaments_for_team(team, guild, verbose, prefetched_tournaments, early.for_team(team))
+                for team in slugs
+            ))
+        finally:
+            early_events = await early.finish()
+        team_feeds = {team: tournaments for team, tournaments in zip(slugs, feeds) if tournaments is not None}
+        for team in slugs:
+            notice = None if team in team_feeds else team_health.notice_for(guild.id, team)
+            if notice:
+                await log_to_notification_channel(guild, SETTINGS, notice, "error")
+        digests = {team: cache.digest(team, tournaments) for team, tournaments in team_feeds.items()}
+    
+        def is_applied(team: str) -> bool:
+            return can_skip and event_index.applied_digest(guild.id, team) == digests[team]
+    
+        pending = [team for team in team_feeds if not is_applied(team)]
+        total_events: list[str] = list(early_events)
+        total_updated_events: list[str] = []
+        if pending and existing is None:
+            # One view of the guild's events serves every team
             try:
-                await guild.create_scheduled_event(
-                    name=name,
-                    description=desc,
-                    start_time=start_time,
-                    end_time=end_time,
-                    entity_type=discord.EntityType.external,
-                    location=url_tourney,
-                    privacy_level=discord.PrivacyLevel.guild_only
-                )
-                created += 1
-                created_events.append(url_tourney)
-                if verbose:
-                    print(f"[{guild.name}] 📅 New event created: {name} ({t['id']})")
+                existing = await existing_events_for_guild(guild, prefetched_events, verbose, verify=force)
             except discord.Forbidden:
-                if verbose:
-                    print(f"[{guild.name}] ❌ Forbidden when creating {url_tourney}")
-                continue
-            except Exception as e:
-                print(f"[{guild.name}] ⚠️ Error when creating {url_tourney}: {e}")
-                continue
-        total_created += created
-        total_events.extend(created_events)
+                print(f"[{guild.name}] ❌ Forbidden when fetching existing events.")
+                return 0, 0, []
+            # The listing may have found changes that invalidate applied digests
+            pending = [team for team in team_feeds if not is_applied(team)]
+        event_index.stats["digest_hits"] += len(team_feeds) - len(pending)
+        event_index.stats["digest_misses"] += len(pending)
+        if verbose:
+            for team in team_feeds:
+                if team not in pending:
+                    print(f"[{guild.name}] Feed of team {team} unchanged since last sync, skipping")
+        if pending:
+            desired_by_team = {team: cache.desired_events(team, team_feeds[team]) for team in pending}
+            edit_churn.prune(datetime.now(timezone.utc))
+            plan = build_plan(existing, desired_by_team, datetime.now(timezone.utc))
+            # A failed early create is already queued for a retry (or not worth one)
+            attempted = early.attempted
+            plan.creates = [(team, desired) for team, desired in plan.creates if desired.tournament_id not in attempted]
+            if verbose:
+                print(
+                    f"[{guild.name}] Plan: {len(plan.creates)} to create, {len(plan.updates)} to update, "
+                    f"{len(plan.unchanged)} unchanged, {plan.skipped_started} already started"
+                )
+            created_events, total_updated_events, _ = await execute_plan(guild, SETTINGS, plan, verbose)
+            total_events.extend(created_events)
+            if not plan.failed and not early.failed:
+                # The guild now matches every resolved feed
+                for team, digest in digests.items():
+                    event_index.record_applied(guild.id, team, digest)
+    total_created = len(total_events)
+    total_updated = len(total_updated_events)
+    
     # Notify separately for creations and updates
     if total_created:
         msg_created = (
@@ -245,52 +867,3 @@ async def sync_events_for_guild(
     # return separate counts for created and updated events, and all event URLs
     combined_events = total_events + total_updated_events
     return total_created, total_updated, combined_events
-
-async def fetch_scheduled_events_for_guilds(bot):
-    """
-    Fetch all scheduled events for all guilds in one batch to reduce API calls.
-    
-    Args:
-        bot: The Discord bot instance.
-        
-    Returns:
-        Dict mapping guild IDs to their scheduled events.
-    """
-    guild_events = {}
-    
-    for guild in bot.guilds:
-        try:
-            events = await guild.fetch_scheduled_events()
-            guild_events[guild.id] = events
-        except Exception as e:
-            logger.error(f"Error fetching events for guild {guild.id}: {e}")
-            guild_events[guild.id] = []
-            
-    return guild_events
-
-async def process_in_batches(items, batch_size, process_func, delay=1.0):
-    """
-    Process a list of items in batches to reduce API load.
-    
-    Args:
-        items: List of items to process
-        batch_size: Number of items to process per batch
-        process_func: Async function to call with each batch
-        delay: Delay between batches in seconds
-        
-    Returns:
-        Combined results from all batches
-    """
-    results = []
-    
-    # Process in batches
-    for i in range(0, len(items), batch_size):
-        batch = items[i:i + batch_size]
-        batch_result = await process_func(batch)
-        results.extend(batch_result if isinstance(batch_result, list) else [batch_result])
-        
-        # Add delay between batches
-        if i + batch_size < len(items):
-            await asyncio.sleep(delay)
-            
-    return results
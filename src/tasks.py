@@ -1,15 +1,80 @@
+import asyncio
+import hashlib
 import os
+import random
+import time
 import yaml
+from datetime import datetime, timedelta
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
-from .sync import sync_events_for_guild
+from apscheduler.triggers.interval import IntervalTrigger
+from .sync import sync_events_for_guild, drain_outbox
 from .utils import ensure_file_handler, logger
 from .cache import cache
+from .event_index import event_index
+from .polling import team_poller
+
+DEFAULT_GUILD_CONCURRENCY = 8  # Guilds synced at the same time by the scheduled run
+DEFAULT_SPREAD_MINUTES = 30  # Window after the cron time across which guild syncs are spread
+DEFAULT_JITTER_SECONDS = 30  # Random delay added to each guild's slot
+DEFAULT_POLL_TICK_SECONDS = 60  # How often the adaptive poller looks for due teams
+DEFAULT_OUTBOX_TICK_SECONDS = 10  # How often queued event writes are retried
+
+
+def guild_offset(guild_id: int, spread_seconds: float, jitter_seconds: float) -> float:
+    """
+    Return how long after the cron time a guild's scheduled sync starts.
+    
+    The slot is derived from a hash of the guild id, so each guild keeps the
+    same place in the window on every run; a little random jitter is added so
+    guilds sharing a slot do not fire together.
+    
+    Args:
+        guild_id: The Discord guild id.
+        spread_seconds: Length of the window, in seconds (0 disables spreading).
+        jitter_seconds: Maximum random delay added to the slot, in seconds.
+        
+    Returns:
+        Delay in seconds.
+    """
+    digest = hashlib.sha1(str(guild_id).encode("utf-8")).digest()
+    slot = int.from_bytes(digest[:4], "big") / 2**32 * max(0.0, spread_seconds)
+    return slot + random.uniform(0, max(0.0, jitter_seconds))
+
+
+def cron_interval(trigger, samples: int = 4) -> float:
+    """
+    Return the shortest gap between upcoming fire times of a cron trigger.
+    
+    Args:
+        trigger: The APScheduler CronTrigger.
+        samples: Number of upcoming fire times to compare.
+        
+    Returns:
+        Gap in seconds, or 0 if the trigger fires fewer than twice.
+    """
+    fire_time = trigger.get_next_fire_time(None, datetime.now(trigger.timezone))
+    gaps = []
+    for _ in range(samples):
+        if fire_time is None:
+            break
+        # A cron trigger matches "now" itself, so look from just past it
+        next_fire = trigger.get_next_fire_time(fire_time, fire_time + timedelta(seconds=1))
+        if next_fire is None:
+            break
+        gaps.append((next_fire - fire_time).total_seconds())
+        fire_time = next_fire
+    return min(gaps) if gaps else 0.0
 
 
 def start_background_tasks(bot, SETTINGS):
     """
     Schedule periodic sync jobs based on cron settings from config/config.yaml.
+    
+    The cron job reconciles every guild. With adaptive polling enabled, a
+    second job checks each team's feed on its own interval and syncs only the
+    guilds of teams whose feed changed. A third job retries event writes
+    queued in the outbox after transient Discord errors.
     """
     # Load scheduler settings
     cfg_path = os.path.join(os.getcwd(), "config", "config.yaml")
@@ -23,34 +88,141 @@ def start_background_tasks(bot, SETTINGS):
     sched_conf = conf.get("scheduler", {})
     cron_expr = sched_conf.get("cron", "*/5 * * * *")
     default_auto = sched_conf.get("auto_sync", True)
+    guild_conf = (conf.get("performance", {}) or {}).get("guild_sync", {}) or {}
+    max_concurrent = max(1, guild_conf.get("max_concurrent", DEFAULT_GUILD_CONCURRENCY))
+    spread_seconds = sched_conf.get("spread_minutes", DEFAULT_SPREAD_MINUTES) * 60
+    jitter_seconds = sched_conf.get("jitter_seconds", DEFAULT_JITTER_SECONDS)
+    poll_conf = sched_conf.get("adaptive_polling", {}) or {}
+    outbox_conf = (conf.get("performance", {}) or {}).get("outbox", {}) or {}
 
     scheduler = AsyncIOScheduler()
     trigger = CronTrigger.from_crontab(cron_expr)
+    
+    # A spread longer than the cron interval would still be starting guilds
+    # when the next run fires, and APScheduler skips that run
+    interval = cron_interval(trigger)
+    if interval and spread_seconds + jitter_seconds > interval:
+        clamped = max(0.0, interval - jitter_seconds)
+        logger.warning(
+            f"Guild sync spread of {spread_seconds / 60:g} min plus {jitter_seconds}s jitter "
+            f"exceeds the cron interval of {interval / 60:g} min; spreading over {clamped / 60:g} min instead"
+        )
+        spread_seconds = clamped
+
+    def auto_sync_guilds():
+        # Guilds taking part in background syncs: auto sync on and at least one team
+        return [
+            guild for guild in bot.guilds
+            if SETTINGS.get(str(guild.id), {}).get("auto_sync", default_auto)
+            and SETTINGS.get(str(guild.id), {}).get("teams")
+        ]
 
     async def sync_job():
-        from .sync import fetch_scheduled_events_for_guilds
+        from .sync import fetch_tournaments_for_teams
+        
+        eligible_guilds = auto_sync_guilds()
         
-        # Fetch all events for all guilds in one batch
+        # Fetch each distinct team feed once and share it with every guild
+        team_slugs = [
+            slug
+            for guild in eligible_guilds
+            for slug in SETTINGS.get(str(guild.id), {}).get("teams", [])
+        ]
+        try:
+            team_feeds = await fetch_tournaments_for_teams(team_slugs)
+        except Exception as e:
+            ensure_file_handler()
+            logger.error(f"Error fetching team tournaments: {e}", exc_info=e)
+            team_feeds = {}
+        
+        # Stream guilds through the sync: each one waits for its slot in the
+        # spread window, then lists its events (gateway cache, event index or
+        # REST), reconciles and releases them, so at most max_concurrent event
+        # lists are held at once. discord.py queues requests per rate-limit
+        # bucket; the semaphore bounds guilds in flight.
+        semaphore = asyncio.Semaphore(max_concurrent)
+        durations = {}
+        
+        async def sync_guild(guild):
+            delay = guild_offset(guild.id, spread_seconds, jitter_seconds)
+            if delay > 0:
+                logger.debug(f"Guild {guild.id} syncs {delay:.0f}s into the scheduled run")
+                await asyncio.sleep(delay)
+            async with semaphore:
+                started = time.monotonic()
+                try:
+                    # Share the cycle's team feeds with every guild
+                    await sync_events_for_guild(
+                        guild, SETTINGS, bot, verbose=False,
+                        prefetched_tournaments=team_feeds,
+                    )
+                except Exception as e:
+                    ensure_file_handler()
+                    logger.error(f"Error syncing tournaments for guild {guild.id}", exc_info=e)
+                finally:
+                    durations[guild.id] = time.monotonic() - started
+                    logger.info(f"Synced guild {guild.id} in {durations[guild.id]:.2f}s")
+        
+        cycle_started = time.monotonic()
+        await asyncio.gather(*(sync_guild(guild) for guild in eligible_guilds))
+        if durations:
+            slowest = max(durations, key=durations.get)
+            logger.info(
+                f"Scheduled sync of {len(durations)} guilds took {time.monotonic() - cycle_started:.2f}s "
+                f"(sum of guild times {sum(durations.values()):.2f}s, "
+                f"slowest guild {slowest}: {durations[slowest]:.2f}s)"
+            )
+        
+        # Persist this cycle's cache and index updates so a restart starts warm
+        cache.flush()
+        event_index.flush()
+
+    async def poll_job():
+        from .sync import fetch_tournaments_for_teams
+        
+        eligible_guilds = auto_sync_guilds()
+        team_poller.track(
+            slug
+            for guild in eligible_guilds
+            for slug in SETTINGS.get(str(guild.id), {}).get("teams", [])
+        )
+        due_teams = team_poller.due()
+        if not due_teams:
+            return
+        try:
+            team_feeds = await fetch_tournaments_for_teams(due_teams, refresh=True)
+        except Exception as e:
+            ensure_file_handler()
+            logger.error(f"Error polling team tournaments: {e}", exc_info=e)
+            team_feeds = {}
+        changed_teams = {team for team in due_teams if team_poller.record(team, team_feeds.get(team))}
+        logger.info(f"Polled {len(due_teams)} teams, {len(changed_teams)} changed")
+        
+        # Only the guilds of changed teams need a sync, and only for those teams
+        for guild in eligible_guilds:
+            for team in SETTINGS.get(str(guild.id), {}).get("teams", []):
+                if team not in changed_teams:
+                    continue
+                try:
+                    await sync_events_for_guild(
+                        guild, SETTINGS, bot, verbose=False,
+                        team_slug=team, prefetched_tournaments=team_feeds,
+                    )
+                except Exception as e:
+                    ensure_file_handler()
+                    logger.error(f"Error syncing team {team} for guild {guild.id}", exc_info=e)
+        cache.flush()
+        event_index.flush()
+
+    async def outbox_job():
         try:
-            guild_events = await fetch_scheduled_events_for_guilds(bot)
+            await drain_outbox(bot, SETTINGS)
         except Exception as e:
             ensure_file_handler()
-            logger.error(f"Error fetching events in bulk: {e}", exc_info=e)
-            guild_events = {}
-        
-        # Process each guild
-        for guild in bot.guilds:
-            gid = str(guild.id)
-            auto = SETTINGS.get(gid, {}).get("auto_sync", default_auto)
-            if not auto:
-                continue
-            try:
-                # Pass pre-fetched events if available
-                prefetched_events = guild_events.get(guild.id, None)
-                await sync_events_for_guild(guild, SETTINGS, bot, verbose=False, prefetched_events=prefetched_events)
-            except Exception as e:
-                ensure_file_handler()
-                logger.error(f"Error syncing tournaments for guild {guild.id}", exc_info=e)
+            logger.error(f"Error retrying queued event writes: {e}", exc_info=e)
 
     scheduler.add_job(sync_job, trigger)
+    if poll_conf.get("enabled", True):
+        scheduler.add_job(poll_job, IntervalTrigger(seconds=poll_conf.get("tick_seconds", DEFAULT_POLL_TICK_SECONDS)))
+    scheduler.add_job(outbox_job, IntervalTrigger(seconds=outbox_conf.get("retry_tick_seconds", DEFAULT_OUTBOX_TICK_SECONDS)))
     scheduler.start()
@@ -0,0 +1,136 @@
+"""
+Negative cache and circuit breaker for Lichess team feeds.
+"""
+import os
+import time
+import yaml
+from typing import Any, Dict, Optional, Set, Tuple
+
+from .utils import logger
+
+# Load team health settings from config
+CONFIG_PATH = os.path.join(os.getcwd(), "config", "config.yaml")
+DEFAULT_MISSING_BACKOFF_MINUTES = 60  # First pause after a team answered 404/410
+DEFAULT_MAX_BACKOFF_HOURS = 24  # Longest pause for a missing or failing team
+DEFAULT_FAILURE_THRESHOLD = 3  # Consecutive 5xx/timeouts/connection errors before a team's circuit opens
+DEFAULT_OPEN_MINUTES = 15  # First pause once a team's circuit is open
+
+# Statuses meaning the team does not exist (misspelled slug) or was closed
+MISSING_STATUSES = (404, 410)
+
+try:
+    with open(CONFIG_PATH) as f:
+        config = yaml.safe_load(f) or {}
+    HEALTH_CONF = config.get("performance", {}).get("team_health", {}) or {}
+except Exception:
+    HEALTH_CONF = {}
+
+
+class TeamHealth:
+    """Tracks team feeds that should not be requested for a while.
+
+    A team answering 404 or 410 is negatively cached: it is not requested
+    again until its backoff has passed, and the backoff doubles each time it
+    is still missing. A team failing with 5xx errors, timeouts or connection
+    errors ``failure_threshold`` times in a row has its circuit opened; once the
+    pause is over a single trial request is let through, and a failed trial
+    opens the circuit again for twice as long. Any successful fetch resets
+    the team.
+    """
+
+    def __init__(
+        self,
+        missing_backoff_minutes: float = HEALTH_CONF.get("missing_backoff_minutes", DEFAULT_MISSING_BACKOFF_MINUTES),
+        max_backoff_hours: float = HEALTH_CONF.get("max_backoff_hours", DEFAULT_MAX_BACKOFF_HOURS),
+        failure_threshold: int = HEALTH_CONF.get("failure_threshold", DEFAULT_FAILURE_THRESHOLD),
+        open_minutes: float = HEALTH_CONF.get("open_minutes", DEFAULT_OPEN_MINUTES),
+    ):
+        """Initialize with no known broken teams.
+
+        Args:
+            missing_backoff_minutes: First pause after a 404/410, in minutes.
+            max_backoff_hours: Longest pause for any team, in hours.
+            failure_threshold: Consecutive 5xx errors, timeouts or connection errors that open a team's circuit.
+            open_minutes: First pause of an open circuit, in minutes.
+        """
+        self.missing_backoff = missing_backoff_minutes * 60
+        self.max_backoff = max(self.missing_backoff, max_backoff_hours * 3600)
+        self.failure_threshold = max(1, failure_threshold)
+        self.open_seconds = open_minutes * 60
+        # team slug -> (retry after, current backoff in seconds, HTTP status)
+        self._missing: Dict[str, Tuple[float, float, int]] = {}
+        # team slug -> (consecutive failures, retry after, current pause in seconds)
+        self._failures: Dict[str, Tuple[int, float, float]] = {}
+        # (guild id, team slug) pairs whose admins were told about the broken team
+        self._notified: Set[Tuple[int, str]] = set()
+        self.stats: Dict[str, Any] = {
+            "negative_hits": 0,
+            "circuit_skips": 0,
+            "missing": 0,
+            "circuits_opened": 0,
+        }
+
+    def check(self, team: str, now: Optional[float] = None) -> Optional[str]:
+        """Return why a team must not be requested right now, or None if it may be."""
+        now = time.time() if now is None else now
+        missing = self._missing.get(team)
+        if missing is not None and now < missing[0]:
+            self.stats["negative_hits"] += 1
+            return f"team not found on Lichess (HTTP {missing[2]})"
+        failures = self._failures.get(team)
+        if failures is not None and failures[0] >= self.failure_threshold and now < failures[1]:
+            self.stats["circuit_skips"] += 1
+            return f"{failures[0]} failed requests in a row"
+        return None
+
+    def record_success(self, team: str) -> None:
+        """Reset a team after a successful fetch."""
+        if self._missing.pop(team, None) is not None or self._failures.pop(team, None) is not None:
+            logger.info(f"Lichess team {team} is reachable again")
+        self._notified = {key for key in self._notified if key[1] != team}
+
+    def record_missing(self, team: str, status: int, now: Optional[float] = None) -> None:
+        """Negatively cache a team that answered 404 or 410."""
+        now = time.time() if now is None else now
+        previous = self._missing.get(team)
+        backoff = self.missing_backoff if previous is None else min(self.max_backoff, previous[1] * 2)
+        self._missing[team] = (now + backoff, backoff, status)
+        self._failures.pop(team, None)
+        self.stats["missing"] += 1
+        logger.warning(f"Lichess team {team} answered HTTP {status}; not requesting it for {backoff / 60:.0f} min")
+
+    def record_failure(self, team: str, now: Optional[float] = None) -> None:
+        """Count a 5xx error, timeout or connection error and open the team's circuit once the threshold is reached."""
+        now = time.time() if now is None else now
+        count, _, pause = self._failures.get(team, (0, 0.0, 0.0))
+        count += 1
+        if count >= self.failure_threshold:
+            # First opening, or a failed trial after the previous pause
+            pause = self.open_seconds if not pause else min(self.max_backoff, pause * 2)
+            self._failures[team] = (count, now + pause, pause)
+            self.stats["circuits_opened"] += 1
+            logger.warning(f"Circuit for Lichess team {team} open for {pause / 60:.0f} min after {count} failures")
+        else:
+            self._failures[team] = (count, 0.0, pause)
+
+    def notice_for(self, guild_id: int, team: str) -> Optional[str]:
+        """Return a message for the guild's admins about a broken team, once per guild and team."""
+        missing = self._missing.get(team)
+        if missing is None or (guild_id, team) in self._notified:
+            return None
+        self._notified.add((guild_id, team))
+        return (
+            f"Lichess team `{team}` could not be found (HTTP {missing[2]}). Check the slug or remove it "
+            f"with /remove_team; it is retried less and less often until then."
+        )
+
+    def broken(self) -> Dict[str, str]:
+        """Return every team currently skipped, with the reason."""
+        teams = {team: f"HTTP {status}" for team, (_, _, status) in self._missing.items()}
+        for team, (count, _, _) in self._failures.items():
+            if count >= self.failure_threshold:
+                teams.setdefault(team, f"{count} failures")
+        return teams
+
+# Singleton tracker for use throughout the app
+team_health = TeamHealth()
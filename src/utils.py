@@ -1,4 +1,5 @@
 import os
+import json
 import yaml
 import logging
 import re  # Added for regex validation
@@ -264,3 +265,41 @@ def sanitize_message(message):
     
     # Limit to reasonable length
     return sanitized[:1000]  # Limit to 1000 chars
+
+def read_snapshot(path, version):
+    """
+    Load a JSON snapshot written by ``write_snapshot``.
+    
+    Args:
+        path: Snapshot file, usually under DATA_DIR.
+        version: File format version the caller understands.
+        
+    Returns:
+        The snapshot dict, or None if the file does not exist or has another version.
+        
+    Raises:
+        OSError, ValueError: If the file cannot be read or parsed.
+    """
+    if not path or not os.path.isfile(path):
+        return None
+    with open(path, "r") as f:
+        snapshot = json.load(f)
+    if not isinstance(snapshot, dict) or snapshot.get("version") != version:
+        return None
+    return snapshot
+
+def write_snapshot(path, snapshot):
+    """
+    Write a JSON snapshot atomically: to a temporary file that is then moved
+    into place, so a crash mid-write never leaves a truncated file behind.
+    
+    Raises:
+        OSError, TypeError: If the snapshot cannot be written.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(snapshot, f, separators=(",", ":"))
+    os.replace(tmp_path, path)
@@ -50,10 +50,79 @@ def save_settings():
     return _save
 
 @pytest.fixture(autouse=True)
-def clear_cache():
+def clear_cache(monkeypatch):
     """Clear the cache before each test to avoid interference between tests."""
     try:
         from src.cache import cache
+        # Never read or write the real on-disk snapshot from tests
+        monkeypatch.setattr(cache, "persist_path", None)
         cache.invalidate_all()
     except (ImportError, AttributeError):
         pass  # Cache module might not be available in some tests
+
+@pytest.fixture(autouse=True)
+def clear_event_index(monkeypatch):
+    """Start each test with an empty, memory-only event index."""
+    try:
+        from src.event_index import event_index
+    except ImportError:
+        return
+    monkeypatch.setattr(event_index, "persist_path", None)
+    event_index.invalidate_all()
+
+@pytest.fixture(autouse=True)
+def unthrottled_lichess_client(monkeypatch):
+    """Give each test a fresh, permissive rate governor on the shared Lichess client."""
+    try:
+        from src.lichess import lichess_client
+        from src.ratelimit import RateGovernor
+    except ImportError:
+        return
+    monkeypatch.setattr(
+        lichess_client, "governor",
+        RateGovernor(requests_per_second=1000, burst=1000, max_concurrent=100, backoff_seconds=0),
+    )
+
+@pytest.fixture(autouse=True)
+def unpaused_batchers(monkeypatch):
+    """Run the shared batchers without pauses between batches."""
+    try:
+        from src.batching import discord_batcher, lichess_batcher
+    except ImportError:
+        return
+    for batcher in (discord_batcher, lichess_batcher):
+        monkeypatch.setattr(batcher, "batch_size", 5)
+        monkeypatch.setattr(batcher, "delay", 0.0)
+        monkeypatch.setattr(batcher, "base_delay", 0.0)
+        monkeypatch.setattr(batcher, "delay_step", 0.0)
+
+@pytest.fixture(autouse=True)
+def healthy_teams(monkeypatch):
+    """Start each test with no negatively cached or circuit-broken teams."""
+    try:
+        from src.team_health import team_health
+    except ImportError:
+        return
+    monkeypatch.setattr(team_health, "_missing", {})
+    monkeypatch.setattr(team_health, "_failures", {})
+    monkeypatch.setattr(team_health, "_notified", set())
+
+@pytest.fixture(autouse=True)
+def empty_outbox(monkeypatch):
+    """Keep queued event writes in memory and start each test with none."""
+    try:
+        from src.outbox import outbox
+    except ImportError:
+        return
+    monkeypatch.setattr(outbox, "persist_path", None)
+    monkeypatch.setattr(outbox, "_loaded", True)
+    monkeypatch.setattr(outbox, "entries", {})
+
+@pytest.fixture(autouse=True)
+def fresh_guild_locks(monkeypatch):
+    """Give each test (and its event loop) its own per-guild sync locks."""
+    try:
+        import src.sync as sync_mod
+    except ImportError:
+        return
+    monkeypatch.setattr(sync_mod, "_guild_locks", {})
@@ -0,0 +1,106 @@
+import asyncio
+import pytest
+
+from src.batching import AdaptiveBatcher
+
+
+class RateLimited(Exception):
+    status = 429
+
+
+@pytest.mark.asyncio
+async def test_batcher_keeps_order_and_returns_errors():
+    batcher = AdaptiveBatcher("test", batch_size=2, batch_delay=0, latency_target=10)
+
+    async def work(item):
+        if item == 3:
+            raise ValueError("boom")
+        await asyncio.sleep(0)
+        return item * 10
+
+    results = await batcher.run([1, 2, 3, 4, 5], work)
+    assert results[:2] == [10, 20]
+    assert isinstance(results[2], ValueError)
+    assert results[3:] == [40, 50]
+    assert batcher.stats["calls"] == 5
+
+
+@pytest.mark.asyncio
+async def test_batcher_runs_a_batch_concurrently():
+    batcher = AdaptiveBatcher("test", batch_size=3, batch_delay=0, latency_target=10)
+    active = 0
+    peak = 0
+
+    async def work(item):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+
+    await batcher.run(list(range(3)), work)
+    assert peak == 3
+    assert batcher.stats["batches"] == 1
+
+
+@pytest.mark.asyncio
+async def test_batcher_grows_additively_when_clean():
+    batcher = AdaptiveBatcher("test", batch_size=2, batch_delay=1, max_batch_size=4, latency_target=10)
+    batcher.delay = 0.0
+
+    async def work(item):
+        return item
+
+    await batcher.run([1, 2], work)
+    assert batcher.batch_size == 3
+    await batcher.run([1, 2, 3], work)
+    await batcher.run([1, 2, 3, 4], work)
+    assert batcher.batch_size == 4  # capped
+    assert batcher.stats["increases"] == 3
+    assert batcher.summary()["last_throughput"] > 0
+
+
+@pytest.mark.asyncio
+async def test_batcher_backs_off_on_429():
+    batcher = AdaptiveBatcher("test", batch_size=8, batch_delay=0.5, max_delay=1.5, latency_target=10)
+
+    async def work(item):
+        raise RateLimited()
+
+    await batcher.run([1], work)
+    assert batcher.batch_size == 4
+    assert batcher.delay == 1.0
+    assert batcher.stats["rate_limited"] == 1
+    batcher.delay = 1.0
+    await batcher.run([1], work)
+    assert batcher.batch_size == 2
+    assert batcher.delay == 1.5  # capped
+
+
+@pytest.mark.asyncio
+async def test_batcher_counts_retried_429_from_counter():
+    seen = {"rate_limited": 0}
+    batcher = AdaptiveBatcher(
+        "test", batch_size=4, batch_delay=0, latency_target=10,
+        rate_limit_counter=lambda: seen["rate_limited"],
+    )
+
+    async def work(item):
+        seen["rate_limited"] += 1
+        return item
+
+    assert await batcher.run([1], work) == [1]
+    assert batcher.batch_size == 2
+    assert batcher.stats["decreases"] == 1
+
+
+@pytest.mark.asyncio
+async def test_batcher_backs_off_on_slow_batch():
+    batcher = AdaptiveBatcher("test", batch_size=4, batch_delay=0, latency_target=0.001)
+
+    async def work(item):
+        await asyncio.sleep(0.02)
+
+    await batcher.run([1, 2], work)
+    assert batcher.batch_size == 2
+    assert batcher.stats["slow_batches"] == 1
@@ -0,0 +1,220 @@
+import asyncio
+import pytest
+from datetime import timedelta
+
+import src.sync as sync_mod
+from src.cache import LichessCache
+from src.lichess import Tournament
+
+
+def _t(tid, full_name=None):
+    return Tournament(tid, full_name, 0, 0, None, 0)
+
+
+def _age(cache, slug, minutes):
+    timestamp, data = cache.team_tournaments[slug]
+    cache.team_tournaments[slug] = (timestamp - timedelta(minutes=minutes), data)
+
+
+def test_fresh_entry_returned():
+    cache = LichessCache(cache_ttl_minutes=15, stale_grace_minutes=60)
+    cache.set_tournaments("t", [_t("a")])
+    assert cache.get_tournaments("t") == [_t("a")]
+
+
+def test_stale_entry_only_with_allow_stale():
+    cache = LichessCache(cache_ttl_minutes=15, stale_grace_minutes=60)
+    cache.set_tournaments("t", [_t("a")])
+    _age(cache, "t", 30)
+    assert cache.get_tournaments("t") is None
+    assert cache.get_tournaments("t", allow_stale=True) == [_t("a")]
+    # Beyond the grace window the entry is gone for good
+    _age(cache, "t", 60)
+    assert cache.get_tournaments("t", allow_stale=True) is None
+
+
+@pytest.mark.asyncio
+async def test_get_cached_tournaments_serves_stale_and_refreshes(monkeypatch):
+    sync_mod.cache.set_tournaments("swr", [_t("old")])
+    _age(sync_mod.cache, "swr", sync_mod.cache.cache_ttl.total_seconds() / 60 + 1)
+    refreshed = asyncio.Event()
+    calls = []
+    async def fake_fetch(team, verbose=False, label="lichess"):
+        calls.append(team)
+        sync_mod.cache.set_tournaments(team, [_t("new")])
+        refreshed.set()
+        return [_t("new")]
+    monkeypatch.setattr(sync_mod, "fetch_team_tournaments", fake_fetch)
+    # Stale value is returned immediately, twice, with a single background refresh
+    assert sync_mod.get_cached_tournaments("swr") == [_t("old")]
+    assert sync_mod.get_cached_tournaments("swr") == [_t("old")]
+    await asyncio.wait_for(refreshed.wait(), timeout=1)
+    await asyncio.sleep(0)
+    assert calls == ["swr"]
+    assert sync_mod._refresh_tasks == {}
+    assert sync_mod.get_cached_tournaments("swr") == [_t("new")]
+
+
+def test_get_cached_tournaments_miss():
+    assert sync_mod.get_cached_tournaments("nothing") is None
+
+
+def test_snapshot_survives_restart(tmp_path):
+    path = str(tmp_path / "cache.json")
+    cache = LichessCache(persist_path=path, flush_every=2)
+    cache.set_tournaments("a", [_t("1")])
+    # Writes are batched
+    assert not (tmp_path / "cache.json").exists()
+    cache.set_tournaments("b", [_t("2")])
+    assert (tmp_path / "cache.json").exists()
+    cache.set_tournaments("c", [_t("3")])
+    cache.flush()
+    # A new instance loads lazily and keeps the original timestamps
+    restarted = LichessCache(persist_path=path)
+    assert restarted.team_tournaments == {}
+    assert restarted.get_tournaments("c") == [_t("3")]
+    drift = restarted.team_tournaments["a"][0] - cache.team_tournaments["a"][0]
+    assert abs(drift.total_seconds()) < 0.001
+
+
+def test_snapshot_drops_entries_past_grace(tmp_path):
+    path = str(tmp_path / "cache.json")
+    cache = LichessCache(cache_ttl_minutes=15, stale_grace_minutes=60, persist_path=path)
+    cache.set_tournaments("old", [_t("1")])
+    cache.set_tournaments("new", [_t("2")])
+    _age(cache, "old", 120)
+    cache.flush()
+    restarted = LichessCache(cache_ttl_minutes=15, stale_grace_minutes=60, persist_path=path)
+    assert restarted.get_tournaments("new") == [_t("2")]
+    assert "old" not in restarted.team_tournaments
+
+
+def test_unreadable_snapshot_is_ignored(tmp_path):
+    path = tmp_path / "cache.json"
+    path.write_text("{not json")
+    cache = LichessCache(persist_path=str(path))
+    assert cache.get_tournaments("x") is None
+
+
+def test_memory_only_cache_never_writes(tmp_path):
+    cache = LichessCache(persist_path=None)
+    cache.set_tournaments("a", [])
+    cache.flush()
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_lru_eviction_by_entry_count():
+    cache = LichessCache(persist_path=None, max_entries=2)
+    cache.set_tournaments("a", [_t("1")])
+    cache.set_tournaments("b", [_t("2")])
+    # Touch "a" so "b" becomes least recently used
+    assert cache.get_tournaments("a")
+    cache.set_tournaments("c", [_t("3")])
+    assert list(cache.team_tournaments) == ["a", "c"]
+    assert cache.stats()["evictions"] == 1
+
+
+def test_eviction_by_estimated_bytes():
+    big = [_t(str(i), "x" * 200) for i in range(20)]
+    cache = LichessCache(persist_path=None, max_bytes=1)
+    cache.set_tournaments("a", big)
+    cache.set_tournaments("b", big)
+    # The newest entry is always kept even if it alone exceeds the budget
+    assert list(cache.team_tournaments) == ["b"]
+    stats = cache.stats()
+    assert stats["bytes"] > 0 and stats["evictions"] == 1
+    cache.invalidate("b")
+    assert cache.stats()["bytes"] == 0
+
+
+def test_stats_accounting():
+    cache = LichessCache(cache_ttl_minutes=15, stale_grace_minutes=60, persist_path=None)
+    cache.set_tournaments("a", [_t("1")])
+    cache.set_tournaments("b", [_t("2")])
+    cache.get_tournaments("a")
+    cache.get_tournaments("missing")
+    _age(cache, "b", 30)
+    assert cache.get_tournaments("b", allow_stale=True)
+    _age(cache, "b", 60)
+    assert cache.get_tournaments("b", allow_stale=True) is None
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["stale_hits"] == 1
+    assert stats["misses"] == 2
+    assert stats["expired"] == 1
+    assert stats["entries"] == 1
+
+
+def _shift_last_change(cache, slug, minutes):
+    cache._history[slug][1] -= minutes * 60
+
+
+def test_learned_ttl_follows_feed_change_rate():
+    cache = LichessCache(cache_ttl_minutes=15, min_ttl_minutes=5, max_ttl_minutes=720, ttl_change_fraction=0.25)
+    # No history yet: configured TTL
+    cache.set_tournaments("active", [_t("1")])
+    assert cache.ttl_for("active") == timedelta(minutes=15)
+    assert cache.ttls() == {}
+    # Feed changed 40 minutes after the previous change
+    _shift_last_change(cache, "active", 40)
+    cache.set_tournaments("active", [_t("2")])
+    assert cache.ttls()["active"] == pytest.approx(10, abs=0.1)
+    # A team changing every minute is clamped to the lower bound
+    cache.set_tournaments("hectic", [_t("1")])
+    _shift_last_change(cache, "hectic", 1)
+    cache.set_tournaments("hectic", [_t("2")])
+    assert cache.ttls()["hectic"] == 5
+    assert cache.stats()["learned_ttls"] == 2
+
+
+def test_quiet_team_gets_long_ttl_and_stays_fresh():
+    cache = LichessCache(cache_ttl_minutes=15, stale_grace_minutes=60, max_ttl_minutes=720, ttl_change_fraction=0.25)
+    cache.set_tournaments("quiet", [_t("1")])
+    # Same content fetched again ten days later
+    _shift_last_change(cache, "quiet", 10 * 24 * 60)
+    cache.set_tournaments("quiet", [_t("1")])
+    assert cache.ttls()["quiet"] == 720
+    _age(cache, "quiet", 120)
+    assert cache.get_tournaments("quiet") == [_t("1")]
+
+
+def test_learned_ttl_survives_restart_and_invalidate_forgets_it(tmp_path):
+    path = str(tmp_path / "cache.json")
+    cache = LichessCache(persist_path=path, ttl_change_fraction=0.25)
+    cache.set_tournaments("t", [_t("1")])
+    _shift_last_change(cache, "t", 120)
+    cache.set_tournaments("t", [_t("2")])
+    cache.flush()
+    restarted = LichessCache(persist_path=path, ttl_change_fraction=0.25)
+    assert restarted.ttl_for("t") == cache.ttl_for("t")
+    restarted.invalidate("t")
+    assert restarted.ttls() == {}
+
+
+def test_change_history_is_bounded_by_max_entries(tmp_path):
+    path = str(tmp_path / "cache.json")
+    cache = LichessCache(persist_path=path, max_entries=2, ttl_change_fraction=0.25)
+    for slug in ("a", "b", "c"):
+        cache.set_tournaments(slug, [_t("1")])
+        _shift_last_change(cache, slug, 120)
+        cache.set_tournaments(slug, [_t("2")])
+    # The least recently fetched team's history and TTL are dropped with its entry
+    assert list(cache._history) == ["b", "c"]
+    assert set(cache.ttls()) == {"b", "c"}
+    cache.flush()
+    assert set(LichessCache(persist_path=path, max_entries=1).ttls()) == {"c"}
+
+
+@pytest.mark.asyncio
+async def test_cached_empty_feed_is_a_hit(monkeypatch):
+    fetched = []
+    async def fetch(team, verbose=False, label="lichess"):
+        fetched.append(team)
+        return []
+    monkeypatch.setattr(sync_mod, "fetch_team_tournaments", fetch)
+    # A team with no upcoming arenas is cached as an empty list
+    sync_mod.cache.set_tournaments("quiet", [])
+    assert await sync_mod.fetch_tournaments_for_teams(["quiet"]) == {"quiet": []}
+    guild = type("Guild", (), {"name": "g"})()
+    assert await sync_mod._tournaments_for_team("quiet", guild, False, None) == []
+    assert fetched == []
@@ -92,12 +92,11 @@ async def test_remove_team_registered_no_events(monkeypatch, bot, interaction, s
         async def __aexit__(self, exc_type, exc, tb): pass
 
     class DummySession:
-        async def __aenter__(self): return self
-        async def __aexit__(self, exc_type, exc, tb): pass
-        def get(self, url): return DummyResponse()
+        closed = False
+        def get(self, url, **kwargs): return DummyResponse()
 
-    # Patch aiohttp.ClientSession
-    monkeypatch.setattr('src.commands.aiohttp.ClientSession', DummySession)
+    # Patch the pooled Lichess session
+    monkeypatch.setattr('src.commands.lichess_client._session', DummySession())
 
     setup_commands(bot, settings, save_settings)
     cmd = bot.tree.get_command('remove_team')
@@ -29,6 +29,17 @@ async def test_sync_cmd_positive(bot, interaction, settings, save_settings, monk
     expected = "✅ 2 new events created, 🔄 1 events updated:\nurl1\nurl2\nurl3"
     interaction.followup.send.assert_awaited_with(expected, ephemeral=True)
 
+@pytest.mark.asyncio
+async def test_sync_cmd_reconciles_all_teams_in_one_plan(bot, interaction, settings, save_settings, monkeypatch):
+    settings[str(interaction.guild_id)] = {'teams': ['team1', 'team2']}
+    setup_commands(bot, settings, save_settings)
+    setup_sync(monkeypatch)
+    import src.commands as commands_mod
+
+    await bot.tree.get_command('sync').callback(interaction)
+    commands_mod.sync_events_for_guild.assert_awaited_once()
+    assert commands_mod.sync_events_for_guild.await_args.kwargs['team_slug'] is None
+
 @pytest.mark.asyncio
 async def test_sync_verbose_cmd_positive(bot, interaction, settings, save_settings, monkeypatch):
     # Register one team
@@ -85,8 +96,9 @@ async def test_prefix_sync_verbose_positive(bot, settings, save_settings, monkey
 async def test_remove_team_deletes_events(monkeypatch, bot, interaction, settings, save_settings):
     # Setup a registered team
     settings[str(interaction.guild_id)] = {'teams': ['teamX']}
-    # Dummy response with one tournament ID
-    data = {'id': 'xyz'}
+    # Dummy response with one upcoming tournament
+    from datetime import datetime, timezone, timedelta
+    data = {'id': 'xyz', 'startsAt': int((datetime.now(timezone.utc) + timedelta(hours=1)).timestamp() * 1000)}
     raw = json.dumps(data).encode() + b"\n"
     class DummyResp:
         def __init__(self):
@@ -104,12 +116,11 @@ async def test_remove_team_deletes_events(monkeypatch, bot, interaction, setting
                 return self._lines.pop(0)
             raise StopAsyncIteration
     class DummySession:
-        async def __aenter__(self): return self
-        async def __aexit__(self, exc_type, exc, tb): pass
-        def get(self, url): return DummyResp()
-    # Patch aiohttp.ClientSession
+        closed = False
+        def get(self, url, **kwargs): return DummyResp()
+    # Patch the pooled Lichess session
     import src.commands as cmd_mod
-    monkeypatch.setattr(cmd_mod.aiohttp, 'ClientSession', DummySession)
+    monkeypatch.setattr(cmd_mod.lichess_client, '_session', DummySession())
     # Mock fetch_scheduled_events to return one event
     ev = MagicMock()
     ev.location = 'https://lichess.org/tournament/xyz'
@@ -187,3 +198,58 @@ async def test_auto_sync_logs_to_channel(bot, interaction, settings, save_settin
     finally:
         # Restore the original TextChannel class
         monkeypatch.setattr(discord, 'TextChannel', original_TextChannel)
+
+@pytest.mark.asyncio
+async def test_remove_team_keeps_events_of_remaining_teams(bot, interaction, settings, save_settings):
+    from src.cache import cache
+    from src.lichess import Tournament
+    settings[str(interaction.guild_id)] = {'teams': ['teamX', 'teamY']}
+    cache.set_tournaments('teamX', [Tournament('own', None, 1, 2, 3, 0), Tournament('shared', None, 1, 2, 3, 0)])
+    cache.set_tournaments('teamY', [Tournament('shared', None, 1, 2, 3, 0)])
+    own, shared = MagicMock(), MagicMock()
+    own.location = 'https://lichess.org/tournament/own'
+    shared.location = 'https://lichess.org/tournament/shared'
+    own.delete, shared.delete = AsyncMock(), AsyncMock()
+    interaction.guild.fetch_scheduled_events = AsyncMock(return_value=[own, shared])
+    setup_commands(bot, settings, save_settings)
+    cmd = bot.tree.get_command('remove_team')
+    await cmd.callback(interaction, team='teamX')
+    own.delete.assert_awaited_once()
+    shared.delete.assert_not_awaited()
+    interaction.followup.send.assert_awaited_with(
+        "🗑️ Team `teamX` removed. Deleted 1 associated event(s).", ephemeral=True
+    )
+
+@pytest.mark.asyncio
+async def test_remove_team_waits_for_a_running_sync(bot, interaction, settings, save_settings):
+    import asyncio
+    from src.cache import cache
+    from src.lichess import Tournament
+    from src.sync import guild_lock
+    settings[str(interaction.guild_id)] = {'teams': ['teamX']}
+    cache.set_tournaments('teamX', [Tournament('own', None, 1, 2, 3, 0)])
+    interaction.guild.fetch_scheduled_events = AsyncMock(return_value=[])
+    setup_commands(bot, settings, save_settings)
+    lock = guild_lock(interaction.guild.id)
+    await lock.acquire()
+    removal = asyncio.create_task(bot.tree.get_command('remove_team').callback(interaction, team='teamX'))
+    await asyncio.sleep(0.01)
+    # The guild's events are not listed while a sync holds the lock
+    interaction.guild.fetch_scheduled_events.assert_not_awaited()
+    lock.release()
+    await removal
+    interaction.guild.fetch_scheduled_events.assert_awaited()
+
+@pytest.mark.asyncio
+async def test_remove_team_drops_its_queued_writes(bot, interaction, settings, save_settings):
+    import asyncio
+    from src.cache import cache
+    from src.lichess import Tournament
+    from src.outbox import outbox, OutboxEntry, CREATE
+    settings[str(interaction.guild_id)] = {'teams': ['teamX', 'teamY']}
+    cache.set_tournaments('teamX', [])
+    outbox.add(OutboxEntry(interaction.guild.id, CREATE, 'x1', 'teamX'), asyncio.TimeoutError(), now=0)
+    outbox.add(OutboxEntry(interaction.guild.id, CREATE, 'y1', 'teamY'), asyncio.TimeoutError(), now=0)
+    setup_commands(bot, settings, save_settings)
+    await bot.tree.get_command('remove_team').callback(interaction, team='teamX')
+    assert [entry.tournament_id for entry in outbox.entries.values()] == ['y1']
@@ -0,0 +1,262 @@
+import pytest
+import time
+from datetime import datetime, timezone, timedelta
+from unittest.mock import AsyncMock, MagicMock
+
+import src.sync as sync_mod
+from src.event_index import EventIndex
+from src.events import DesiredEvent
+from src.lichess import Tournament
+
+
+def _event(event_id, tid, guild_id=1, name="Arena"):
+    ev = MagicMock()
+    ev.id = event_id
+    ev.guild_id = guild_id
+    ev.location = f"https://lichess.org/tournament/{tid}"
+    ev.name = name
+    ev.description = ""
+    ev.start_time = ev.end_time = datetime(2030, 1, 1, tzinfo=timezone.utc)
+    return ev
+
+
+def test_index_snapshot_survives_restart(tmp_path):
+    path = str(tmp_path / "index.json")
+    index = EventIndex(persist_path=path, flush_every=100)
+    index.replace_guild(1, [_event(10, "a"), _event(11, "b")])
+    index.record(1, "c", 12, "hash-c")
+    index.flush()
+    restarted = EventIndex(persist_path=path)
+    # Events may have been deleted while the bot was offline
+    assert restarted.needs_verification(1)
+    assert {tid: (e.event_id, e.content_hash) for tid, e in restarted.existing(1).items()}["c"] == (12, "hash-c")
+    assert set(restarted.existing(1)) == {"a", "b", "c"}
+    assert restarted.needs_verification(2)
+
+
+def test_index_verification_expires():
+    index = EventIndex(persist_path=None, verify_hours=1)
+    index.replace_guild(1, [])
+    assert not index.needs_verification(1)
+    index.verified_at[1] = time.time() - 7200
+    assert index.needs_verification(1)
+
+
+def test_index_follows_gateway_dispatches():
+    index = EventIndex(persist_path=None)
+    ev = _event(10, "a", guild_id=5)
+    index.observe(ev)
+    assert index.existing(5)["a"].event_id == 10
+    # Edits made in Discord change the stored hash, so the next sync repairs them
+    before = index.existing(5)["a"].content_hash
+    ev.name = "Renamed by a moderator"
+    index.observe(ev)
+    assert index.existing(5)["a"].content_hash != before
+    # A delete of an older duplicate does not drop the current entry
+    index.observe_delete(_event(9, "a", guild_id=5))
+    assert "a" in index.existing(5)
+    index.observe_delete(ev)
+    assert index.existing(5) == {}
+    # Events that are not Lichess tournaments are ignored
+    other = _event(11, "x", guild_id=5)
+    other.location = "Voice channel"
+    index.observe(other)
+    assert index.existing(5) == {}
+
+
+@pytest.mark.asyncio
+async def test_steady_state_sync_needs_no_list_call(monkeypatch):
+    future_ms = int((datetime.now(timezone.utc) + timedelta(hours=1)).timestamp() * 1000)
+    feed = [Tournament("i1", "Indexed", future_ms, future_ms + 3600000, 3, 0)]
+    guild = MagicMock()
+    guild.id = 77
+    guild.me.guild_permissions.manage_events = True
+    guild.fetch_scheduled_events = AsyncMock(return_value=[])
+    guild.create_scheduled_event = AsyncMock(return_value=MagicMock(id=500))
+    monkeypatch.setattr(sync_mod, 'log_to_notification_channel', AsyncMock())
+    SETTINGS = {"77": {"teams": ["team1"]}}
+    # First sync verifies the guild with one list call and records the created event
+    assert (await sync_mod.sync_events_for_guild(guild, SETTINGS, None, prefetched_tournaments={"team1": feed}))[0] == 1
+    assert sync_mod.event_index.existing(77)["i1"].event_id == 500
+    # Later syncs are answered by the index
+    created, updated, _ = await sync_mod.sync_events_for_guild(
+        guild, SETTINGS, None, prefetched_tournaments={"team1": feed}
+    )
+    assert (created, updated) == (0, 0)
+    guild.fetch_scheduled_events.assert_awaited_once()
+    # A changed tournament is edited through the event looked up by id
+    changed = [Tournament("i1", "Renamed", future_ms, future_ms + 3600000, 3, 0)]
+    cached_event = MagicMock()
+    cached_event.edit = AsyncMock()
+    guild.get_scheduled_event.return_value = cached_event
+    created, updated, _ = await sync_mod.sync_events_for_guild(
+        guild, SETTINGS, None, prefetched_tournaments={"team1": changed}
+    )
+    assert (created, updated) == (0, 1)
+    guild.get_scheduled_event.assert_called_with(500)
+    cached_event.edit.assert_awaited_once()
+    assert sync_mod.event_index.existing(77)["i1"].content_hash == DesiredEvent.from_tournament(changed[0]).content_hash
+    guild.fetch_scheduled_events.assert_awaited_once()
+
+
+def _gateway_guild(guild_id, events):
+    guild = MagicMock()
+    guild.id = guild_id
+    guild.unavailable = False
+    guild.scheduled_events = events
+    guild.me.guild_permissions.manage_events = True
+    guild.fetch_scheduled_events = AsyncMock(return_value=events)
+    return guild
+
+
+def test_gateway_cache_used_only_when_complete():
+    index = EventIndex(persist_path=None)
+    a, b = _event(10, "a"), _event(11, "b")
+    guild = _gateway_guild(1, [a, b])
+    assert index.gateway_events(guild) == [a, b]
+    index.replace_guild(1, [a, b])
+    # An indexed event missing from the cache means the cache cannot be trusted
+    guild.scheduled_events = [a]
+    assert index.gateway_events(guild) is None
+    guild.scheduled_events = [a, b]
+    guild.unavailable = True
+    assert index.gateway_events(guild) is None
+    guild.unavailable = False
+    assert EventIndex(persist_path=None, gateway_cache=False).gateway_events(guild) is None
+
+
+@pytest.mark.asyncio
+async def test_sync_reads_gateway_cache_instead_of_rest(monkeypatch):
+    future_ms = int((datetime.now(timezone.utc) + timedelta(hours=1)).timestamp() * 1000)
+    feed = [Tournament("g1", "Gateway", future_ms, future_ms + 3600000, 3, 0)]
+    desired = DesiredEvent.from_tournament(feed[0])
+    ev = _event(42, "g1", guild_id=88, name=desired.name)
+    ev.description, ev.start_time, ev.end_time = desired.description, desired.start_time, desired.end_time
+    guild = _gateway_guild(88, [ev])
+    monkeypatch.setattr(sync_mod, 'log_to_notification_channel', AsyncMock())
+    created, updated, _ = await sync_mod.sync_events_for_guild(
+        guild, {"88": {"teams": ["team1"]}}, None, prefetched_tournaments={"team1": feed}
+    )
+    assert (created, updated) == (0, 0)
+    guild.fetch_scheduled_events.assert_not_awaited()
+    assert sync_mod.event_index.existing(88)["g1"].event_id == 42
+    # When the cache misses an indexed event, the REST list is the fallback
+    guild.scheduled_events = []
+    guild.fetch_scheduled_events = AsyncMock(return_value=[ev])
+    sync_mod.event_index.verified_at[88] = 0
+    await sync_mod.sync_events_for_guild(
+        guild, {"88": {"teams": ["team1"]}}, None, prefetched_tournaments={"team1": feed}
+    )
+    guild.fetch_scheduled_events.assert_awaited_once_with(with_counts=False)
+
+
+def test_applied_digests_cleared_by_outside_changes(tmp_path):
+    path = str(tmp_path / "index.json")
+    index = EventIndex(persist_path=path, flush_every=100)
+    ev = _event(10, "a", guild_id=3)
+    index.replace_guild(3, [ev])
+    index.record_applied(3, "team", "d1")
+    # Our own write echoed by the gateway changes nothing
+    index.observe(ev)
+    index.replace_guild(3, [ev])
+    assert index.applied_digest(3, "team") == "d1"
+    index.flush()
+    assert EventIndex(persist_path=path).applied_digest(3, "team") == "d1"
+    # A moderator deleting the event invalidates the guild's digests
+    index.observe_delete(ev)
+    assert index.applied_digest(3, "team") is None
+    # So does a verification that finds a different event list
+    index.record_applied(3, "team", "d2")
+    index.replace_guild(3, [_event(11, "b", guild_id=3)])
+    assert index.applied_digest(3, "team") is None
+
+
+@pytest.mark.asyncio
+async def test_unchanged_feed_skips_reconcile(monkeypatch):
+    future_ms = int((datetime.now(timezone.utc) + timedelta(hours=1)).timestamp() * 1000)
+    feed = [Tournament("d1", "Digest", future_ms, future_ms + 3600000, 3, 0)]
+    guild = MagicMock()
+    guild.id = 88
+    guild.me.guild_permissions.manage_events = True
+    guild.fetch_scheduled_events = AsyncMock(return_value=[])
+    guild.create_scheduled_event = AsyncMock(return_value=MagicMock(id=600))
+    monkeypatch.setattr(sync_mod, 'log_to_notification_channel', AsyncMock())
+    build_plan = MagicMock(side_effect=sync_mod.build_plan)
+    monkeypatch.setattr(sync_mod, 'build_plan', build_plan)
+    SETTINGS = {"88": {"teams": ["team1"]}}
+    stats = sync_mod.event_index.stats
+    hits, misses = stats["digest_hits"], stats["digest_misses"]
+    assert (await sync_mod.sync_events_for_guild(guild, SETTINGS, None, prefetched_tournaments={"team1": feed}))[0] == 1
+    # Same feed again: no plan, no event lookup, no Discord call
+    index_syncs = stats["index_syncs"]
+    for _ in range(3):
+        assert await sync_mod.sync_events_for_guild(
+            guild, SETTINGS, None, prefetched_tournaments={"team1": list(feed)}
+        ) == (0, 0, [])
+    assert build_plan.call_count == 1
+    assert stats["index_syncs"] == index_syncs
+    assert (stats["digest_hits"] - hits, stats["digest_misses"] - misses) == (3, 1)
+    guild.create_scheduled_event.assert_awaited_once()
+    # The event is deleted in Discord: the next sync reconciles and recreates it
+    deleted = _event(600, "d1", guild_id=88)
+    sync_mod.event_index.observe_delete(deleted)
+    assert (await sync_mod.sync_events_for_guild(guild, SETTINGS, None, prefetched_tournaments={"team1": feed}))[0] == 1
+    assert build_plan.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_forced_sync_recreates_events_deleted_while_offline(monkeypatch):
+    future_ms = int((datetime.now(timezone.utc) + timedelta(hours=1)).timestamp() * 1000)
+    feed = [Tournament("f1", "Forced", future_ms, future_ms + 3600000, 3, 0)]
+    guild = MagicMock()
+    guild.id = 89
+    guild.me.guild_permissions.manage_events = True
+    guild.fetch_scheduled_events = AsyncMock(return_value=[])
+    guild.create_scheduled_event = AsyncMock(return_value=MagicMock(id=610))
+    monkeypatch.setattr(sync_mod, 'log_to_notification_channel', AsyncMock())
+    SETTINGS = {"89": {"teams": ["team1"]}}
+    assert (await sync_mod.sync_events_for_guild(guild, SETTINGS, None, prefetched_tournaments={"team1": feed}))[0] == 1
+    # The event was deleted while the bot was offline: no gateway delete arrived,
+    # so a normal sync trusts the applied digest
+    assert (await sync_mod.sync_events_for_guild(guild, SETTINGS, None, prefetched_tournaments={"team1": feed}))[0] == 0
+    created, _, _ = await sync_mod.sync_events_for_guild(
+        guild, SETTINGS, None, prefetched_tournaments={"team1": feed}, force=True
+    )
+    assert created == 1
+    assert guild.fetch_scheduled_events.await_count == 2
+    assert sync_mod.event_index.get(89, "f1").event_id == 610
+
+
+@pytest.mark.asyncio
+async def test_first_sync_after_restart_notices_offline_deletes(tmp_path, monkeypatch):
+    future_ms = int((datetime.now(timezone.utc) + timedelta(hours=1)).timestamp() * 1000)
+    feed = [Tournament("r1", "Restart", future_ms, future_ms + 3600000, 3, 0)]
+    path = str(tmp_path / "index.json")
+    index = EventIndex(persist_path=path, flush_every=100)
+    index.replace_guild(77, [_event(50, "r1", guild_id=77)])
+    index.record_applied(77, "team1", sync_mod.cache.digest("team1", feed))
+    index.flush()
+    # The event was deleted while the bot was offline
+    monkeypatch.setattr(sync_mod, "event_index", EventIndex(persist_path=path))
+    monkeypatch.setattr(sync_mod, 'log_to_notification_channel', AsyncMock())
+    guild = MagicMock()
+    guild.id, guild.name, guild.unavailable = 77, "Restarted", True
+    guild.fetch_scheduled_events = AsyncMock(return_value=[])
+    guild.create_scheduled_event = AsyncMock(return_value=_event(51, "r1", guild_id=77))
+    created, _, _ = await sync_mod.sync_events_for_guild(
+        guild, {"77": {"teams": ["team1"]}}, None, prefetched_tournaments={"team1": feed}
+    )
+    assert created == 1
+    guild.fetch_scheduled_events.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_verify_lists_over_rest_even_with_gateway_cache():
+    # The gateway cache looks complete, but a manual sync re-lists anyway
+    ev = _event(60, "v1", guild_id=66)
+    guild = _gateway_guild(66, [ev])
+    guild.fetch_scheduled_events = AsyncMock(return_value=[])
+    existing = await sync_mod.existing_events_for_guild(guild, verify=True)
+    assert existing == {}
+    guild.fetch_scheduled_events.assert_awaited_once_with(with_counts=False)
+    assert "v1" in await sync_mod.existing_events_for_guild(_gateway_guild(66, [ev]))
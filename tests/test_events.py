@@ -0,0 +1,196 @@
+import json
+import pytest
+from datetime import datetime, timezone, timedelta
+from unittest.mock import AsyncMock, MagicMock
+
+import src.sync as sync_mod
+from src.cache import LichessCache
+from src.events import (
+    DesiredEvent, EditChurn, build_plan, index_scheduled_events, scheduled_event_fingerprint,
+)
+from src.lichess import Tournament
+
+
+def _tournament(tid="t1", name="Blitz Arena", minutes=3, increment=2):
+    starts_at = int(datetime(2030, 1, 1, 18, 0, tzinfo=timezone.utc).timestamp() * 1000)
+    return Tournament(tid, name, starts_at, starts_at + 3600000, minutes, increment)
+
+
+def test_desired_event_renders_once_from_tournament():
+    ev = DesiredEvent.from_tournament(_tournament())
+    assert ev.url == "https://lichess.org/tournament/t1"
+    assert ev.name == "Blitz Arena"
+    assert ev.start_time == datetime(2030, 1, 1, 18, 0, tzinfo=timezone.utc)
+    assert ev.end_time == datetime(2030, 1, 1, 19, 0, tzinfo=timezone.utc)
+    assert ev.description == (
+        "**Lichess Arena Tournament**\n"
+        "• 2030-01-01 18:00 UTC – 19:00 UTC\n"
+        "• 3 min · +2s\n\n"
+        "https://lichess.org/tournament/t1"
+    )
+
+
+def test_desired_event_default_name_and_content_hash():
+    ev = DesiredEvent.from_tournament(_tournament(name=None))
+    assert ev.name == "Arena t1"
+    assert ev.content_hash == DesiredEvent.from_tournament(_tournament(name=None)).content_hash
+    assert ev.content_hash != DesiredEvent.from_tournament(_tournament(increment=0)).content_hash
+
+
+def test_cache_renders_each_entry_once():
+    cache = LichessCache(persist_path=None)
+    tournaments = [_tournament("a"), _tournament("b")]
+    cache.set_tournaments("team", tournaments)
+    bytes_before = cache.stats()["bytes"]
+    first = cache.desired_events("team", tournaments)
+    assert cache.desired_events("team", tournaments) is first
+    assert [ev.tournament_id for ev in first] == ["a", "b"]
+    stats = cache.stats()
+    assert stats["renders"] == 1 and stats["bytes"] > bytes_before
+    # A new fetch replaces the entry and its rendered events
+    refreshed = [_tournament("c")]
+    cache.set_tournaments("team", refreshed)
+    assert [ev.tournament_id for ev in cache.desired_events("team", refreshed)] == ["c"]
+    assert cache.stats()["renders"] == 2
+    # Lists that are not the cached entry are rendered but not kept
+    cache.desired_events("other", refreshed)
+    assert "other" not in cache._events
+    cache.invalidate("team")
+    assert cache.stats()["bytes"] == 0
+
+
+@pytest.mark.asyncio
+async def test_guilds_share_rendered_events(monkeypatch):
+    future_ms = int((datetime.now(timezone.utc) + timedelta(hours=1)).timestamp() * 1000)
+    feed = [Tournament("s1", "Shared", future_ms, future_ms + 3600000, 3, 0)]
+    sync_mod.cache.set_tournaments("team1", feed)
+    monkeypatch.setattr(sync_mod, 'log_to_notification_channel', AsyncMock())
+    created_with = []
+    renders_before = sync_mod.cache.stats()["renders"]
+    for gid in (1, 2, 3):
+        guild = MagicMock()
+        guild.id = gid
+        guild.me.guild_permissions.manage_events = True
+        guild.create_scheduled_event = AsyncMock(side_effect=lambda **kw: created_with.append(kw))
+        SETTINGS = {str(gid): {"teams": ["team1"]}}
+        await sync_mod.sync_events_for_guild(
+            guild, SETTINGS, None, prefetched_events=[], prefetched_tournaments={"team1": feed}
+        )
+    assert len(created_with) == 3
+    assert sync_mod.cache.stats()["renders"] == renders_before + 1
+    # Every guild received the very same rendered description
+    assert all(kw["description"] is created_with[0]["description"] for kw in created_with)
+
+
+@pytest.mark.asyncio
+async def test_freshly_fetched_feed_is_rendered_once(monkeypatch):
+    future_ms = int((datetime.now(timezone.utc) + timedelta(hours=1)).timestamp() * 1000)
+    line = json.dumps({"id": "f1", "fullName": "Fresh", "startsAt": future_ms, "finishesAt": future_ms + 60000})
+    class DummyResp:
+        status = 200
+        def __init__(self):
+            self._lines = [line.encode() + b"\n", b""]
+            self.content = self
+        async def __aenter__(self): return self
+        async def __aexit__(self, exc_type, exc, tb): pass
+        async def readline(self): return self._lines.pop(0)
+        def close(self): pass
+    class DummySession:
+        closed = False
+        def get(self, url, **kwargs): return DummyResp()
+    monkeypatch.setattr(sync_mod.lichess_client, '_session', DummySession())
+    monkeypatch.setattr(sync_mod, 'log_to_notification_channel', AsyncMock())
+    team_feeds = await sync_mod.fetch_tournaments_for_teams(["fresh"])
+    # The fetched list is the cached one, so its rendering and digest are shared
+    assert team_feeds["fresh"] is sync_mod.cache.team_tournaments["fresh"][1]
+    renders_before = sync_mod.cache.stats()["renders"]
+    for gid in (1, 2, 3):
+        guild = MagicMock()
+        guild.id = gid
+        guild.me.guild_permissions.manage_events = True
+        guild.create_scheduled_event = AsyncMock(return_value=MagicMock(id=gid))
+        await sync_mod.sync_events_for_guild(
+            guild, {str(gid): {"teams": ["fresh"]}}, None, prefetched_events=[], prefetched_tournaments=team_feeds
+        )
+    assert sync_mod.cache.stats()["renders"] == renders_before + 1
+
+
+def test_fingerprint_ignores_discord_formatting():
+    desired = DesiredEvent.from_tournament(_tournament())
+    ev = MagicMock()
+    ev.name = " Blitz Arena "
+    ev.description = desired.description.replace("\n", "\r\n") + "  \n"
+    ev.start_time = (desired.start_time + timedelta(microseconds=250)).astimezone(timezone(timedelta(hours=2)))
+    ev.end_time = desired.end_time
+    assert scheduled_event_fingerprint(ev) == desired.content_hash
+    ev.end_time = desired.end_time + timedelta(minutes=5)
+    assert scheduled_event_fingerprint(ev) != desired.content_hash
+
+
+def test_edit_churn_flags_repeated_edits():
+    churn = EditChurn(threshold=2)
+    desired = DesiredEvent.from_tournament(_tournament())
+    assert not churn.record_edit(1, desired)
+    assert churn.record_edit(1, desired)
+    assert churn.churning() == [(1, desired.url)]
+    assert churn.stats["churning"] == 1
+    # Matching on the next sync clears the flag
+    churn.record_unchanged(1, desired)
+    assert churn.churning() == [] and churn.stats["churning"] == 0
+    # Streaks of events that are over are pruned
+    churn.record_edit(2, desired)
+    churn.prune(desired.end_time)
+    assert churn._streaks == {}
+
+
+@pytest.mark.asyncio
+async def test_unchanged_event_is_not_edited(monkeypatch):
+    future_ms = int((datetime.now(timezone.utc) + timedelta(hours=1)).timestamp() * 1000)
+    feed = [Tournament("u1", "Steady", future_ms, future_ms + 3600000, 3, 0)]
+    desired = DesiredEvent.from_tournament(feed[0])
+    ev = MagicMock()
+    ev.location = desired.url
+    ev.name = desired.name
+    ev.description = desired.description.replace("\n", "\r\n")
+    ev.start_time = desired.start_time
+    ev.end_time = desired.end_time
+    ev.edit = AsyncMock()
+    guild = MagicMock()
+    guild.id = 9
+    guild.me.guild_permissions.manage_events = True
+    guild.create_scheduled_event = AsyncMock()
+    monkeypatch.setattr(sync_mod, 'log_to_notification_channel', AsyncMock())
+    unchanged_before = sync_mod.edit_churn.stats["unchanged"]
+    created, updated, _ = await sync_mod.sync_events_for_guild(
+        guild, {"9": {"teams": ["team1"]}}, None, prefetched_events=[ev], prefetched_tournaments={"team1": feed}
+    )
+    assert (created, updated) == (0, 0)
+    ev.edit.assert_not_awaited()
+    guild.create_scheduled_event.assert_not_awaited()
+    assert sync_mod.edit_churn.stats["unchanged"] == unchanged_before + 1
+
+
+def test_build_plan_merges_teams_and_deduplicates():
+    now = datetime(2029, 1, 1, tzinfo=timezone.utc)
+    shared = DesiredEvent.from_tournament(_tournament("shared"))
+    only_b = DesiredEvent.from_tournament(_tournament("b"))
+    stale = MagicMock()
+    stale.location = shared.url
+    stale.name, stale.description = "old", "old"
+    stale.start_time, stale.end_time = shared.start_time, shared.end_time
+    gone = MagicMock()
+    gone.location = "https://lichess.org/tournament/gone"
+    other = MagicMock()
+    other.location = "https://example.com/meetup"
+    existing = index_scheduled_events([stale, gone, other])
+    assert set(existing) == {"shared", "gone"}
+    plan = build_plan(existing, {"a": [shared], "b": [shared, only_b]}, now,
+                      delete_ids=["gone", "shared"])
+    # The shared arena is planned once, for the first team listing it, and never deleted
+    assert [(team, d.tournament_id, e.event) for team, d, e in plan.updates] == [("a", "shared", stale)]
+    assert [(team, d.tournament_id) for team, d in plan.creates] == [("b", "b")]
+    assert [(tid, e.event) for tid, e in plan.deletes] == [("gone", gone)]
+    assert len(plan) == 3
+    # Already started tournaments are left alone
+    later = build_plan({}, {"a": [shared]}, shared.start_time)
+    assert len(later) == 0 and later.skipped_started == 1
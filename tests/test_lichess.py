@@ -0,0 +1,132 @@
+import pytest
+
+import src.lichess as lichess_mod
+from src.lichess import LichessClient
+
+
+@pytest.mark.asyncio
+async def test_session_is_pooled_and_reused():
+    client = LichessClient(pool_size=7, per_host_limit=3, dns_cache_ttl=120, keepalive_timeout=30)
+    try:
+        session = client.session
+        # Same session is returned for every call
+        assert client.session is session
+        connector = session.connector
+        assert connector.limit == 7
+        assert connector.limit_per_host == 3
+        assert connector.use_dns_cache is True
+    finally:
+        await client.close()
+
+
+@pytest.mark.asyncio
+async def test_close_releases_session_and_reopens_lazily():
+    client = LichessClient()
+    session = client.session
+    await client.close()
+    assert session.closed
+    assert client._session is None
+    # A new session is created on next use
+    reopened = client.session
+    assert reopened is not session and not reopened.closed
+    await client.close()
+
+
+@pytest.mark.asyncio
+async def test_close_without_session_is_noop():
+    client = LichessClient()
+    await client.close()
+    assert client._session is None
+
+
+def test_team_arena_url():
+    assert LichessClient.team_arena_url("lichess-de") == "https://lichess.org/api/team/lichess-de/arena"
+
+
+class DummyResp:
+    def __init__(self, status=200, headers=None):
+        self.status = status
+        self.headers = headers or {}
+    async def __aenter__(self): return self
+    async def __aexit__(self, exc_type, exc, tb): pass
+
+
+@pytest.mark.asyncio
+async def test_get_uses_shared_session():
+    calls = []
+    class DummySession:
+        closed = False
+        def get(self, url, **kwargs):
+            calls.append((url, kwargs))
+            return DummyResp()
+    client = LichessClient(session=DummySession())
+    async with client.get("https://lichess.org/x", params={"max": 1}) as resp:
+        assert resp.status == 200
+    async with client.get("https://lichess.org/y"):
+        pass
+    assert calls == [("https://lichess.org/x", {"params": {"max": 1}}), ("https://lichess.org/y", {})]
+    assert client.governor.stats["requests"] == 2
+
+
+def test_singleton_client_exists():
+    assert isinstance(lichess_mod.lichess_client, LichessClient)
+
+
+@pytest.mark.asyncio
+async def test_get_team_arena_requests_upcoming_only():
+    calls = []
+    class DummySession:
+        closed = False
+        def get(self, url, **kwargs):
+            calls.append((url, kwargs))
+            return DummyResp()
+    client = LichessClient(session=DummySession())
+    async with client.get_team_arena("team1", max_tournaments=25):
+        pass
+    assert calls == [(
+        "https://lichess.org/api/team/team1/arena",
+        {"params": {"status": "created", "max": 25}},
+    )]
+
+
+def test_is_finished():
+    now_ms = 1_000_000
+    assert lichess_mod.is_finished({"status": lichess_mod.STATUS_FINISHED}, now_ms)
+    assert lichess_mod.is_finished({"finishesAt": now_ms - 1}, now_ms)
+    assert not lichess_mod.is_finished({"status": lichess_mod.STATUS_CREATED, "finishesAt": now_ms + 1}, now_ms)
+    assert not lichess_mod.is_finished({}, now_ms)
+
+
+@pytest.mark.asyncio
+async def test_get_retries_after_429_with_retry_after(monkeypatch):
+    responses = [DummyResp(429, {"Retry-After": "0"}), DummyResp(200)]
+    class DummySession:
+        closed = False
+        def get(self, url, **kwargs): return responses.pop(0)
+    client = LichessClient(session=DummySession(), max_retries=1)
+    async with client.get("https://lichess.org/z") as resp:
+        assert resp.status == 200
+    assert client.governor.stats["rate_limited"] == 1
+    assert client.governor.stats["requests"] == 2
+
+
+@pytest.mark.asyncio
+async def test_get_returns_429_when_retries_exhausted():
+    class DummySession:
+        closed = False
+        def get(self, url, **kwargs): return DummyResp(429, {"Retry-After": "0"})
+    client = LichessClient(session=DummySession(), max_retries=0)
+    async with client.get("https://lichess.org/z") as resp:
+        assert resp.status == 429
+    assert client.governor.stats["rate_limited"] == 1
+
+
+def test_tournament_record_keeps_only_used_fields():
+    data = {"id": "abc", "fullName": "Blitz Arena", "startsAt": 1000, "minutes": 30,
+            "clock": {"limit": 180, "increment": 2}, "nbPlayers": 12, "variant": {"key": "standard"}}
+    t = lichess_mod.Tournament.from_json(data)
+    assert (t.id, t.full_name, t.starts_at, t.minutes, t.increment) == ("abc", "Blitz Arena", 1000, 30, 2)
+    # Missing finishesAt defaults to one hour after the start
+    assert t.finishes_at == 1000 + 3600000
+    assert not hasattr(t, "__dict__")
+    assert lichess_mod.Tournament.from_row(t.to_row()) == t
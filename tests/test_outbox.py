@@ -0,0 +1,210 @@
+import asyncio
+import pytest
+from datetime import datetime, timezone, timedelta
+from unittest.mock import AsyncMock, MagicMock
+
+import discord
+
+import src.sync as sync_mod
+from src.events import DesiredEvent, EventPlan
+from src.lichess import Tournament
+from src.outbox import Outbox, OutboxEntry, CREATE, UPDATE, DELETE, is_transient
+
+SETTINGS = {"42": {"teams": ["team1"]}}
+
+
+def _desired(tid="o1", name="Outbox Arena"):
+    start_ms = int((datetime.now(timezone.utc) + timedelta(hours=2)).timestamp() * 1000)
+    return DesiredEvent.from_tournament(Tournament(tid, name, start_ms, start_ms + 3600000, 3, 0))
+
+
+def _http_error(status):
+    response = MagicMock(status=status, reason="error")
+    return discord.HTTPException(response, "error")
+
+
+def _guild(guild_id=42):
+    guild = MagicMock()
+    guild.id = guild_id
+    guild.name = "Outbox Guild"
+    guild.fetch_scheduled_events = AsyncMock(return_value=[])
+    guild.create_scheduled_event = AsyncMock(return_value=MagicMock(id=900))
+    return guild
+
+
+def _listed_event(event_id, desired):
+    ev = MagicMock()
+    ev.id = event_id
+    ev.location = desired.url
+    ev.name = desired.name
+    ev.description = desired.description
+    ev.start_time = desired.start_time
+    ev.end_time = desired.end_time
+    return ev
+
+
+def test_transient_errors():
+    assert is_transient(_http_error(503))
+    assert is_transient(_http_error(429))
+    assert is_transient(asyncio.TimeoutError())
+    assert not is_transient(_http_error(400))
+    assert not is_transient(ValueError("bad"))
+
+
+def test_retries_back_off_and_give_up(tmp_path):
+    box = Outbox(persist_path=None, base_delay=5, max_delay=30, max_attempts=3)
+    entry = OutboxEntry(1, CREATE, "t1", "team", None, _desired("t1"))
+    box.add(entry, asyncio.TimeoutError(), now=0)
+    assert box.due(now=4) == []
+    assert box.due(now=5) == [entry]
+    box.retry_later(entry, _http_error(503), now=5)
+    assert entry.next_attempt == 15
+    box.retry_later(entry, _http_error(503), now=15)
+    assert entry.next_attempt == 35
+    box.retry_later(entry, _http_error(503), now=35)
+    assert len(box) == 0
+    assert box.stats["dropped"] == 1
+    # A permanent error is dropped at once
+    other = OutboxEntry(1, DELETE, "t2", None, 7)
+    box.add(other, asyncio.TimeoutError(), now=0)
+    box.retry_later(other, _http_error(403), now=5)
+    assert len(box) == 0
+
+
+def test_outbox_survives_restart_and_newer_plans_supersede(tmp_path):
+    path = str(tmp_path / "outbox.json")
+    box = Outbox(persist_path=path)
+    desired = _desired("t1")
+    box.add(OutboxEntry(1, UPDATE, "t1", "team", 55, desired), asyncio.TimeoutError(), now=0)
+    box.add(OutboxEntry(1, DELETE, "t2", None, 66), asyncio.TimeoutError(), now=0)
+
+    reloaded = Outbox(persist_path=path)
+    assert len(reloaded) == 2
+    entry = reloaded.entries[(1, "t1")]
+    assert (entry.op, entry.event_id) == (UPDATE, 55)
+    assert entry.desired.content_hash == desired.content_hash
+    assert entry.desired.start_time == desired.start_time
+
+    reloaded.discard(1, ["t1"])
+    assert len(Outbox(persist_path=path)) == 1
+
+
+@pytest.mark.asyncio
+async def test_transient_create_failure_is_queued(monkeypatch):
+    guild = _guild()
+    guild.create_scheduled_event = AsyncMock(side_effect=_http_error(503))
+    desired = _desired()
+    plan = EventPlan()
+    plan.creates.append(("team1", desired))
+    created, _, _ = await sync_mod.execute_plan(guild, {}, plan)
+    assert created == []
+    assert plan.failed == ["o1"]
+    entry = sync_mod.outbox.entries[(42, "o1")]
+    assert entry.op == CREATE and entry.desired is desired
+
+
+@pytest.mark.asyncio
+async def test_drain_skips_create_that_timed_out_but_succeeded():
+    guild = _guild()
+    desired = _desired()
+    # The timed-out create made the event after all
+    guild.fetch_scheduled_events = AsyncMock(return_value=[_listed_event(901, desired)])
+    bot = MagicMock()
+    bot.get_guild.return_value = guild
+    sync_mod.outbox.add(OutboxEntry(42, CREATE, "o1", "team1", None, desired), asyncio.TimeoutError(), now=0)
+
+    assert await sync_mod.drain_outbox(bot, SETTINGS) == 1
+    guild.create_scheduled_event.assert_not_awaited()
+    assert sync_mod.event_index.get(42, "o1").event_id == 901
+    assert len(sync_mod.outbox) == 0
+    assert sync_mod.outbox.stats["already_applied"] >= 1
+
+
+@pytest.mark.asyncio
+async def test_drain_creates_missing_event_and_retries_failures():
+    guild = _guild()
+    guild.create_scheduled_event = AsyncMock(side_effect=[_http_error(502), MagicMock(id=902)])
+    bot = MagicMock()
+    bot.get_guild.return_value = guild
+    sync_mod.outbox.add(OutboxEntry(42, CREATE, "o1", "team1", None, _desired()), asyncio.TimeoutError(), now=0)
+
+    assert await sync_mod.drain_outbox(bot, SETTINGS) == 0
+    entry = sync_mod.outbox.entries[(42, "o1")]
+    assert entry.attempts == 1
+    entry.next_attempt = 0
+    assert await sync_mod.drain_outbox(bot, SETTINGS) == 1
+    assert sync_mod.event_index.get(42, "o1").event_id == 902
+    assert len(sync_mod.outbox) == 0
+
+
+@pytest.mark.asyncio
+async def test_drain_update_and_delete_are_idempotent():
+    guild = _guild()
+    desired = _desired()
+    bot = MagicMock()
+    bot.get_guild.return_value = guild
+    # The index already holds the desired content: no edit needed
+    sync_mod.event_index.record(42, "o1", 903, desired.content_hash)
+    sync_mod.outbox.add(OutboxEntry(42, UPDATE, "o1", "team1", 903, desired), asyncio.TimeoutError(), now=0)
+    # The event to delete is already gone
+    guild.get_scheduled_event.return_value = None
+    guild.fetch_scheduled_event = AsyncMock(side_effect=discord.NotFound(MagicMock(status=404, reason="gone"), "gone"))
+    sync_mod.outbox.add(OutboxEntry(42, DELETE, "o2", None, 904), asyncio.TimeoutError(), now=0)
+
+    assert await sync_mod.drain_outbox(bot, SETTINGS) == 2
+    assert sync_mod.outbox.stats["already_applied"] >= 2
+    guild.create_scheduled_event.assert_not_awaited()
+    assert len(sync_mod.outbox) == 0
+
+
+@pytest.mark.asyncio
+async def test_create_retry_lists_over_rest_even_with_gateway_cache():
+    guild = _guild()
+    desired = _desired()
+    # The gateway cache looks complete but has not seen the event yet
+    guild.unavailable = False
+    guild.scheduled_events = []
+    guild.fetch_scheduled_events = AsyncMock(return_value=[_listed_event(905, desired)])
+    bot = MagicMock()
+    bot.get_guild.return_value = guild
+    sync_mod.outbox.add(OutboxEntry(42, CREATE, "o1", "team1", None, desired), asyncio.TimeoutError(), now=0)
+
+    assert await sync_mod.drain_outbox(bot, SETTINGS) == 1
+    guild.fetch_scheduled_events.assert_awaited_once()
+    guild.create_scheduled_event.assert_not_awaited()
+    assert sync_mod.event_index.get(42, "o1").event_id == 905
+
+
+@pytest.mark.asyncio
+async def test_retry_waits_for_a_running_sync_and_yields_to_it():
+    guild = _guild()
+    bot = MagicMock()
+    bot.get_guild.return_value = guild
+    sync_mod.outbox.add(OutboxEntry(42, CREATE, "o1", "team1", None, _desired()), asyncio.TimeoutError(), now=0)
+    lock = sync_mod.guild_lock(42)
+    await lock.acquire()
+    drain = asyncio.create_task(sync_mod.drain_outbox(bot, SETTINGS))
+    await asyncio.sleep(0)
+    # The sync holding the lock plans the tournament itself
+    sync_mod.outbox.discard(42, ["o1"])
+    lock.release()
+    assert await drain == 0
+    guild.create_scheduled_event.assert_not_awaited()
+    guild.fetch_scheduled_events.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_writes_of_removed_teams_are_dropped():
+    guild = _guild()
+    bot = MagicMock()
+    bot.get_guild.return_value = guild
+    sync_mod.outbox.add(OutboxEntry(42, CREATE, "o1", "team1", None, _desired("o1")), asyncio.TimeoutError(), now=0)
+    sync_mod.outbox.add(OutboxEntry(42, CREATE, "o2", "gone", None, _desired("o2")), asyncio.TimeoutError(), now=0)
+    sync_mod.outbox.add(OutboxEntry(7, UPDATE, "o3", "team1", 906, _desired("o3")), asyncio.TimeoutError(), now=0)
+    # remove_team drops the team's queued writes in that guild only
+    sync_mod.outbox.discard_team(42, "team1")
+    assert set(sync_mod.outbox.entries) == {(42, "o2"), (7, "o3")}
+    # A write queued for a team that is no longer registered is never retried
+    assert await sync_mod.drain_outbox(bot, SETTINGS) == 0
+    guild.create_scheduled_event.assert_not_awaited()
+    assert (42, "o2") not in sync_mod.outbox.entries
@@ -0,0 +1,78 @@
+from src.lichess import Tournament
+from src.polling import TeamPoller
+
+HOUR = 3600
+
+
+def _feed(tid, starts_in_hours, now=0):
+    starts_at = int((now + starts_in_hours * HOUR) * 1000)
+    return [Tournament(tid, tid, starts_at, starts_at + HOUR * 1000, 3, 2)]
+
+
+def test_new_teams_are_due_at_once_and_dropped_teams_forgotten():
+    poller = TeamPoller(min_interval_minutes=10, max_interval_minutes=80, soon_hours=1, budget_per_hour=10)
+    poller.track(["a", "b"], now=0)
+    assert sorted(poller.due(now=0)) == ["a", "b"]
+    poller.record("a", [], now=0)
+    poller.record("b", [], now=0)
+    poller.track(["a"], now=0)
+    assert poller.due(now=10 * HOUR) == ["a"]
+
+
+def test_quiet_team_backs_off_exponentially():
+    poller = TeamPoller(min_interval_minutes=10, max_interval_minutes=80, soon_hours=1, budget_per_hour=100)
+    poller.track(["quiet"], now=0)
+    now = 0
+    seen = []
+    for _ in range(5):
+        assert poller.due(now=now) == ["quiet"]
+        assert poller.record("quiet", _feed("t1", 48), now=now) is False
+        seen.append(poller.intervals()["quiet"])
+        # Not due before its interval has passed
+        assert poller.due(now=now + seen[-1] * 60 - 1) == []
+        now += seen[-1] * 60
+    assert seen == [20, 40, 80, 80, 80]
+
+
+def test_changed_feed_or_soon_tournament_resets_to_min_interval():
+    poller = TeamPoller(min_interval_minutes=10, max_interval_minutes=80, soon_hours=2, budget_per_hour=100)
+    poller.track(["busy"], now=0)
+    poller.due(now=0)
+    poller.record("busy", _feed("t1", 48), now=0)
+    poller.due(now=20 * 60)
+    poller.record("busy", _feed("t1", 48), now=20 * 60)
+    assert poller.intervals()["busy"] == 40
+    # A new arena appears in the feed
+    poller.due(now=60 * 60)
+    assert poller.record("busy", _feed("t2", 48), now=60 * 60) is True
+    assert poller.intervals()["busy"] == 10
+    assert poller.stats["changes"] == 1
+
+    # Unchanged, but a tournament starts within the soon window
+    poller.track(["soon"], now=0)
+    for now in (0, 600, 1200):
+        poller.due(now=now)
+        poller.record("soon", _feed("t3", 1), now=now)
+        assert poller.intervals()["soon"] == 10
+
+
+def test_budget_caps_polls_per_hour_and_keeps_teams_due():
+    poller = TeamPoller(min_interval_minutes=10, max_interval_minutes=80, soon_hours=1, budget_per_hour=2)
+    poller.track(["a", "b", "c"], now=0)
+    first = poller.due(now=0)
+    assert len(first) == 2
+    assert poller.stats["over_budget"] == 1
+    # Still over budget later in the same hour
+    assert poller.due(now=HOUR / 2) == []
+    # The skipped team is first in line once the hour has rolled over
+    (left,) = {"a", "b", "c"} - set(first)
+    assert poller.due(now=HOUR + 1) == [left]
+
+
+def test_failed_poll_backs_off():
+    poller = TeamPoller(min_interval_minutes=10, max_interval_minutes=80, soon_hours=1, budget_per_hour=10)
+    poller.track(["broken"], now=0)
+    poller.due(now=0)
+    assert poller.record("broken", None, now=0) is False
+    assert poller.intervals()["broken"] == 20
+    assert poller.stats["failures"] == 1
@@ -0,0 +1,73 @@
+import asyncio
+import time
+import pytest
+
+from src.ratelimit import RateGovernor, TokenBucket
+
+
+def test_token_bucket_burst_then_wait():
+    bucket = TokenBucket(rate=10, capacity=2)
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    # Third request must wait roughly one refill interval
+    wait = bucket.reserve()
+    assert 0.05 < wait <= 0.1
+
+
+@pytest.mark.asyncio
+async def test_governor_throttles_to_rate():
+    governor = RateGovernor(requests_per_second=50, burst=1, max_concurrent=5, backoff_seconds=1)
+    start = time.monotonic()
+    for _ in range(5):
+        async with governor.slot():
+            pass
+    elapsed = time.monotonic() - start
+    # 1 burst token + 4 refills at 50/s
+    assert elapsed >= 0.07
+    assert governor.stats["requests"] == 5
+    assert governor.stats["throttle_waits"] >= 4
+    assert governor.stats["throttle_wait_seconds"] > 0
+
+
+@pytest.mark.asyncio
+async def test_governor_caps_concurrency():
+    governor = RateGovernor(requests_per_second=1000, burst=100, max_concurrent=2, backoff_seconds=1)
+    active = 0
+    peak = 0
+    async def worker():
+        nonlocal active, peak
+        async with governor.slot():
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.01)
+            active -= 1
+    await asyncio.gather(*(worker() for _ in range(6)))
+    assert peak == 2
+
+
+@pytest.mark.asyncio
+async def test_governor_pauses_after_429():
+    governor = RateGovernor(requests_per_second=1000, burst=100, max_concurrent=2, backoff_seconds=5)
+    # Retry-After header wins over the default backoff
+    assert governor.on_rate_limited("0.05") == 0.05
+    assert governor.on_rate_limited("bogus") == 5
+    governor._paused_until = time.monotonic() + 0.05
+    start = time.monotonic()
+    async with governor.slot():
+        pass
+    assert time.monotonic() - start >= 0.04
+    assert governor.stats["rate_limited"] == 2
+
+
+@pytest.mark.asyncio
+async def test_requests_released_by_a_429_pause_still_take_tokens():
+    governor = RateGovernor(requests_per_second=20, burst=1, max_concurrent=3, backoff_seconds=0.05)
+    governor.on_rate_limited()
+    start = time.monotonic()
+
+    async def request():
+        async with governor.slot():
+            pass
+    await asyncio.gather(*(request() for _ in range(3)))
+    # 0.05s pause, then one token every 0.05s for the other two
+    assert time.monotonic() - start >= 0.13
@@ -53,10 +53,9 @@ async def test_sync_http_error(monkeypatch, bot):
         async def __aenter__(self): return self
         async def __aexit__(self, *_): pass
     class DummySession:
-        async def __aenter__(self): return self
-        async def __aexit__(self, *_): pass
-        def get(self, url): return DummyResponse()
-    monkeypatch.setattr('src.sync.aiohttp.ClientSession', DummySession)
+        closed = False
+        def get(self, url, **kwargs): return DummyResponse()
+    monkeypatch.setattr('src.sync.lichess_client._session', DummySession())
     SETTINGS = {"3": {"teams": ["team1"]}}
     created, updated, events = await sync_events_for_guild(guild, SETTINGS, bot)
     assert created == 0 and updated == 0 and events == []
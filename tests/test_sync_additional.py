@@ -23,10 +23,9 @@ async def test_sync_http_non200(monkeypatch):
         async def __aenter__(self): return self
         async def __aexit__(self, exc_type, exc, tb): pass
     class DummySession:
-        async def __aenter__(self): return self
-        async def __aexit__(self, exc_type, exc, tb): pass
-        def get(self, url): return DummyResp()
-    monkeypatch.setattr(sync_mod.aiohttp, 'ClientSession', DummySession)
+        closed = False
+        def get(self, url, **kwargs): return DummyResp()
+    monkeypatch.setattr(sync_mod.lichess_client, '_session', DummySession())
     SETTINGS = {"7": {"teams": ["teamA"]}}
     created, updated, events = await sync_mod.sync_events_for_guild(guild, SETTINGS, None)
     assert (created, updated, events) == (0, 0, [])
@@ -55,11 +54,11 @@ async def test_sync_invalid_and_past_tournament(monkeypatch):
         async def __aenter__(self): return self
         async def __aexit__(self, exc_type, exc, tb): pass
         async def readline(self): return self._lines.pop(0)
+        def close(self): self.closed_early = True
     class DummySession:
-        async def __aenter__(self): return self
-        async def __aexit__(self, exc_type, exc, tb): pass
-        def get(self, url): return DummyResp()
-    monkeypatch.setattr(sync_mod.aiohttp, 'ClientSession', DummySession)
+        closed = False
+        def get(self, url, **kwargs): return DummyResp()
+    monkeypatch.setattr(sync_mod.lichess_client, '_session', DummySession())
     SETTINGS = {"8": {"teams": ["teamB"]}}
     created, updated, events = await sync_mod.sync_events_for_guild(guild, SETTINGS, None)
     # Should skip invalid and past, so no events
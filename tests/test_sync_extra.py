@@ -54,10 +54,9 @@ async def test_sync_with_team_slug(monkeypatch):
         async def __aexit__(self, exc_type, exc, tb): pass
         async def readline(self): return self._lines.pop(0) if self._lines else b""
     class DummySession:
-        async def __aenter__(self): return self
-        async def __aexit__(self, exc_type, exc, tb): pass
-        def get(self, url): return DummyResp()
-    monkeypatch.setattr(sync_mod.aiohttp, 'ClientSession', DummySession)
+        closed = False
+        def get(self, url, **kwargs): return DummyResp()
+    monkeypatch.setattr(sync_mod.lichess_client, '_session', DummySession())
     # Stub create_scheduled_event and logging to avoid errors
     guild.create_scheduled_event = AsyncMock()
     monkeypatch.setattr(sync_mod, 'log_to_notification_channel', AsyncMock())
@@ -6,6 +6,7 @@ import json
 from datetime import datetime, timezone, timedelta
 
 import src.sync as sync_mod
+from src.lichess import Tournament
 
 @pytest.fixture
 def bot():
@@ -37,10 +38,9 @@ async def test_sync_create_event(monkeypatch):
         async def readline(self):
             return self._lines.pop(0)
     class DummySession:
-        async def __aenter__(self): return self
-        async def __aexit__(self, exc_type, exc, tb): pass
-        def get(self, url): return DummyResp()
-    monkeypatch.setattr(sync_mod.aiohttp, 'ClientSession', DummySession)
+        closed = False
+        def get(self, url, **kwargs): return DummyResp()
+    monkeypatch.setattr(sync_mod.lichess_client, '_session', DummySession())
     # Capture created events
     guild.create_scheduled_event = AsyncMock()
     # Stub log_to_notification_channel to no-op
@@ -86,10 +86,9 @@ async def test_sync_update_event(monkeypatch):
         async def readline(self):
             return self._lines.pop(0)
     class DummySession:
-        async def __aenter__(self): return self
-        async def __aexit__(self, exc_type, exc, tb): pass
-        def get(self, url): return DummyResp()
-    monkeypatch.setattr(sync_mod.aiohttp, 'ClientSession', DummySession)
+        closed = False
+        def get(self, url, **kwargs): return DummyResp()
+    monkeypatch.setattr(sync_mod.lichess_client, '_session', DummySession())
     # Capture edits
     ev.edit = AsyncMock()
     # Stub log_to_notification_channel
@@ -100,3 +99,87 @@ async def test_sync_update_event(monkeypatch):
     assert updated == 1
     assert events == ["https://lichess.org/tournament/t2"]
     ev.edit.assert_awaited()
+
+@pytest.mark.asyncio
+async def test_sync_uses_prefetched_tournaments(monkeypatch):
+    guild = MagicMock()
+    guild.id = 7
+    member = MagicMock()
+    member.guild_permissions = MagicMock(manage_events=True)
+    guild.me = member
+    guild.get_member.return_value = member
+    guild.fetch_scheduled_events = AsyncMock(return_value=[])
+    guild.create_scheduled_event = AsyncMock()
+    # Any network access would fail the test
+    fetch = AsyncMock(side_effect=AssertionError("should not fetch"))
+    monkeypatch.setattr(sync_mod, 'fetch_team_tournaments', fetch)
+    monkeypatch.setattr(sync_mod, 'log_to_notification_channel', AsyncMock())
+    future_ms = int((datetime.now(timezone.utc) + timedelta(hours=1)).timestamp() * 1000)
+    feeds = {
+        "team1": [Tournament.from_json({"id": "p1", "startsAt": future_ms, "finishesAt": future_ms + 3600000,
+                                        "minutes": 3, "clock": {"increment": 2}, "fullName": "Shared Arena"})],
+        "team2": None,  # failed fetch this cycle
+    }
+    SETTINGS = {"7": {"teams": ["team1", "team2"]}}
+    created, updated, events = await sync_mod.sync_events_for_guild(
+        guild, SETTINGS, None, prefetched_tournaments=feeds
+    )
+    assert (created, updated, events) == (1, 0, ["https://lichess.org/tournament/p1"])
+    fetch.assert_not_awaited()
+
+@pytest.mark.asyncio
+async def test_fetch_tournaments_for_teams_deduplicates(monkeypatch):
+    calls = []
+    async def fake_fetch(team, verbose=False, label="lichess"):
+        calls.append(team)
+        if team == "broken":
+            raise RuntimeError("boom")
+        return [{"id": team}]
+    monkeypatch.setattr(sync_mod, 'fetch_team_tournaments', fake_fetch)
+    feeds = await sync_mod.fetch_tournaments_for_teams(["a", "b", "a", "broken", "b"])
+    assert calls == ["a", "b", "broken"]
+    assert feeds == {"a": [{"id": "a"}], "b": [{"id": "b"}], "broken": None}
+
+@pytest.mark.asyncio
+async def test_sync_plans_once_for_all_teams(monkeypatch):
+    guild = MagicMock()
+    guild.id = 8
+    guild.me.guild_permissions.manage_events = True
+    guild.fetch_scheduled_events = AsyncMock(return_value=[])
+    guild.create_scheduled_event = AsyncMock()
+    monkeypatch.setattr(sync_mod, 'log_to_notification_channel', AsyncMock())
+    future_ms = int((datetime.now(timezone.utc) + timedelta(hours=1)).timestamp() * 1000)
+    arena = Tournament("both", "Team Battle", future_ms, future_ms + 3600000, 3, 0)
+    own = Tournament("own", "Own Arena", future_ms, future_ms + 3600000, 3, 0)
+    feeds = {"team1": [arena], "team2": [arena, own]}
+    SETTINGS = {"8": {"teams": ["team1", "team2"]}}
+    created, updated, events = await sync_mod.sync_events_for_guild(
+        guild, SETTINGS, None, prefetched_tournaments=feeds
+    )
+    # One list call for the guild, and the arena both teams list is created once
+    guild.fetch_scheduled_events.assert_awaited_once()
+    assert created == 2 and updated == 0
+    assert events == ["https://lichess.org/tournament/both", "https://lichess.org/tournament/own"]
+
+@pytest.mark.asyncio
+async def test_concurrent_syncs_of_a_guild_create_an_arena_once(monkeypatch):
+    future_ms = int((datetime.now(timezone.utc) + timedelta(hours=1)).timestamp() * 1000)
+    feed = [Tournament("race1", "Race", future_ms, future_ms + 3600000, 3, 0)]
+    monkeypatch.setattr(sync_mod, 'log_to_notification_channel', AsyncMock())
+    guild = MagicMock()
+    guild.id = 66
+    guild.me.guild_permissions.manage_events = True
+    guild.fetch_scheduled_events = AsyncMock(return_value=[])
+
+    async def slow_create(**kwargs):
+        # The create is still in flight when the second sync starts planning
+        await asyncio.sleep(0.01)
+        return MagicMock(id=700)
+    guild.create_scheduled_event = AsyncMock(side_effect=slow_create)
+    SETTINGS = {"66": {"teams": ["team1"]}}
+    results = await asyncio.gather(*(
+        sync_mod.sync_events_for_guild(guild, SETTINGS, None, prefetched_tournaments={"team1": feed})
+        for _ in range(2)
+    ))
+    assert sorted(created for created, _, _ in results) == [0, 1]
+    assert guild.create_scheduled_event.await_count == 1
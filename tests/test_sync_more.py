@@ -1,8 +1,11 @@
 import pytest
+import asyncio
 from datetime import datetime, timezone, timedelta
 from unittest.mock import AsyncMock, MagicMock
 import json
 
+import aiohttp
+
 import src.sync as sync_mod
 
 @pytest.mark.asyncio
@@ -31,10 +34,9 @@ async def test_sync_skips_invalid_json_then_creates_event(monkeypatch):
         async def __aexit__(self, exc_type, exc, tb): pass
         async def readline(self): return self._lines.pop(0)
     class DummySession:
-        async def __aenter__(self): return self
-        async def __aexit__(self, exc_type, exc, tb): pass
-        def get(self, url): return DummyResp()
-    monkeypatch.setattr(sync_mod.aiohttp, 'ClientSession', DummySession)
+        closed = False
+        def get(self, url, **kwargs): return DummyResp()
+    monkeypatch.setattr(sync_mod.lichess_client, '_session', DummySession())
     # Stub create and update
     guild.create_scheduled_event = AsyncMock()
     monkeypatch.setattr(sync_mod, 'log_to_notification_channel', AsyncMock())
@@ -85,10 +87,9 @@ async def test_sync_does_not_edit_if_unchanged(monkeypatch):
         async def __aexit__(self, exc_type, exc, tb): pass
         async def readline(self): return self._lines.pop(0)
     class DummySession:
-        async def __aenter__(self): return self
-        async def __aexit__(self, exc_type, exc, tb): pass
-        def get(self, url): return DummyResp()
-    monkeypatch.setattr(sync_mod.aiohttp, 'ClientSession', DummySession)
+        closed = False
+        def get(self, url, **kwargs): return DummyResp()
+    monkeypatch.setattr(sync_mod.lichess_client, '_session', DummySession())
     # Stub create and edit
     guild.create_scheduled_event = AsyncMock()
     ev.edit = AsyncMock()
@@ -102,3 +103,244 @@ async def test_sync_does_not_edit_if_unchanged(monkeypatch):
     assert created == 0 and updated == 1 and events == ['https://lichess.org/tournament/xyz']
     ev.edit.assert_awaited()
     guild.create_scheduled_event.assert_not_awaited()
+
+@pytest.mark.asyncio
+async def test_fetch_stops_at_finished_tournament(monkeypatch):
+    now = datetime.now(timezone.utc)
+    def line(tid, starts, **extra):
+        data = {"id": tid, "startsAt": int(starts.timestamp() * 1000),
+                "finishesAt": int((starts + timedelta(hours=1)).timestamp() * 1000), **extra}
+        return json.dumps(data).encode() + b"\n"
+    lines = [
+        line("up", now + timedelta(hours=3)),
+        line("running", now - timedelta(minutes=10)),
+        line("done", now - timedelta(days=1), status=30),
+        line("older", now - timedelta(days=2), status=30),
+        b"",
+    ]
+    class DummyResp:
+        def __init__(self):
+            self.status = 200
+            self._lines = lines.copy()
+            self.content = self
+            self.closed_early = False
+        async def __aenter__(self): return self
+        async def __aexit__(self, exc_type, exc, tb): pass
+        async def readline(self): return self._lines.pop(0)
+        def close(self): self.closed_early = True
+    resp = DummyResp()
+    requested = {}
+    class DummySession:
+        closed = False
+        def get(self, url, **kwargs):
+            requested.update(kwargs)
+            return resp
+    monkeypatch.setattr(sync_mod.lichess_client, '_session', DummySession())
+    tournaments = await sync_mod.fetch_team_tournaments("teamQ")
+    # Only the upcoming tournament is kept and the finished tail is never read
+    assert [t.id for t in tournaments] == ["up"]
+    assert resp.closed_early
+    assert len(resp._lines) == 2
+    assert requested["params"]["status"] == "created"
+
+@pytest.mark.asyncio
+async def test_feed_http_error(monkeypatch):
+    class ErrorResp:
+        status = 503
+        async def __aenter__(self): return self
+        async def __aexit__(self, exc_type, exc, tb): pass
+    class DummySession:
+        closed = False
+        def get(self, url, **kwargs): return ErrorResp()
+    monkeypatch.setattr(sync_mod.lichess_client, '_session', DummySession())
+    with pytest.raises(sync_mod.LichessAPIError) as exc_info:
+        await sync_mod.read_team_tournaments("teamE")
+    assert exc_info.value.status == 503
+    assert await sync_mod.fetch_team_tournaments("teamE") is None
+    assert sync_mod.cache.get_tournaments("teamE") is None
+
+def _slow_feed_session(lines, delays):
+    class DummyResp:
+        def __init__(self):
+            self.status = 200
+            self._lines = list(lines)
+            self._delays = list(delays)
+            self.content = self
+            self.closed_early = False
+        async def __aenter__(self): return self
+        async def __aexit__(self, exc_type, exc, tb): pass
+        async def readline(self):
+            await asyncio.sleep(self._delays.pop(0))
+            return self._lines.pop(0)
+        def close(self): self.closed_early = True
+    class DummySession:
+        closed = False
+        def get(self, url, **kwargs): return DummyResp()
+    return DummySession()
+
+@pytest.mark.asyncio
+async def test_feed_idle_timeout_marks_partial(monkeypatch):
+    future_ms = int((datetime.now(timezone.utc) + timedelta(hours=1)).timestamp() * 1000)
+    first = json.dumps({"id": "a", "startsAt": future_ms}).encode() + b"\n"
+    monkeypatch.setattr(sync_mod.lichess_client, '_session', _slow_feed_session([first, b""], [0, 1]))
+    monkeypatch.setattr(sync_mod.lichess_client, 'idle_timeout', 0.05)
+    monkeypatch.setattr(sync_mod.lichess_client, 'stats', dict.fromkeys(sync_mod.lichess_client.stats, 0))
+    tournaments = await sync_mod.fetch_team_tournaments("teamI")
+    # Items read before the stall are still delivered, but never cached
+    assert [t.id for t in tournaments] == ["a"]
+    assert sync_mod.cache.get_tournaments("teamI") is None
+    stats = sync_mod.lichess_client.stats
+    assert stats["feeds_partial"] == 1 and stats["idle_timeouts"] == 1
+
+@pytest.mark.asyncio
+async def test_feed_total_deadline_bounds_slow_trickle(monkeypatch):
+    future_ms = int((datetime.now(timezone.utc) + timedelta(hours=1)).timestamp() * 1000)
+    lines = [json.dumps({"id": f"s{i}", "startsAt": future_ms}).encode() + b"\n" for i in range(50)] + [b""]
+    monkeypatch.setattr(sync_mod.lichess_client, '_session', _slow_feed_session(lines, [0.02] * 51))
+    monkeypatch.setattr(sync_mod.lichess_client, 'idle_timeout', 1)
+    monkeypatch.setattr(sync_mod.lichess_client, 'total_timeout', 0.1)
+    monkeypatch.setattr(sync_mod.lichess_client, 'stats', dict.fromkeys(sync_mod.lichess_client.stats, 0))
+    tournaments = await sync_mod.fetch_team_tournaments("teamT")
+    assert 0 < len(tournaments) < 50
+    assert sync_mod.cache.get_tournaments("teamT") is None
+    assert sync_mod.lichess_client.stats["deadline_timeouts"] == 1
+
+@pytest.mark.asyncio
+async def test_feed_connect_timeout(monkeypatch):
+    class HangingRequest:
+        async def __aenter__(self): raise asyncio.TimeoutError()
+        async def __aexit__(self, exc_type, exc, tb): pass
+    class DummySession:
+        closed = False
+        def get(self, url, **kwargs): return HangingRequest()
+    monkeypatch.setattr(sync_mod.lichess_client, '_session', DummySession())
+    monkeypatch.setattr(sync_mod.lichess_client, 'stats', dict.fromkeys(sync_mod.lichess_client.stats, 0))
+    with pytest.raises(sync_mod.LichessTimeoutError):
+        await sync_mod.read_team_tournaments("teamC")
+    assert sync_mod.lichess_client.stats["connect_timeouts"] == 1
+
+@pytest.mark.asyncio
+async def test_concurrent_fetches_for_same_team_share_one_request(monkeypatch):
+    future_ms = int((datetime.now(timezone.utc) + timedelta(hours=1)).timestamp() * 1000)
+    line = json.dumps({"id": "sf1", "startsAt": future_ms}).encode() + b"\n"
+    requests = []
+    class DummyResp:
+        def __init__(self):
+            self.status = 200
+            self._lines = [line, b""]
+            self.content = self
+        async def __aenter__(self): return self
+        async def __aexit__(self, exc_type, exc, tb): pass
+        async def readline(self):
+            await asyncio.sleep(0.01)
+            return self._lines.pop(0)
+    class DummySession:
+        closed = False
+        def get(self, url, **kwargs):
+            requests.append(url)
+            return DummyResp()
+    monkeypatch.setattr(sync_mod.lichess_client, '_session', DummySession())
+    results = await asyncio.gather(*(sync_mod.fetch_team_tournaments("popular") for _ in range(5)))
+    assert len(requests) == 1
+    assert all([t.id for t in r] == ["sf1"] for r in results)
+    assert sync_mod._inflight_feeds == {}
+    # A later fetch after completion goes to the network again
+    await sync_mod.fetch_team_tournaments("popular")
+    assert len(requests) == 2
+
+@pytest.mark.asyncio
+async def test_single_flight_shares_errors(monkeypatch):
+    requests = []
+    class ErrorResp:
+        status = 404
+        async def __aenter__(self):
+            await asyncio.sleep(0.01)
+            return self
+        async def __aexit__(self, exc_type, exc, tb): pass
+    class DummySession:
+        closed = False
+        def get(self, url, **kwargs):
+            requests.append(url)
+            return ErrorResp()
+    monkeypatch.setattr(sync_mod.lichess_client, '_session', DummySession())
+    results = await asyncio.gather(*(sync_mod.fetch_team_tournaments("gone") for _ in range(3)))
+    assert results == [None, None, None]
+    assert len(requests) == 1
+
+@pytest.mark.asyncio
+async def test_broken_connection_fails_only_that_team(monkeypatch):
+    future_ms = int((datetime.now(timezone.utc) + timedelta(hours=1)).timestamp() * 1000)
+    line = json.dumps({"id": "ok1", "startsAt": future_ms, "finishesAt": future_ms + 60000}).encode() + b"\n"
+    class DummyResp:
+        def __init__(self, team):
+            self.status = 200
+            self.team = team
+            self._lines = [line, b""]
+            self.content = self
+        async def __aenter__(self): return self
+        async def __aexit__(self, exc_type, exc, tb): pass
+        async def readline(self):
+            if self.team == "broken":
+                raise aiohttp.ClientPayloadError("Response payload is not completed")
+            return self._lines.pop(0)
+        def close(self): pass
+    class DummySession:
+        closed = False
+        def get(self, url, **kwargs): return DummyResp(url.rstrip("/").split("/")[-2])
+    monkeypatch.setattr(sync_mod.lichess_client, '_session', DummySession())
+    monkeypatch.setattr(sync_mod.lichess_client, 'stats', dict.fromkeys(sync_mod.lichess_client.stats, 0))
+    monkeypatch.setattr(sync_mod, 'log_to_notification_channel', AsyncMock())
+    with pytest.raises(sync_mod.LichessConnectionError):
+        await sync_mod.read_team_tournaments("broken")
+    guild = MagicMock()
+    guild.id = 321
+    guild.me.guild_permissions.manage_events = True
+    guild.fetch_scheduled_events = AsyncMock(return_value=[])
+    guild.create_scheduled_event = AsyncMock(return_value=MagicMock(id=1))
+    SETTINGS = {"321": {"teams": ["broken", "healthy"]}}
+    created, _, _ = await sync_mod.sync_events_for_guild(guild, SETTINGS, None)
+    assert created == 1
+    assert sync_mod.lichess_client.stats["connection_errors"] == 2
+
+@pytest.mark.asyncio
+async def test_new_tournaments_are_created_while_the_feed_is_read(monkeypatch):
+    future_ms = int((datetime.now(timezone.utc) + timedelta(hours=1)).timestamp() * 1000)
+    lines = [json.dumps({"id": tid, "startsAt": future_ms, "fullName": tid}).encode() + b"\n" for tid in ("e1", "e2")]
+    monkeypatch.setattr(sync_mod.lichess_client, '_session', _slow_feed_session(lines + [b""], [0, 0.05, 0]))
+    monkeypatch.setattr(sync_mod, 'log_to_notification_channel', AsyncMock())
+    feed_done_at_create = []
+    async def create(**kwargs):
+        # The feed is cached only once it has been read to its end
+        feed_done_at_create.append(sync_mod.cache.get_tournaments("teamS") is not None)
+        return MagicMock(id=700 + len(feed_done_at_create))
+    guild = MagicMock()
+    guild.id = 26
+    guild.me.guild_permissions.manage_events = True
+    guild.fetch_scheduled_events = AsyncMock(return_value=[])
+    guild.create_scheduled_event = AsyncMock(side_effect=create)
+    created, updated, events = await sync_mod.sync_events_for_guild(guild, {"26": {"teams": ["teamS"]}}, None)
+    assert (created, updated) == (2, 0)
+    assert sorted(events) == ["https://lichess.org/tournament/e1", "https://lichess.org/tournament/e2"]
+    # The first arena was created before the rest of the feed arrived, and none twice
+    assert feed_done_at_create[0] is False
+    assert guild.create_scheduled_event.await_count == 2
+    assert set(sync_mod.event_index.existing(26)) == {"e1", "e2"}
+    assert sync_mod.event_index.applied_digest(26, "teamS") is not None
+
+@pytest.mark.asyncio
+async def test_failed_early_create_is_left_to_the_outbox(monkeypatch):
+    import discord
+    future_ms = int((datetime.now(timezone.utc) + timedelta(hours=1)).timestamp() * 1000)
+    line = json.dumps({"id": "f1", "startsAt": future_ms}).encode() + b"\n"
+    monkeypatch.setattr(sync_mod.lichess_client, '_session', _slow_feed_session([line, b""], [0, 0]))
+    monkeypatch.setattr(sync_mod, 'log_to_notification_channel', AsyncMock())
+    guild = MagicMock()
+    guild.id = 27
+    guild.me.guild_permissions.manage_events = True
+    guild.fetch_scheduled_events = AsyncMock(return_value=[])
+    guild.create_scheduled_event = AsyncMock(side_effect=discord.HTTPException(MagicMock(status=503, reason="x"), "x"))
+    assert await sync_mod.sync_events_for_guild(guild, {"27": {"teams": ["teamF"]}}, None) == (0, 0, [])
+    # Not attempted a second time by the full plan, and not marked applied
+    guild.create_scheduled_event.assert_awaited_once()
+    assert (27, "f1") in sync_mod.outbox.entries
+    assert sync_mod.event_index.applied_digest(27, "teamF") is None
@@ -3,6 +3,12 @@ import asyncio
 from unittest.mock import MagicMock, AsyncMock
 
 import src.tasks as tasks_mod
+from src.tasks import guild_offset
+
+@pytest.fixture(autouse=True)
+def no_spread(monkeypatch):
+    # Run every guild immediately unless a test exercises the spread window
+    monkeypatch.setattr(tasks_mod, 'guild_offset', lambda guild_id, spread, jitter: 0.0)
 
 @pytest.fixture
 def dummy_scheduler(monkeypatch):
@@ -18,42 +24,48 @@ def dummy_scheduler(monkeypatch):
         def start(self):
             self.started = True
     monkeypatch.setattr(tasks_mod, 'AsyncIOScheduler', DummyScheduler)
-    # Stub CronTrigger.from_crontab
-    monkeypatch.setattr(tasks_mod.CronTrigger, 'from_crontab', lambda expr: 'dummy')
+    # Stub CronTrigger.from_crontab with a fixed five-minute trigger
+    trigger = tasks_mod.CronTrigger.from_crontab('*/5 * * * *')
+    monkeypatch.setattr(tasks_mod.CronTrigger, 'from_crontab', lambda expr: trigger)
     return created
 
 @pytest.mark.asyncio
 async def test_start_background_tasks(monkeypatch, dummy_scheduler):
     # Stub sync_events_for_guild to record calls
     call_log = []
-    async def fake_sync(guild, SETTINGS, bot, verbose=False, prefetched_events=None):
+    async def fake_sync(guild, SETTINGS, bot, verbose=False, prefetched_events=None, prefetched_tournaments=None):
         call_log.append((guild.id, SETTINGS.get(str(guild.id), None)))
     monkeypatch.setattr(tasks_mod, 'sync_events_for_guild', fake_sync)
+    monkeypatch.setattr('src.sync.fetch_tournaments_for_teams', AsyncMock(return_value={}))
 
-    # Create bot with two dummy guilds
+    # Create bot with three dummy guilds
     guild1 = MagicMock(id=1)
     guild2 = MagicMock(id=2)
-    bot = MagicMock(guilds=[guild1, guild2])
-    # SETTINGS: guild2 auto_sync disabled
-    SETTINGS = {'1': {}, '2': {'auto_sync': False}}
+    guild3 = MagicMock(id=3)
+    guild3.fetch_scheduled_events = AsyncMock()
+    bot = MagicMock(guilds=[guild1, guild2, guild3])
+    # SETTINGS: guild2 auto_sync disabled, guild3 has no teams
+    SETTINGS = {'1': {'teams': ['t1']}, '2': {'auto_sync': False, 'teams': ['t2']}, '3': {}}
 
     # Run task setup
     tasks_mod.start_background_tasks(bot, SETTINGS)
 
-    # Scheduler should have started and one job added
+    # Scheduler should have started with the cron job, the adaptive poll job and the outbox job
     scheduler = dummy_scheduler['inst']
     assert scheduler.started is True
-    assert len(scheduler.jobs) == 1
+    assert len(scheduler.jobs) == 3
 
     # Execute the scheduled job coroutine
     sync_job = scheduler.jobs[0]
     await sync_job()
 
-    # Only guild1 should have been synced (default_auto True)
-    assert call_log == [(1, {})]
+    # Only guild1 should have been synced (default_auto True); guild3's events are never listed
+    assert call_log == [(1, {'teams': ['t1']})]
+    guild3.fetch_scheduled_events.assert_not_awaited()
 
 @pytest.mark.asyncio
 async def test_start_background_tasks_with_config_error(monkeypatch, tmp_path, caplog):
+    trigger = tasks_mod.CronTrigger.from_crontab('*/5 * * * *')
     # Force config.yaml load to throw
     monkeypatch.setattr('builtins.open', lambda *args, **kwargs: (_ for _ in ()).throw(Exception("fail open")))
     # Create a dummy scheduler class
@@ -67,7 +79,7 @@ async def test_start_background_tasks_with_config_error(monkeypatch, tmp_path, c
             self.started = True
     # Patch AsyncIOScheduler and CronTrigger.from_crontab
     monkeypatch.setattr(tasks_mod, 'AsyncIOScheduler', DummyScheduler)
-    monkeypatch.setattr(tasks_mod.CronTrigger, 'from_crontab', lambda expr: 'dummy')
+    monkeypatch.setattr(tasks_mod.CronTrigger, 'from_crontab', lambda expr: trigger)
     caplog.set_level('ERROR')
     # Run with broken config
     tasks_mod.start_background_tasks(MagicMock(guilds=[]), {})
@@ -78,10 +90,11 @@ async def test_start_background_tasks_with_config_error(monkeypatch, tmp_path, c
 async def test_sync_job_exception(monkeypatch, caplog, dummy_scheduler):
     # Patch sync to raise an exception
     monkeypatch.setattr(tasks_mod, 'sync_events_for_guild', AsyncMock(side_effect=Exception('sync fail')))
+    monkeypatch.setattr('src.sync.fetch_tournaments_for_teams', AsyncMock(return_value={}))
     # Prepare bot with one guild
     guild = MagicMock(id=10)
     bot = MagicMock(guilds=[guild])
-    SETTINGS = {'10': {}}
+    SETTINGS = {'10': {'teams': ['t1']}}
     caplog.set_level('ERROR')
     # Start tasks
     tasks_mod.start_background_tasks(bot, SETTINGS)
@@ -90,3 +103,145 @@ async def test_sync_job_exception(monkeypatch, caplog, dummy_scheduler):
     # Run job and capture error log
     await sync_job()
     assert any('Error syncing tournaments for guild 10' in rec.message for rec in caplog.records)
+
+@pytest.mark.asyncio
+async def test_sync_job_fetches_each_team_once(monkeypatch, dummy_scheduler):
+    # Two guilds share a popular team, one guild has auto sync disabled
+    fetched = []
+    async def fake_fetch_team(team, verbose=False, label="lichess"):
+        fetched.append(team)
+        return [{"id": f"{team}-t"}]
+    monkeypatch.setattr('src.sync.fetch_team_tournaments', fake_fetch_team)
+    received = {}
+    async def fake_sync(guild, SETTINGS, bot, verbose=False, prefetched_events=None, prefetched_tournaments=None):
+        received[guild.id] = prefetched_tournaments
+    monkeypatch.setattr(tasks_mod, 'sync_events_for_guild', fake_sync)
+    bot = MagicMock(guilds=[MagicMock(id=1), MagicMock(id=2), MagicMock(id=3)])
+    SETTINGS = {
+        '1': {'teams': ['lichess-de', 'a']},
+        '2': {'teams': ['lichess-de']},
+        '3': {'teams': ['b'], 'auto_sync': False},
+    }
+    tasks_mod.start_background_tasks(bot, SETTINGS)
+    await dummy_scheduler['inst'].jobs[0]()
+    # Each distinct team of eligible guilds fetched exactly once
+    assert sorted(fetched) == ['a', 'lichess-de']
+    assert set(received) == {1, 2}
+    # Every guild gets the same shared result
+    assert received[1] is received[2]
+    assert received[1]['lichess-de'] == [{'id': 'lichess-de-t'}]
+
+@pytest.mark.asyncio
+async def test_sync_job_runs_guilds_concurrently_and_isolates_errors(monkeypatch, dummy_scheduler, caplog):
+    monkeypatch.setattr('src.sync.fetch_tournaments_for_teams', AsyncMock(return_value={}))
+    running = []
+    peak = []
+    done = []
+    async def fake_sync(guild, SETTINGS, bot, verbose=False, prefetched_events=None, prefetched_tournaments=None):
+        running.append(guild.id)
+        peak.append(len(running))
+        await asyncio.sleep(0.01)
+        running.remove(guild.id)
+        if guild.id == 3:
+            raise RuntimeError("guild 3 broke")
+        done.append(guild.id)
+    monkeypatch.setattr(tasks_mod, 'sync_events_for_guild', fake_sync)
+    monkeypatch.setattr(tasks_mod, 'DEFAULT_GUILD_CONCURRENCY', 2)
+    monkeypatch.setattr(tasks_mod.yaml, 'safe_load', lambda f: {})
+    bot = MagicMock(guilds=[MagicMock(id=i) for i in range(1, 6)])
+    caplog.set_level('INFO')
+    tasks_mod.start_background_tasks(bot, {str(i): {'teams': ['t']} for i in range(1, 6)})
+    await dummy_scheduler['inst'].jobs[0]()
+    # Never more than the configured number of guilds in flight, but more than one
+    assert max(peak) == 2
+    assert sorted(done) == [1, 2, 4, 5]
+    messages = [rec.message for rec in caplog.records]
+    assert any('Error syncing tournaments for guild 3' in m for m in messages)
+    assert sum(m.startswith('Synced guild ') for m in messages) == 5
+    assert any(m.startswith('Scheduled sync of 5 guilds took') for m in messages)
+
+def test_guild_offset_is_stable_and_within_window():
+    offsets = [guild_offset(gid, 600, 0) for gid in range(200)]
+    assert all(0 <= o < 600 for o in offsets)
+    # Same slot on every run
+    assert offsets == [guild_offset(gid, 600, 0) for gid in range(200)]
+    # Guilds land across the whole window rather than on one instant
+    assert len({int(o // 60) for o in offsets}) == 10
+    # Jitter only ever delays a guild, and by at most jitter_seconds
+    jittered = guild_offset(1, 600, 5)
+    assert offsets[1] <= jittered <= offsets[1] + 5
+    assert guild_offset(1, 0, 0) == 0
+
+@pytest.mark.asyncio
+async def test_sync_job_waits_for_each_guild_slot(monkeypatch, dummy_scheduler):
+    monkeypatch.setattr('src.sync.fetch_tournaments_for_teams', AsyncMock(return_value={}))
+    monkeypatch.setattr(tasks_mod, 'guild_offset', lambda guild_id, spread, jitter: guild_id / 100)
+    order = []
+    async def fake_sync(guild, SETTINGS, bot, verbose=False, prefetched_events=None, prefetched_tournaments=None):
+        order.append(guild.id)
+    monkeypatch.setattr(tasks_mod, 'sync_events_for_guild', fake_sync)
+    bot = MagicMock(guilds=[MagicMock(id=3), MagicMock(id=1), MagicMock(id=2)])
+    tasks_mod.start_background_tasks(bot, {str(i): {'teams': ['t']} for i in range(1, 4)})
+    await dummy_scheduler['inst'].jobs[0]()
+    # Guilds start in slot order, not list order
+    assert order == [1, 2, 3]
+
+def test_cron_interval():
+    assert tasks_mod.cron_interval(tasks_mod.CronTrigger.from_crontab('*/5 * * * *')) == 300
+    assert tasks_mod.cron_interval(tasks_mod.CronTrigger.from_crontab('0 * * * *')) == 3600
+
+@pytest.mark.asyncio
+async def test_spread_is_clamped_to_the_cron_interval(monkeypatch, tmp_path, caplog, dummy_scheduler):
+    # The default 30 minute spread does not fit a five-minute cron
+    (tmp_path / "config").mkdir()
+    (tmp_path / "config" / "config.yaml").write_text("scheduler:\n  cron: '*/5 * * * *'\n  jitter_seconds: 30\n")
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr('src.sync.fetch_tournaments_for_teams', AsyncMock(return_value={}))
+    monkeypatch.setattr(tasks_mod, 'sync_events_for_guild', AsyncMock())
+    spreads = []
+    monkeypatch.setattr(tasks_mod, 'guild_offset', lambda guild_id, spread, jitter: spreads.append(spread + jitter) or 0.0)
+    caplog.set_level('WARNING')
+    tasks_mod.start_background_tasks(MagicMock(guilds=[MagicMock(id=1)]), {'1': {'teams': ['t']}})
+    await dummy_scheduler['inst'].jobs[0]()
+    assert spreads == [300]
+    assert any("exceeds the cron interval" in rec.message for rec in caplog.records)
+
+@pytest.mark.asyncio
+async def test_poll_job_syncs_only_changed_teams(monkeypatch, dummy_scheduler):
+    from src.lichess import Tournament
+    from src.polling import TeamPoller
+    poller = TeamPoller(min_interval_minutes=10, max_interval_minutes=60, soon_hours=0, budget_per_hour=100)
+    monkeypatch.setattr(tasks_mod, 'team_poller', poller)
+    feeds = {
+        'a': [Tournament('t1', 'A', 4102444800000, 4102448400000, 3, 2)],
+        'b': [Tournament('t2', 'B', 4102444800000, 4102448400000, 3, 2)],
+    }
+    fetch = AsyncMock(side_effect=lambda teams, refresh=False: {t: feeds[t] for t in teams})
+    monkeypatch.setattr('src.sync.fetch_tournaments_for_teams', fetch)
+    synced = []
+    async def fake_sync(guild, SETTINGS, bot, verbose=False, team_slug=None, prefetched_tournaments=None):
+        synced.append((guild.id, team_slug))
+    monkeypatch.setattr(tasks_mod, 'sync_events_for_guild', fake_sync)
+    bot = MagicMock(guilds=[MagicMock(id=1), MagicMock(id=2)])
+    tasks_mod.start_background_tasks(bot, {'1': {'teams': ['a', 'b']}, '2': {'teams': ['b']}})
+    poll_job = dummy_scheduler['inst'].jobs[1]
+
+    # First poll only records a baseline
+    await poll_job()
+    assert fetch.await_args.kwargs == {'refresh': True}
+    assert sorted(fetch.await_args.args[0]) == ['a', 'b']
+    assert synced == []
+
+    # Nothing is due again before the team's interval has passed
+    fetch.reset_mock()
+    await poll_job()
+    fetch.assert_not_awaited()
+
+    # Team b's feed changes: only its guilds sync, and only for team b
+    feeds['b'] = [Tournament('t3', 'B2', 4102444800000, 4102448400000, 3, 2)]
+    for team in ('a', 'b'):
+        next_at, interval, digest = poller._teams[team]
+        poller._schedule(team, 0, interval, digest)
+    await poll_job()
+    assert sorted(synced) == [(1, 'b'), (2, 'b')]
+    assert poller.stats['changes'] == 1
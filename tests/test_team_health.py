@@ -0,0 +1,132 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+import src.sync as sync_mod
+from src.lichess import LichessAPIError, LichessConnectionError, LichessTimeoutError
+from src.team_health import TeamHealth
+
+MINUTE = 60
+
+
+def test_missing_team_backs_off_exponentially():
+    health = TeamHealth(missing_backoff_minutes=10, max_backoff_hours=1, failure_threshold=3, open_minutes=5)
+    health.record_missing("gone", 404, now=0)
+    assert "HTTP 404" in health.check("gone", now=5 * MINUTE)
+    assert health.check("gone", now=10 * MINUTE) is None
+    health.record_missing("gone", 404, now=10 * MINUTE)
+    assert health.check("gone", now=29 * MINUTE) is not None
+    assert health.check("gone", now=30 * MINUTE) is None
+    # Capped at max_backoff_hours
+    for _ in range(5):
+        health.record_missing("gone", 410, now=0)
+    assert health.check("gone", now=59 * MINUTE) is not None
+    assert health.check("gone", now=60 * MINUTE) is None
+    assert health.stats["negative_hits"] == 3
+    health.record_success("gone")
+    assert health.broken() == {}
+
+
+def test_circuit_opens_after_threshold_and_allows_a_trial():
+    health = TeamHealth(missing_backoff_minutes=10, max_backoff_hours=1, failure_threshold=3, open_minutes=5)
+    health.record_failure("flaky", now=0)
+    health.record_failure("flaky", now=0)
+    assert health.check("flaky", now=0) is None
+    health.record_failure("flaky", now=0)
+    assert health.check("flaky", now=4 * MINUTE) is not None
+    assert health.broken() == {"flaky": "3 failures"}
+    # Trial after the pause; a failed trial re-opens for twice as long
+    assert health.check("flaky", now=5 * MINUTE) is None
+    health.record_failure("flaky", now=5 * MINUTE)
+    assert health.check("flaky", now=14 * MINUTE) is not None
+    assert health.check("flaky", now=15 * MINUTE) is None
+    health.record_success("flaky")
+    assert health.check("flaky", now=15 * MINUTE) is None
+    assert health.stats["circuits_opened"] == 2
+
+
+def test_admins_are_notified_once_per_guild():
+    health = TeamHealth()
+    health.record_missing("typo", 404)
+    assert "typo" in health.notice_for(1, "typo")
+    assert health.notice_for(1, "typo") is None
+    assert health.notice_for(2, "typo") is not None
+    # A team that recovers and breaks again is reported again
+    health.record_success("typo")
+    health.record_missing("typo", 404)
+    assert health.notice_for(1, "typo") is not None
+
+
+@pytest.mark.asyncio
+async def test_dead_slug_is_requested_once_and_reported_once(monkeypatch):
+    requests = []
+    async def failing_feed(team, verbose, label, on_tournament=None):
+        requests.append(team)
+        raise LichessAPIError(404, team)
+    monkeypatch.setattr(sync_mod, '_read_team_feed', failing_feed)
+    notify = AsyncMock()
+    monkeypatch.setattr(sync_mod, 'log_to_notification_channel', notify)
+    guild = MagicMock()
+    guild.id = 91
+    guild.me.guild_permissions.manage_events = True
+    guild.fetch_scheduled_events = AsyncMock(return_value=[])
+    SETTINGS = {"91": {"teams": ["no-such-team"]}}
+    for _ in range(3):
+        assert await sync_mod.sync_events_for_guild(guild, SETTINGS, None) == (0, 0, [])
+    assert requests == ["no-such-team"]
+    notices = [call.args[2] for call in notify.await_args_list if call.args[3] == "error"]
+    assert len(notices) == 1 and "no-such-team" in notices[0]
+
+
+@pytest.mark.asyncio
+async def test_timeouts_open_the_circuit(monkeypatch):
+    requests = []
+    async def slow_feed(team, verbose, label, on_tournament=None):
+        requests.append(team)
+        raise LichessTimeoutError(team)
+    monkeypatch.setattr(sync_mod, '_read_team_feed', slow_feed)
+    monkeypatch.setattr(sync_mod.team_health, 'failure_threshold', 2)
+    for _ in range(4):
+        assert await sync_mod.fetch_team_tournaments("slow") is None
+    assert requests == ["slow", "slow"]
+
+
+@pytest.mark.asyncio
+async def test_connection_errors_open_the_circuit(monkeypatch):
+    requests = []
+    async def resetting_feed(team, verbose, label, on_tournament=None):
+        requests.append(team)
+        raise LichessConnectionError(team, ConnectionResetError())
+    monkeypatch.setattr(sync_mod, '_read_team_feed', resetting_feed)
+    monkeypatch.setattr(sync_mod.team_health, 'failure_threshold', 2)
+    for _ in range(4):
+        assert await sync_mod.fetch_team_tournaments("unreachable") is None
+    assert requests == ["unreachable", "unreachable"]
+    assert sync_mod.team_health.broken() == {"unreachable": "2 failures"}
+
+
+@pytest.mark.asyncio
+async def test_shared_fetch_counts_one_failure(monkeypatch):
+    import asyncio
+    release = asyncio.Event()
+    async def slow_feed(team, verbose, label, on_tournament=None):
+        await release.wait()
+        raise LichessTimeoutError(team)
+    monkeypatch.setattr(sync_mod, '_read_team_feed', slow_feed)
+    monkeypatch.setattr(sync_mod.team_health, 'failure_threshold', 2)
+    fetches = [asyncio.create_task(sync_mod.fetch_team_tournaments("shared")) for _ in range(3)]
+    await asyncio.sleep(0)
+    release.set()
+    assert await asyncio.gather(*fetches) == [None, None, None]
+    # Three callers, one request: the circuit stays closed
+    assert sync_mod.team_health.broken() == {}
+
+
+@pytest.mark.asyncio
+async def test_partial_feeds_count_as_failures(monkeypatch):
+    async def cut_feed(team, verbose, label, on_tournament=None):
+        return [], "idle"
+    monkeypatch.setattr(sync_mod, '_read_team_feed', cut_feed)
+    monkeypatch.setattr(sync_mod.team_health, 'failure_threshold', 2)
+    for _ in range(2):
+        assert await sync_mod.fetch_team_tournaments("stalling") == []
+    assert sync_mod.team_health.broken() == {"stalling": "2 failures"}